@@ -0,0 +1,219 @@
+"""
+Stand-in LLM server for benchmarks: replays the scripted replies in
+scenarios.py over the OpenAI chat completions (plain or SSE streaming),
+Anthropic messages and Ollama /api/generate APIs. The scenario is the first
+path segment, e.g. http://127.0.0.1:8700/native_tools/v1/chat/completions.
+
+Stateless: the reply to serve is picked by counting the assistant messages
+after the last user message, i.e. by the agent step making the request.
+
+    python benchmarks/mock_provider.py --port 8700 --latency-ms 300 --tps 40
+"""
+import argparse
+import json
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scenarios import SCENARIOS
+
+
+class MockProvider:
+    def __init__(self, latency_ms=0, tokens_per_second=0, workdir="."):
+        self.latency = latency_ms / 1000
+        self.tokens_per_second = tokens_per_second
+        self.workdir = str(workdir)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def reply(self, scenario, step):
+        replies = SCENARIOS[scenario]
+        reply = replies[min(step, len(replies) - 1)]
+        # Substituted in the serialized form so paths inside JSON strings work too
+        return json.loads(json.dumps(reply).replace("{workdir}", self.workdir))
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+    def tokens(self, text):
+        """Split text into word-sized pieces, the way a model streams them."""
+        return re.findall(r"\s*\S+|\s+", text)
+
+    def generation_time(self, reply):
+        if not self.tokens_per_second:
+            return 0
+        text = reply.get("content") or json.dumps(reply.get("tool_calls"))
+        return len(self.tokens(text)) / self.tokens_per_second
+
+
+def _step(messages):
+    step = 0
+    for message in messages:
+        if message.get("role") == "user":
+            step = 0
+        elif message.get("role") == "assistant":
+            step += 1
+    return step
+
+
+def _usage(reply):
+    completion = len(json.dumps(reply)) // 4
+    return {"prompt_tokens": 500, "completion_tokens": completion, "total_tokens": 500 + completion}
+
+
+def _openai_message(reply):
+    message = {"role": "assistant", "content": reply.get("content")}
+    if reply.get("tool_calls"):
+        message["tool_calls"] = [{
+            "id": f"call_{i}",
+            "type": "function",
+            "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])}
+        } for i, call in enumerate(reply["tool_calls"])]
+    return message
+
+
+def _anthropic_message(reply):
+    content = []
+    if reply.get("content"):
+        content.append({"type": "text", "text": reply["content"]})
+    for i, call in enumerate(reply.get("tool_calls") or []):
+        content.append({"type": "tool_use", "id": f"toolu_{i}", "name": call["name"], "input": call["arguments"]})
+    usage = _usage(reply)
+    return {
+        "id": "msg_mock",
+        "type": "message",
+        "role": "assistant",
+        "content": content,
+        "stop_reason": "tool_use" if reply.get("tool_calls") else "end_turn",
+        "usage": {"input_tokens": usage["prompt_tokens"], "output_tokens": usage["completion_tokens"]}
+    }
+
+
+def _ollama_text(reply):
+    # /api/generate has no native tool calls: send them the way small local models leak them
+    if reply.get("tool_calls"):
+        calls = [{"name": c["name"], "arguments": c["arguments"]} for c in reply["tool_calls"]]
+        return "```json\n" + json.dumps(calls) + "\n```"
+    return reply.get("content") or ""
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "GokuMock/1.0"
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without this, Nagle plus the
+        # client's delayed ACK adds ~40 ms to every non-streamed response
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        mock = self.server.mock
+        mock.count()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        scenario, _, api = self.path.strip("/").partition("/")
+        if scenario not in SCENARIOS:
+            return self._send_json({"error": {"message": f"unknown scenario {scenario!r}"}}, 404)
+
+        if api == "api/generate":
+            prompt = body.get("prompt", "").rsplit("<|im_start|>user", 1)[-1]
+            step = prompt.count("<|im_start|>assistant") - 1
+        else:
+            step = _step(body.get("messages", []))
+        reply = mock.reply(scenario, step)
+        time.sleep(mock.latency)
+
+        if api == "v1/chat/completions" and body.get("stream"):
+            return self._stream_openai(reply)
+        time.sleep(mock.generation_time(reply))
+        if api == "v1/chat/completions":
+            self._send_json({
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": _openai_message(reply),
+                             "finish_reason": "tool_calls" if reply.get("tool_calls") else "stop"}],
+                "usage": _usage(reply)
+            })
+        elif api == "v1/messages":
+            self._send_json(_anthropic_message(reply))
+        elif api == "api/generate":
+            self._send_json({"model": body.get("model"), "response": _ollama_text(reply), "done": True})
+        else:
+            self._send_json({"error": {"message": f"unknown endpoint /{api}"}}, 404)
+
+    def _stream_openai(self, reply):
+        mock = self.server.mock
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        delay = 1 / mock.tokens_per_second if mock.tokens_per_second else 0
+
+        def send(delta, finish=None, usage=None):
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            if usage:
+                chunk["usage"] = usage
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        send({"role": "assistant"})
+        for token in mock.tokens(reply.get("content") or ""):
+            time.sleep(delay)
+            send({"content": token})
+        for i, call in enumerate(_openai_message(reply).get("tool_calls") or []):
+            send({"tool_calls": [{"index": i, "id": call["id"], "type": "function",
+                                  "function": {"name": call["function"]["name"], "arguments": ""}}]})
+            for token in mock.tokens(call["function"]["arguments"]):
+                time.sleep(delay)
+                send({"tool_calls": [{"index": i, "function": {"arguments": token}}]})
+        send({}, "tool_calls" if reply.get("tool_calls") else "stop", _usage(reply))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+
+def serve(mock, host="127.0.0.1", port=0):
+    """Start the server on a daemon thread; returns it (the port is server.server_port)."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.mock = mock
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scripted OpenAI/Anthropic/Ollama-compatible server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay before each response starts")
+    parser.add_argument("--tps", type=float, default=0, help="Generation speed in tokens/s (0: instant)")
+    parser.add_argument("--workdir", default=".", help="Replaces {workdir} in scripted tool arguments")
+    args = parser.parse_args()
+    server = serve(MockProvider(args.latency_ms, args.tps, args.workdir), args.host, args.port)
+    print(f"Mock provider on http://{args.host}:{server.server_port}/<scenario>/ - scenarios: {', '.join(SCENARIOS)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
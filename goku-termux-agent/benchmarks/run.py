@@ -0,0 +1,209 @@
+"""
+Agent-loop benchmark: drives GokuEngine through the scripted scenarios against
+the local mock provider and reports where the time goes that isn't the model.
+
+    python benchmarks/run.py                      # all scenarios and APIs, 20 turns each
+    python benchmarks/run.py -n 50 --scenarios native_tools,leaky_json --apis openai-stream
+    python benchmarks/run.py --latency-ms 400 --tps 50 --json results.json
+
+Columns: turn = wall time of generate_async; provider = HTTP round trip to the
+mock, request building and response decoding included; engine/step = turn
+minus provider and tool time, per agent step (prompt assembly, response
+cleanup, tool-call repair, history); parse and tool = p50 of those spans;
+peak = tracemalloc peak of one turn. Runs against a throwaway HOME, so your
+~/.goku is never touched.
+
+It also measures time-to-prompt (as goku --profile-startup does) and exits with
+status 1 when that is over --startup-budget or a module meant to load on first
+use (startup.DEFERRED) is imported before the prompt. goku has no test suite;
+this run is the startup regression check, so run it before merging changes
+that touch imports:
+
+    python benchmarks/run.py -n 1 --scenarios chat --apis openai   # quick gate
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# Everything under ~/.goku is resolved when goku.config is imported
+_home = tempfile.mkdtemp(prefix="goku-bench-")
+os.environ["HOME"] = _home
+for _var in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "OLLAMA_API_KEY"):
+    os.environ.pop(_var, None)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from goku import config, startup, tracing  # noqa: E402
+from goku.engine import GokuEngine  # noqa: E402
+
+from mock_provider import MockProvider, serve  # noqa: E402
+from scenarios import SCENARIOS, WORKDIR_FILES  # noqa: E402
+
+# API flavour -> (goku provider, endpoint path, stream)
+APIS = {
+    "openai": ("openai", "v1/chat/completions", False),
+    "openai-stream": ("openai", "v1/chat/completions", True),
+    "anthropic": ("anthropic", "v1/messages", False),
+    "ollama": ("ollama", "api/generate", False)
+}
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the goku agent loop against a local mock provider")
+    parser.add_argument("-n", "--iterations", type=int, default=20, help="Timed turns per scenario and API")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenario names")
+    parser.add_argument("--apis", default=",".join(APIS), help="Comma-separated: " + ", ".join(APIS))
+    parser.add_argument("--latency-ms", type=float, default=0, help="Mock delay before each response")
+    parser.add_argument("--tps", type=float, default=0, help="Mock generation speed in tokens/s (0: instant)")
+    parser.add_argument("--startup-budget", type=float, default=config.STARTUP_BUDGET_MS,
+                        help="Time-to-prompt budget in ms (0: skip the startup check)")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    return parser.parse_args()
+
+
+async def _turn(api, scenario):
+    """One fresh conversation; returns (seconds, steps, response, error)."""
+    provider, _, stream = APIS[api]
+    engine = GokuEngine()
+    engine.show_ui = False
+    engine.stream = stream
+    engine.provider = provider
+    steps = []
+    engine.on_event = lambda event: steps.append(1) if event["event"] == "step" else None
+    started = time.perf_counter()
+    response, error = await engine.generate_async(f"Run the {scenario} task.")
+    return time.perf_counter() - started, len(steps), response, error
+
+
+async def _bench(api, scenario, iterations, port):
+    provider, path, _ = APIS[api]
+    config.save_url(f"http://127.0.0.1:{port}/{scenario}/{path}", provider)
+
+    # Untimed warm-up: first-use imports and the HTTP connection
+    _, _, _, error = await _turn(api, scenario)
+    if error:
+        return {"scenario": scenario, "api": api, "error": error}
+
+    tracing.tracer.clear()
+    turns, steps = [], 0
+    for _ in range(iterations):
+        seconds, n, _, error = await _turn(api, scenario)
+        if error:
+            return {"scenario": scenario, "api": api, "error": error}
+        turns.append(seconds * 1000)
+        steps += n
+    totals = tracing.tracer.totals()
+    rows = {(name, key): (p50, p95) for name, key, _, p50, p95, _ in tracing.tracer.summary()}
+
+    def total(name):
+        return sum(ms for (span, _), (_, ms) in totals.items() if span == name)
+
+    def p50(name):
+        values = [p for (span, _), (p, _) in rows.items() if span == name]
+        return max(values) if values else None
+
+    # Memory of one more turn, measured separately since tracemalloc slows everything down
+    tracemalloc.start()
+    await _turn(api, scenario)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "scenario": scenario,
+        "api": api,
+        "turns": iterations,
+        "steps_per_turn": steps / iterations,
+        "turn_p50_ms": statistics.median(turns),
+        "turn_p95_ms": tracing.percentile(turns, 95),
+        "provider_p50_ms": p50("provider"),
+        "ttft_p50_ms": p50("ttft"),
+        "engine_per_step_ms": (sum(turns) - total("provider") - total("tool")) / steps,
+        "parse_p50_ms": p50("parse"),
+        "tool_p50_ms": p50("tool"),
+        "peak_kib": peak / 1024
+    }
+
+
+def _fmt(value, spec=".2f"):
+    return "-" if value is None else format(value, spec)
+
+
+def _print_table(results):
+    header = f"{'scenario':<15}{'api':<15}{'steps':>6}{'turn p50':>10}{'p95':>9}{'provider':>10}" \
+             f"{'ttft':>8}{'engine/step':>13}{'parse':>8}{'tool':>8}{'peak KiB':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        if "error" in r:
+            print(f"{r['scenario']:<15}{r['api']:<15} error: {r['error'][:80]}")
+            continue
+        print(f"{r['scenario']:<15}{r['api']:<15}{r['steps_per_turn']:>6.1f}{_fmt(r['turn_p50_ms']):>10}"
+              f"{_fmt(r['turn_p95_ms']):>9}{_fmt(r['provider_p50_ms']):>10}{_fmt(r['ttft_p50_ms'], '.1f'):>8}"
+              f"{_fmt(r['engine_per_step_ms'], '.3f'):>13}{_fmt(r['parse_p50_ms'], '.3f'):>8}"
+              f"{_fmt(r['tool_p50_ms']):>8}{r['peak_kib']:>10.0f}")
+    print("(times in ms)")
+
+
+async def main():
+    args = _parse_args()
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    apis = [a for a in args.apis.split(",") if a]
+    unknown = [s for s in scenarios if s not in SCENARIOS] + [a for a in apis if a not in APIS]
+    if unknown:
+        print(f"Unknown scenario/API: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    startup_result = None
+    if args.startup_budget:
+        wall_ms, _, _, eager = startup.measure()
+        startup_result = {"time_to_prompt_ms": wall_ms, "budget_ms": args.startup_budget, "eager_imports": eager}
+        print(f"time to prompt {wall_ms:.0f} ms (budget {args.startup_budget:g} ms)"
+              + (f", imported before the prompt: {', '.join(eager)}" if eager else "") + "\n")
+
+    workdir = Path(_home) / "work"
+    workdir.mkdir()
+    for name, text in WORKDIR_FILES.items():
+        (workdir / name).write_text(text)
+    server = serve(MockProvider(args.latency_ms, args.tps, workdir))
+    for provider in ("openai", "anthropic", "ollama"):
+        config.save_token("mock-token", provider)
+
+    results = []
+    try:
+        for scenario in scenarios:
+            for api in apis:
+                results.append(await _bench(api, scenario, args.iterations, server.server_port))
+    finally:
+        server.shutdown()
+
+    _print_table(results)
+    rss_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"max RSS {rss_mib:.0f} MiB, {server.mock.requests} mock requests, "
+          f"latency {args.latency_ms:g} ms, {args.tps:g} tok/s")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "latency_ms": args.latency_ms,
+                "tokens_per_second": args.tps,
+                "max_rss_mib": rss_mib,
+                "startup": startup_result,
+                "results": results
+            }, f, indent=2)
+    startup_failed = startup_result is not None and (
+        startup_result["time_to_prompt_ms"] > args.startup_budget or startup_result["eager_imports"]
+    )
+    return 1 if startup_failed or any("error" in r for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,57 @@
+"""
+Scripted model replies for the mock provider. Each scenario is the list of
+assistant replies for one turn, in order: reply N is served to the request
+made at agent step N. A reply has either `tool_calls` (sent as native tool
+calls) or `content` (sent as text, which may contain leaky JSON/XML tool calls
+the engine has to parse). "{workdir}" is replaced with the benchmark's scratch
+directory.
+"""
+
+LONG_ANSWER = "\n".join(
+    [f"## Section {i}\n\nThe quick brown fox jumps over the lazy dog, paragraph {i}. "
+     "Here is `inline code`, a [link](https://example.com) and **bold** text.\n\n"
+     f"```python\ndef f{i}(x):\n    return x * {i}\n```\n" for i in range(1, 21)]
+)
+
+SCENARIOS = {
+    # Plain answer, no tools: the floor for engine overhead
+    "chat": [
+        {"content": "Hello! I'm Goku. How can I help you today?"}
+    ],
+    # Native tool calls over three steps
+    "native_tools": [
+        {"tool_calls": [{"name": "list_files", "arguments": {"directory": "{workdir}"}}]},
+        {"tool_calls": [{"name": "read_file", "arguments": {"file_path": "{workdir}/notes.md"}}]},
+        {"content": "notes.md lists three tasks; the first one is to benchmark the engine."}
+    ],
+    # Several tool calls in one step
+    "parallel_tools": [
+        {"tool_calls": [
+            {"name": "read_file", "arguments": {"file_path": "{workdir}/notes.md"}},
+            {"name": "read_file", "arguments": {"file_path": "{workdir}/data.json"}},
+            {"name": "search_code", "arguments": {"directory": "{workdir}", "query": "benchmark"}}
+        ]},
+        {"content": "Both files mention the benchmark."}
+    ],
+    # Tool calls leaked into the text as a JSON block, with a <thought> to strip
+    "leaky_json": [
+        {"content": "<thought>I should look at the files first.</thought>Let me check.\n"
+                    "```json\n[{\"name\": \"list_files\", \"arguments\": {\"directory\": \"{workdir}\"}}]\n```"},
+        {"content": "<thought>Found them.</thought>There are two files: notes.md and data.json."}
+    ],
+    # Tool calls leaked as self-closing XML tags
+    "leaky_xml": [
+        {"content": "<read_file file_path=\"{workdir}/notes.md\" />"},
+        {"content": "The notes say: benchmark the engine."}
+    ],
+    # Long markdown answer: stresses streaming and response cleanup
+    "long_answer": [
+        {"content": LONG_ANSWER}
+    ]
+}
+
+# Files created in the scratch directory for the tools to work on
+WORKDIR_FILES = {
+    "notes.md": "# Tasks\n\n1. Benchmark the engine\n2. Profile the parser\n3. Ship it\n",
+    "data.json": "{\"benchmark\": true, \"runs\": 5}\n"
+}
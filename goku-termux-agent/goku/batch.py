@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import config
+from . import ratelimit
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="goku batch",
+        description="Run one independent conversation per line of a JSONL file and write JSONL results."
+    )
+    parser.add_argument("input", help='JSONL file: {"id": ..., "prompt": ..., "provider": ..., "model": ...} or a JSON string per line')
+    parser.add_argument("-o", "--output", help="Results file (default: <input>.results.jsonl); completed ids in it are skipped")
+    parser.add_argument("-c", "--concurrency", type=int, default=config.BATCH_CONCURRENCY, help="Conversations run at once")
+    parser.add_argument("--provider", help="Provider for prompts that don't name one")
+    parser.add_argument("--model", help="Model for prompts that don't name one")
+    parser.add_argument("--mcp", action="store_true", help="Connect MCP servers (shared by all conversations)")
+    return parser.parse_args(argv)
+
+
+def _load_prompts(path):
+    """The prompts in a JSONL file; ValueError naming every line that isn't one."""
+    prompts, errors = [], []
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                errors.append(f"line {n}: invalid JSON ({e})")
+                continue
+            if isinstance(item, str):
+                item = {"prompt": item}
+            if not isinstance(item, dict):
+                errors.append(f"line {n}: expected an object or a string, got {type(item).__name__}")
+                continue
+            if not isinstance(item.get("prompt"), str) or not item["prompt"].strip():
+                errors.append(f"line {n}: missing \"prompt\"")
+                continue
+            item["id"] = str(item.get("id", n))
+            prompts.append(item)
+    if errors:
+        more = f"\n  ... and {len(errors) - 10} more" if len(errors) > 10 else ""
+        raise ValueError("\n  " + "\n  ".join(errors[:10]) + more)
+    return prompts
+
+
+def _completed_ids(path):
+    done = set()
+    if path.exists():
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("ok"):
+                    done.add(str(record.get("id")))
+    return done
+
+
+class ProviderLimits:
+    """Per-provider cap on requests in flight plus a token bucket for the request rate."""
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self._slots = {}
+        self._buckets = {}
+
+    def bucket(self, provider):
+        if provider not in self._buckets:
+            limit = config.get_batch_rate_limit(provider)
+            self._buckets[provider] = ratelimit.TokenBucket(limit["rate"], limit["burst"])
+        return self._buckets[provider]
+
+    @contextlib.asynccontextmanager
+    async def slot(self, provider):
+        if provider not in self._slots:
+            self._slots[provider] = asyncio.Semaphore(self.concurrency)
+        async with self._slots[provider]:
+            await self.bucket(provider).acquire()
+            yield
+
+
+async def _run_one(item, args, limits, shared_mcp):
+    from .engine import GokuEngine
+
+    # Counts for the attempt that produced the result; reset when a 429 starts the conversation over
+    stats = {}
+
+    def on_event(event):
+        if event["event"] == "step":
+            stats["steps"] = event["step"]
+        elif event["event"] == "response":
+            stats["provider_calls"] += 1
+            for key, value in (event.get("usage") or {}).items():
+                if isinstance(value, (int, float)):
+                    stats["usage"][key] = stats["usage"].get(key, 0) + value
+        elif event["event"] == "tool_call":
+            stats["tool_calls"] += 1
+
+    provider = item.get("provider") or args.provider or config.get_active_provider()
+    record = {"id": item["id"], "provider": provider}
+    started = time.monotonic()
+    for attempt in range(config.BATCH_MAX_RETRIES + 1):
+        stats.update(steps=0, provider_calls=0, tool_calls=0, usage={})
+        engine = GokuEngine()
+        engine.show_ui = False
+        engine.on_event = on_event
+        engine.limiter = limits.slot
+        engine.provider = provider
+        engine.model = item.get("model") or args.model
+        if item.get("mode") == "offline":
+            engine.set_mode("offline")
+        # The batch's MCP servers, or none: not a daemon proxy of its own
+        engine.mcp_supervisor = shared_mcp
+
+        try:
+            response, error = await engine.generate_async(item["prompt"])
+        finally:
+            # The shared supervisor and web search client are closed once, by main
+            engine.mcp_supervisor = None
+            await engine.close(release_shared=False)
+        if error and ("429" in error or "rate limit" in error.lower()) and attempt < config.BATCH_MAX_RETRIES:
+            # Slow every conversation on this provider down, then start this one over
+            delay = ratelimit.backoff_delay(attempt, base=2.0, cap=60.0)
+            limits.bucket(provider).penalize(delay)
+            await asyncio.sleep(delay)
+            continue
+        break
+
+    record["model"] = engine.model or config.PROVIDERS.get(provider, {}).get("model")
+    record["ok"] = error is None
+    if error:
+        record["error"] = error
+    else:
+        record["response"] = response
+    record["latency_ms"] = round((time.monotonic() - started) * 1000)
+    record["attempts"] = attempt + 1
+    record.update(stats)
+    return record
+
+
+async def main(argv):
+    """`goku batch prompts.jsonl`: run many conversations concurrently. Returns the exit code."""
+    args = _parse_args(argv)
+    try:
+        prompts = _load_prompts(args.input)
+    except (OSError, ValueError) as e:
+        print(f"goku batch: cannot read {args.input}: {e}", file=sys.stderr)
+        return 2
+
+    output = Path(args.output or f"{args.input}.results.jsonl")
+    done = _completed_ids(output)
+    pending = [p for p in prompts if p["id"] not in done]
+    if done:
+        print(f"Resuming: {len(prompts) - len(pending)} of {len(prompts)} already completed", file=sys.stderr)
+    if not pending:
+        return 0
+
+    concurrency = max(1, args.concurrency)
+    # Provider calls and blocking tools run in the loop's default executor; size it to the batch
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency + 4))
+
+    from .engine import GokuEngine
+    # Owns what all conversations share (MCP servers, the web search client) and closes it
+    owner = GokuEngine()
+    shared_mcp = None
+    if args.mcp:
+        await owner.initialize_mcp()
+        shared_mcp = owner.mcp_supervisor
+
+    limits = ProviderLimits(config.BATCH_PROVIDER_CONCURRENCY)
+    queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+
+    results = []
+    started = time.monotonic()
+
+    async def worker(out):
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            record = await _run_one(item, args, limits, shared_mcp)
+            # One line per conversation, flushed at once so an interrupted run can resume
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            results.append(record)
+            status = "ok" if record["ok"] else f"error: {record['error'][:80]}"
+            print(f"[{len(results)}/{len(pending)}] {record['id']} {record['latency_ms']} ms {status}", file=sys.stderr)
+
+    try:
+        with open(output, "a") as out:
+            await asyncio.gather(*(worker(out) for _ in range(min(concurrency, len(pending)))))
+    finally:
+        await owner.close()
+
+    elapsed = time.monotonic() - started
+    ok = [r for r in results if r["ok"]]
+    latencies = sorted(r["latency_ms"] for r in ok)
+    tokens = sum(r["usage"].get("total_tokens", 0) for r in results)
+    summary = f"{len(ok)}/{len(results)} succeeded in {elapsed:.1f}s"
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        summary += f", latency p50 {statistics.median(latencies):.0f} ms / p95 {p95} ms"
+    if tokens:
+        summary += f", {tokens} tokens"
+    print(f"{summary}. Results: {output}", file=sys.stderr)
+    return 0 if len(ok) == len(results) else 1
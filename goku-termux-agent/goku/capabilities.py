@@ -0,0 +1,209 @@
+import asyncio
+import re
+import time
+
+from . import config
+from . import jsonfile
+
+# What each (provider, model) accepts, kept in ~/.goku/capabilities.json:
+#   {"openai/gpt-4o": {"url": ..., "checked": ..., "native_tools": true, "parallel_tools": true,
+#                      "streaming": true, "system_role": true, "context_length": 128000}}
+# None means unknown. Learned by probe() (a few tiny requests) and from requests
+# the provider rejected, so each model pays for a rejected payload at most once.
+
+KEYS = ("native_tools", "parallel_tools", "streaming", "system_role", "context_length")
+
+# Tool used by the probe
+_PING_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "ping",
+        "description": "Answers pong. Call it once for every number you are given.",
+        "parameters": {"type": "object", "properties": {"n": {"type": "integer"}}, "required": ["n"]}
+    }
+}
+
+# "maximum context length is 8192 tokens" (OpenAI, vLLM), "max_new_tokens must be <= 8192" (TGI)...
+_CONTEXT_ERROR = re.compile(r"(?:context length|context window|context_length|must be <=)\D{0,40}?(\d{3,8})", re.IGNORECASE)
+
+# "model does not support tools", "tool_choice is not supported", "Unrecognized request argument supplied: tools"
+_TOOLS_UNSUPPORTED = re.compile(
+    r"(?:does not|doesn't|do not|don't|cannot|can't) (?:support|accept|use) (?:\w+ ){0,3}(?:tools?|tool_choice|function)|"
+    r"\b(?:tools?|tool_choice|tool choice|tool use|tool calls?|tool calling|function calls?|function calling|functions)\b"
+    r"(?: \w+){0,2}(?: is| are)? (?:not supported|unsupported|not enabled|not available|not allowed)|"
+    r"tool choice requires|(?:unrecognized|unknown|unexpected|extra) (?:request )?(?:argument|parameter|field|input)s?"
+    r"(?: supplied| are not permitted| not permitted)?\W+(?:tools|tool_choice)\b",
+    re.IGNORECASE
+)
+# "Invalid schema for function 'x'", "Invalid 'tools[3].function.name'": one tool's problem, not the model's
+_TOOL_SCHEMA_ERROR = re.compile(r"schema|tools\[\d+\]|function ['\"`]\w+|parameters", re.IGNORECASE)
+
+_probing = {}
+
+
+class ProbeError(Exception):
+    """The probe could not tell (auth, rate limit, network); nothing was cached."""
+
+
+def _key(provider, model):
+    return f"{provider}/{model}"
+
+
+def _static(provider):
+    """Capabilities fixed by the request format goku uses for the provider."""
+    url = config.PROVIDERS.get(provider, {}).get("url", "")
+    if provider == "anthropic":
+        # Messages API with native tools; goku doesn't stream it
+        return {"native_tools": True, "parallel_tools": True, "streaming": False, "system_role": True}
+    if "api/generate" in url:
+        # Raw completion: tools can only be described in the prompt
+        return {"native_tools": False, "parallel_tools": False, "streaming": False, "system_role": True}
+    return None
+
+
+def get(provider, model):
+    """Known capabilities of a model ({key: value or None}), static ones included."""
+    caps = dict.fromkeys(KEYS)
+    entry = jsonfile.read(config.CAPABILITIES_FILE).get(_key(provider, model))
+    url = config.PROVIDERS.get(provider, {}).get("url")
+    if entry and entry.get("url") == url and time.time() - entry.get("checked", 0) < config.CAPABILITIES_TTL:
+        caps.update({k: entry.get(k) for k in KEYS})
+    caps.update(_static(provider) or {})
+    return caps
+
+
+def is_known(provider, model):
+    return _static(provider) is not None or get(provider, model)["native_tools"] is not None
+
+
+def update(provider, model, **values):
+    key = _key(provider, model)
+    url = config.PROVIDERS.get(provider, {}).get("url")
+    entry = dict(jsonfile.read(config.CAPABILITIES_FILE).get(key) or {})
+    if entry.get("url") != url:
+        entry = {}
+    entry.update({k: v for k, v in values.items() if k in KEYS and v is not None})
+    entry.update(url=url, checked=time.time())
+    jsonfile.update(config.CAPABILITIES_FILE, key, entry)
+
+
+def learn_from_error(provider, model, payload, status, message, save=True):
+    """
+    Record what a rejected request (HTTP 400/404/422) says the model can't
+    do (unless save is false). Returns the values to resend the request
+    with: without what was rejected (or trimmed to the learned context
+    length). A rejected tool schema is one tool's problem, not the model's:
+    that request is resent with text tools, and nothing is cached.
+    """
+    if status not in (400, 404, 422):
+        return {}
+    text = (message or "").lower()
+    learned = {}
+    match = _CONTEXT_ERROR.search(text)
+    if match and any(word in text for word in ("maximum", "exceed", "too long", "must be")):
+        learned["context_length"] = int(match.group(1))
+    elif payload.get("tools") and _TOOL_SCHEMA_ERROR.search(text) and ("tool" in text or "function" in text):
+        return {"native_tools": False}
+    elif payload.get("tools") and _TOOLS_UNSUPPORTED.search(text):
+        learned["native_tools"] = False
+    elif payload.get("stream") and "stream" in text:
+        learned["streaming"] = False
+    elif "system" in text and any(m.get("role") == "system" for m in payload.get("messages") or []):
+        learned["system_role"] = False
+    if learned and save:
+        update(provider, model, **learned)
+    return learned
+
+
+def _post(provider, payload):
+    from .engine import http_session
+    headers = {"Content-Type": "application/json"}
+    token = config.get_token(provider)
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    try:
+        response = http_session().post(config.PROVIDERS[provider]["url"], headers=headers, json=payload,
+                                       timeout=30, stream=bool(payload.get("stream")))
+    except Exception as e:
+        raise ProbeError(str(e))
+    if response.status_code in (400, 404, 422):
+        return response, False
+    if not response.ok:
+        raise ProbeError(f"HTTP {response.status_code}: {response.text[:200]}")
+    return response, True
+
+
+def probe(provider, model):
+    """
+    Find out what an OpenAI-compatible model accepts with three small requests
+    (system role, native/parallel tool calls, streaming) and cache it.
+    Returns the capabilities; raises ProbeError if the provider couldn't be asked.
+    """
+    if _static(provider) is not None:
+        return get(provider, model)
+    from . import catalog
+    found = {"context_length": catalog.model_info(provider, model)["context_length"]}
+    # Room for thinking models (qwen3, deepseek-r1, o-series) to reason before they answer or call
+    base = {"model": model, "max_tokens": 512}
+
+    _, found["system_role"] = _post(provider, {**base, "messages": [
+        {"role": "system", "content": "Reply with the single word OK."},
+        {"role": "user", "content": "Ready?"}
+    ]})
+    if not found["system_role"]:
+        _, accepted = _post(provider, {**base, "messages": [{"role": "user", "content": "Reply with the single word OK."}]})
+        if not accepted:
+            raise ProbeError(f"{provider} rejects even a plain request for {model}")
+
+    payload = {**base, "tools": [_PING_TOOL], "tool_choice": "auto", "messages": [
+        {"role": "user", "content": "Call the ping tool twice in parallel, with n=1 and with n=2."}
+    ]}
+    response, accepted = _post(provider, payload)
+    calls = []
+    if accepted:
+        try:
+            calls = response.json()["choices"][0]["message"].get("tool_calls") or []
+        except (ValueError, KeyError, IndexError, TypeError):
+            pass
+        # Taking the schemas is what counts: a model that didn't call within
+        # max_tokens may still have been reasoning
+        found["native_tools"] = True
+    else:
+        # No native tools only if the rejection says so; otherwise left unknown
+        learned = learn_from_error(provider, model, payload, response.status_code, response.text, save=False)
+        found["native_tools"] = learned.get("native_tools")
+    found["parallel_tools"] = len(calls) > 1 if calls else None
+
+    response, accepted = _post(provider, {**base, "stream": True, "messages": [{"role": "user", "content": "Say OK."}]})
+    streamed = False
+    if accepted:
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("data:"):
+                streamed = True
+                break
+        response.close()
+    found["streaming"] = streamed
+
+    update(provider, model, **found)
+    return get(provider, model)
+
+
+async def probe_async(provider, model, force=False):
+    """Probe in a worker thread unless already known (or being probed). Returns the capabilities."""
+    if not force and is_known(provider, model):
+        return get(provider, model)
+    key = _key(provider, model)
+    task = _probing.get(key)
+    if task is None or task.done():
+        task = _probing[key] = asyncio.ensure_future(asyncio.to_thread(probe, provider, model))
+    return await asyncio.shield(task)
+
+
+def describe(caps):
+    """One line for /probe."""
+    def flag(value):
+        return "?" if value is None else "yes" if value else "no"
+    context = caps.get("context_length")
+    return (f"native tools {flag(caps['native_tools'])} · parallel {flag(caps['parallel_tools'])} · "
+            f"streaming {flag(caps['streaming'])} · system role {flag(caps['system_role'])} · "
+            f"context {f'{context // 1000}k' if context else '?'}")
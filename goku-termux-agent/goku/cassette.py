@@ -0,0 +1,351 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import sys
+import threading
+import time
+from datetime import datetime
+
+# A cassette is a JSON-lines file (gzipped when the name ends in .gz) holding
+# everything a session got from the outside world, in order:
+#   {"cassette": 1, "created": ...}                                   header
+#   {"kind": "provider", "status": 200, "body": "...", "caps": {...}} one provider request
+#                                                                     (and the model capabilities it was built with)
+#   {"kind": "provider", "status": 200, "chunks": [[ms, line], ...]}  ... or a streamed one
+#   {"kind": "tool", "name": ..., "args": {...}, "output": "..."}     one tool / MCP call
+#   {"kind": "turn", "prompt": ..., "response": ..., ...}             one user prompt
+# Request headers (API keys) are never written; requests are kept as a hash only.
+
+VERSION = 1
+
+
+class CassetteError(Exception):
+    """The session asked for something the cassette doesn't have."""
+
+
+class RecordedError(Exception):
+    """A connection error replayed from the cassette."""
+
+
+def _open(path, mode):
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def request_hash(payload):
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _sleep_until(deadline):
+    delay = deadline - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+
+class Cassette:
+    def __init__(self, path, replaying, speed=1.0):
+        self.path = path
+        self.replaying = replaying
+        self.speed = speed
+        self.mismatches = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_mcp_tools = []
+        self.entries = {"provider": [], "tool": [], "turn": []}
+        self._next_provider = 0
+        self._used_tools = set()
+
+    @classmethod
+    def record(cls, path):
+        cassette = cls(path, replaying=False)
+        cassette._file = _open(path, "w")
+        cassette._write({"cassette": VERSION, "created": datetime.now().isoformat(timespec="seconds")})
+        return cassette
+
+    @classmethod
+    def replay(cls, path, speed=1.0):
+        """Load a recording; speed 2 plays it twice as fast, 0 without any waiting."""
+        cassette = cls(path, replaying=True, speed=speed)
+        with _open(path, "r") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        if not lines or lines[0].get("cassette") != VERSION:
+            raise CassetteError(f"{path} is not a goku cassette (version {VERSION})")
+        for entry in lines[1:]:
+            cassette.entries.setdefault(entry.get("kind"), []).append(entry)
+        return cassette
+
+    def _write(self, entry):
+        with self._lock:
+            if self._file:
+                # One line per exchange, flushed: a session that crashes or hangs is still captured
+                self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+                self._file.flush()
+
+    def _wait(self, started, ms):
+        if self.speed:
+            _sleep_until(started + ms / 1000 / self.speed)
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    # Provider traffic
+
+    def post(self, session, url, headers, payload, timeout, caps=None):
+        """
+        Stand-in for session.post(...) in the engine: records or replays the
+        exchange. caps: the model capabilities the payload was built with.
+        """
+        stream = bool(payload.get("stream"))
+        entry = {"kind": "provider", "url": url, "model": payload.get("model"), "stream": stream,
+                 "request": request_hash(payload)}
+        if caps is not None:
+            entry["caps"] = caps
+        if self.replaying:
+            return self._replay_post(entry)
+
+        started = time.monotonic()
+        try:
+            response = session.post(url, headers=headers, json=payload, timeout=timeout, stream=stream)
+        except Exception as e:
+            entry.update(error=str(e), elapsed_ms=round((time.monotonic() - started) * 1000, 1))
+            self._write(entry)
+            raise
+        entry.update(status=response.status_code, reason=response.reason,
+                     headers_ms=round((time.monotonic() - started) * 1000, 1))
+        if stream and response.ok:
+            return _RecordingStream(self, entry, response, started)
+        entry["body"] = response.text
+        entry["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+        self._write(entry)
+        return response
+
+    def recorded_capabilities(self):
+        """
+        The capabilities the next provider request was recorded with, so replay
+        builds the same payload whatever ~/.goku/capabilities.json says now;
+        None if the cassette doesn't have them.
+        """
+        with self._lock:
+            recorded = self.entries["provider"]
+            if self._next_provider < len(recorded):
+                return recorded[self._next_provider].get("caps")
+        return None
+
+    def _replay_post(self, request):
+        started = time.monotonic()
+        with self._lock:
+            recorded = self.entries["provider"]
+            if self._next_provider >= len(recorded):
+                raise CassetteError(f"no recorded response left for provider request #{self._next_provider + 1}")
+            entry = recorded[self._next_provider]
+            self._next_provider += 1
+            if entry.get("request") != request["request"]:
+                # Same position in the session, different prompt/tools: served anyway, but counted
+                self.mismatches += 1
+        if "error" in entry:
+            self._wait(started, entry["elapsed_ms"])
+            raise RecordedError(entry["error"])
+        if "chunks" in entry:
+            self._wait(started, entry["headers_ms"])
+        else:
+            self._wait(started, entry["elapsed_ms"])
+        return _ReplayResponse(self, entry, started)
+
+    # Tool and MCP results
+
+    def record_tool(self, name, args, output, duration_ms):
+        self._write({"kind": "tool", "name": name, "args": args,
+                     "output": output if isinstance(output, str) else str(output),
+                     "duration_ms": round(duration_ms, 1)})
+
+    async def replay_tool(self, name, args):
+        """The recorded output for this call: same name and arguments first, else the next one by name."""
+        started = time.monotonic()
+        with self._lock:
+            candidates = [(i, e) for i, e in enumerate(self.entries["tool"])
+                          if i not in self._used_tools and e["name"] == name]
+            match = next(((i, e) for i, e in candidates if e["args"] == args), None)
+            if match is None and candidates:
+                match = candidates[0]
+                self.mismatches += 1
+            if match is None:
+                raise CassetteError(f"no recorded result for tool {name}")
+            self._used_tools.add(match[0])
+        entry = match[1]
+        if self.speed:
+            await asyncio.sleep(max(0, started + entry.get("duration_ms", 0) / 1000 / self.speed - time.monotonic()))
+        return entry["output"]
+
+    # Turns
+
+    def record_turn(self, prompt, response, error, duration_ms, mcp_tools=None, **settings):
+        """settings: mode, provider, model and stream in effect for the turn."""
+        entry = {"kind": "turn", "prompt": prompt, "response": response, "error": error,
+                 "duration_ms": round(duration_ms, 1), **settings}
+        # MCP tool schemas are part of every request; stored when they change so replay can offer the same ones
+        mcp_tools = mcp_tools or []
+        if mcp_tools != self._last_mcp_tools:
+            entry["mcp_tools"] = mcp_tools
+            self._last_mcp_tools = mcp_tools
+        self._write(entry)
+
+    @property
+    def unused(self):
+        """Recorded provider and tool exchanges the replay never asked for."""
+        return (len(self.entries["provider"]) - self._next_provider) + (len(self.entries["tool"]) - len(self._used_tools))
+
+
+class _RecordingStream:
+    """Wraps a streamed requests.Response, noting when each line arrived."""
+    def __init__(self, cassette, entry, response, started):
+        self._cassette = cassette
+        self._entry = entry
+        self._response = response
+        self._started = started
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __setattr__(self, name, value):
+        # e.g. the engine setting .encoding before reading the stream
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._response, name, value)
+
+    def iter_lines(self, **kwargs):
+        chunks = []
+        try:
+            for line in self._response.iter_lines(**kwargs):
+                if line:
+                    text = line.decode("utf-8") if isinstance(line, bytes) else line
+                    chunks.append([round((time.monotonic() - self._started) * 1000, 1), text])
+                yield line
+        finally:
+            self._entry["chunks"] = chunks
+            self._entry["elapsed_ms"] = round((time.monotonic() - self._started) * 1000, 1)
+            self._cassette._write(self._entry)
+
+
+class _ReplayResponse:
+    """Quacks like the parts of requests.Response the engine uses."""
+    def __init__(self, cassette, entry, started):
+        self._cassette = cassette
+        self._entry = entry
+        self._started = started
+        self.url = entry["url"]
+        self.status_code = entry["status"]
+        self.reason = entry.get("reason") or ""
+        self.text = entry.get("body", "")
+        self.encoding = "utf-8"
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if not self.ok:
+            import requests
+            side = "Client" if self.status_code < 500 else "Server"
+            raise requests.HTTPError(f"{self.status_code} {side} Error: {self.reason} for url: {self.url}", response=self)
+
+    def iter_lines(self, chunk_size=None, decode_unicode=False):
+        for offset_ms, line in self._entry.get("chunks") or []:
+            self._cassette._wait(self._started, offset_ms)
+            yield line if decode_unicode else line.encode("utf-8")
+
+
+class _ReplayMCP:
+    """Offers the recorded MCP tool schemas; the calls themselves come from the cassette."""
+    def __init__(self):
+        self.tools = []
+        self.clients = {}
+
+    async def close(self):
+        pass
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="goku replay",
+        description="Re-run a recorded session (goku --record FILE) against its recorded provider and tool traffic."
+    )
+    parser.add_argument("cassette", help="File written by --record")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed: 1 as recorded, 10 ten times faster, 0 no waiting")
+    parser.add_argument("--json", action="store_true", help="Print one JSON line per turn and a summary line")
+    return parser.parse_args(argv)
+
+
+async def main(argv):
+    """`goku replay FILE`: replay a cassette and compare the answers. Returns the exit code."""
+    args = _parse_args(argv)
+    try:
+        cassette = Cassette.replay(args.cassette, speed=args.speed)
+    except (OSError, ValueError, CassetteError) as e:
+        print(f"goku replay: cannot read {args.cassette}: {e}", file=sys.stderr)
+        return 2
+    turns = cassette.entries["turn"]
+    if not turns:
+        print(f"goku replay: {args.cassette} has no recorded turns", file=sys.stderr)
+        return 2
+
+    from .engine import GokuEngine
+    engine = GokuEngine()
+    engine.show_ui = False
+    engine.cassette = cassette
+    engine.mcp_supervisor = mcp = _ReplayMCP()
+
+    changed = 0
+    replay_ms = recorded_ms = 0
+    for n, turn in enumerate(turns, 1):
+        if "mcp_tools" in turn:
+            mcp.tools = turn["mcp_tools"]
+        if turn.get("mode") == "offline":
+            result = {"turn": n, "skipped": "offline turns are not recorded"}
+        else:
+            engine.set_mode("online")
+            engine.provider, engine.model, engine.stream = turn.get("provider"), turn.get("model"), turn.get("stream", False)
+            started = time.monotonic()
+            response, error = await engine.generate_async(turn["prompt"])
+            elapsed = (time.monotonic() - started) * 1000
+            same = response == turn["response"] and error == turn["error"]
+            changed += not same
+            replay_ms += elapsed
+            recorded_ms += turn["duration_ms"]
+            result = {"turn": n, "ms": round(elapsed, 1), "recorded_ms": turn["duration_ms"], "same": same}
+            if not same:
+                result.update(response=response, error=error, recorded_response=turn["response"], recorded_error=turn["error"])
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        elif "skipped" in result:
+            print(f"turn {n}: skipped ({result['skipped']})")
+        else:
+            status = "same answer" if result["same"] else "CHANGED"
+            print(f"turn {n}: {result['ms']:.0f} ms (recorded {result['recorded_ms']:.0f} ms) {status}")
+            if not result["same"]:
+                print(f"  recorded: {str(turn['error'] or turn['response'])[:200]!r}")
+                print(f"  replayed: {str(error or response)[:200]!r}")
+    await engine.close()
+
+    summary = {"turns": len(turns), "changed": changed, "replay_ms": round(replay_ms, 1),
+               "recorded_ms": round(recorded_ms, 1), "request_mismatches": cassette.mismatches,
+               "unused": cassette.unused}
+    if args.json:
+        print(json.dumps({"summary": summary}))
+    else:
+        line = f"{len(turns) - changed}/{len(turns)} turns gave the same answer; {replay_ms:.0f} ms replayed, {recorded_ms:.0f} ms recorded"
+        if cassette.mismatches:
+            line += f"; {cassette.mismatches} requests differed from the recording"
+        if cassette.unused:
+            line += f"; {cassette.unused} recorded exchanges unused"
+        print(line)
+    return 0 if not changed else 1
@@ -0,0 +1,162 @@
+import asyncio
+import time
+
+from . import config
+from . import jsonfile
+
+# Model lists per provider, kept in ~/.goku/models.json:
+#   {"openai": {"fetched": 1700000000.0, "url": "...", "models": [{"id": ..., "context_length": ..., "tools": ...}]}}
+# context_length and tools are None when neither the provider nor MODEL_CONTEXT_HINTS says.
+
+# Anthropic has no public model list endpoint
+ANTHROPIC_MODELS = [
+    "claude-3-5-sonnet-20240620", "claude-3-opus-20240229", "claude-3-sonnet-20240229", "claude-3-haiku-20240307"
+]
+
+_refreshing = {}
+
+
+class CatalogError(Exception):
+    pass
+
+
+def _models_url(provider):
+    url = config.PROVIDERS[provider]["url"]
+    if provider == "ollama":
+        # Native /api/tags lists more than the OpenAI-compatible endpoint
+        if "api/generate" in url:
+            return f"{url.split('/api/generate')[0]}/api/tags"
+        if "v1" in url:
+            return f"{url.split('/v1')[0]}/api/tags"
+        return f"{url.rsplit('/', 1)[0]}/tags"
+    return f"{url.rsplit('/', 2)[0]}/models"  # remove /chat/completions
+
+
+def context_hint(model):
+    name = (model or "").rsplit("/", 1)[-1].lower()
+    for prefix in sorted(config.MODEL_CONTEXT_HINTS, key=len, reverse=True):
+        if name.startswith(prefix):
+            return config.MODEL_CONTEXT_HINTS[prefix]
+    return None
+
+
+def _first_int(item, keys):
+    for key in keys:
+        if isinstance(item.get(key), int) and item[key] > 0:
+            return item[key]
+    return None
+
+
+def _model_info(item):
+    """Metadata from one entry of an OpenAI-style, OpenRouter, Hugging Face router or Ollama list."""
+    model_id = item.get("id") or item.get("name") or item.get("model")
+    context_keys = ("context_length", "context_window", "max_context_length", "max_model_len", "input_token_limit")
+    context = _first_int(item, context_keys) or _first_int(item.get("top_provider") or {}, context_keys)
+    tools = item.get("supports_tools")
+    if isinstance(item.get("supported_parameters"), list):
+        tools = "tools" in item["supported_parameters"]
+    if isinstance(item.get("capabilities"), list):
+        tools = "tools" in item["capabilities"]
+    # The Hugging Face router lists the serving providers of each model
+    providers = [p for p in item.get("providers") or [] if isinstance(p, dict)]
+    if providers:
+        contexts = [c for c in (_first_int(p, context_keys) for p in providers) if c]
+        context = context or (max(contexts) if contexts else None)
+        if tools is None and any("supports_tools" in p for p in providers):
+            tools = any(p.get("supports_tools") for p in providers)
+    return {"id": model_id, "context_length": context or context_hint(model_id), "tools": tools}
+
+
+def fetch(provider):
+    """Ask the provider for its models (blocking). Raises CatalogError."""
+    if provider == "anthropic":
+        return [{"id": m, "context_length": 200000, "tools": True} for m in ANTHROPIC_MODELS]
+
+    from .engine import http_session
+    headers = {"Content-Type": "application/json"}
+    token = config.get_token(provider)
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    try:
+        response = http_session().get(_models_url(provider), headers=headers, timeout=10)
+    except Exception as e:
+        raise CatalogError(f"Error fetching models: {e}")
+    if response.status_code == 401:
+        raise CatalogError(f"Error: Unauthorized (401). Please check your API key for {provider}.")
+    if response.status_code == 404:
+        raise CatalogError(f"Error: Models endpoint not found (404). The provider {provider} may not support listing models at this URL.")
+    try:
+        response.raise_for_status()
+        data = response.json()
+    except Exception as e:
+        raise CatalogError(f"Error fetching models: {e}")
+
+    # OpenAI format: {"data": [...]}; Ollama tags: {"models": [...]}
+    items = data.get("data") if isinstance(data.get("data"), list) else data.get("models")
+    models = [_model_info(item) for item in items or [] if isinstance(item, dict)]
+    return sorted((m for m in models if m["id"]), key=lambda m: m["id"])
+
+
+def refresh(provider):
+    """Fetch and store one provider's models; returns them."""
+    models = fetch(provider)
+    jsonfile.update(config.MODEL_CATALOG_FILE, provider,
+                    {"fetched": time.time(), "url": config.PROVIDERS[provider]["url"], "models": models})
+    return models
+
+
+def cached(provider):
+    """The stored entry for provider (possibly stale), or None."""
+    return jsonfile.read(config.MODEL_CATALOG_FILE).get(provider)
+
+
+def is_stale(provider, entry=None):
+    entry = entry if entry is not None else cached(provider)
+    if not entry:
+        return True
+    # A different endpoint (/url) has a different model list
+    return time.time() - entry.get("fetched", 0) > config.MODEL_CATALOG_TTL or entry.get("url") != config.PROVIDERS[provider]["url"]
+
+
+def models(provider):
+    """Model ids in /models order, from the cache."""
+    return [m["id"] for m in (cached(provider) or {}).get("models", [])]
+
+
+def model_info(provider, model):
+    """{"id", "context_length", "tools"} for a model, from the cache or the built-in hints."""
+    for m in (cached(provider) or {}).get("models", []):
+        if m["id"] == model:
+            return m
+    return {"id": model, "context_length": context_hint(model), "tools": None}
+
+
+def configured_providers():
+    """Providers worth keeping a list for: those with an API key, and the active one."""
+    active = config.get_active_provider()
+    return [p for p in config.PROVIDERS if p == active or config.get_token(p)]
+
+
+async def refresh_async(providers=None, force=False):
+    """
+    Refresh the stale (or, with force, all) providers' lists concurrently.
+    Returns {provider: error message} for the ones that failed; a failed
+    refresh leaves the old list in place.
+    """
+    providers = [p for p in (providers or configured_providers()) if force or is_stale(p)]
+    tasks = {}
+    for provider in providers:
+        # A refresh already running (e.g. the idle-time one) is joined rather than repeated
+        task = _refreshing.get(provider)
+        if task is None or task.done():
+            task = _refreshing[provider] = asyncio.ensure_future(asyncio.to_thread(refresh, provider))
+        tasks[provider] = task
+    errors = {}
+    for provider, task in tasks.items():
+        try:
+            await asyncio.shield(task)
+        except CatalogError as e:
+            errors[provider] = str(e)
+        except Exception as e:
+            errors[provider] = f"Error fetching models: {e}"
+    return errors
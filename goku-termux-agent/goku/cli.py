@@ -4,20 +4,97 @@ from .engine import GokuEngine
 from . import ui
 from . import config
 import asyncio
-from rich.columns import Columns
-from rich.table import Table
+import time
+
+async def _idle_refresh(engine):
+    """While the user types: refresh stale model lists, then probe the active model if it is new."""
+    from . import catalog
+    await engine.wait_ready()
+    await catalog.refresh_async()
+    await _probe_active_model()
+
+async def _probe_active_model():
+    from . import capabilities
+    if not config.CAPABILITY_PROBE:
+        return
+    provider = config.get_active_provider()
+    try:
+        await capabilities.probe_async(provider, config.PROVIDERS[provider]["model"])
+    except Exception:
+        # No key yet, offline, rate limited...: requests will learn from rejections instead
+        pass
+
+def _model_tags(model):
+    """' [dim]128k · tools[/dim]' for a /models entry, from its catalog metadata."""
+    tags = []
+    if model.get("context_length"):
+        tags.append(f"{model['context_length'] // 1000}k")
+    if model.get("tools"):
+        tags.append("tools")
+    return f" [dim]{' · '.join(tags)}[/dim]" if tags else ""
+
+def _option_value(flag):
+    """The argument after flag (e.g. --record FILE); exits with a usage error if there is none."""
+    i = sys.argv.index(flag)
+    if i + 1 >= len(sys.argv) or sys.argv[i + 1].startswith("-"):
+        print(f"goku: {flag} needs a value", file=sys.stderr)
+        sys.exit(2)
+    return sys.argv[i + 1]
 
 async def main():
-    engine = GokuEngine()
-    
     # Check if we are in setup mode
     if len(sys.argv) > 1 and sys.argv[1] == "setup":
         os.system("bash ~/.goku/scripts/setup_offline.sh")
         return
 
-    # Initialize MCP
-    ui.console.print("[dim]Initializing tools...[/dim]")
-    await engine.initialize_mcp()
+    # Run the shared MCP daemon in the foreground
+    if len(sys.argv) > 1 and sys.argv[1] == "mcp-daemon":
+        from . import mcp_daemon
+        await asyncio.to_thread(mcp_daemon.main)
+        return
+
+    # Many independent conversations from a JSONL file: goku batch prompts.jsonl -c N
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from . import batch
+        sys.exit(await batch.main(sys.argv[2:]))
+
+    # One-shot mode for scripts: goku ask "..." / echo "..." | goku -
+    if len(sys.argv) > 1 and sys.argv[1] in ("ask", "-"):
+        from . import oneshot
+        sys.exit(await oneshot.main(sys.argv[2:] if sys.argv[1] == "ask" else sys.argv[1:]))
+
+    # Re-run a recorded session against its recorded traffic: goku replay FILE [--speed X]
+    if len(sys.argv) > 1 and sys.argv[1] == "replay":
+        from . import cassette
+        sys.exit(await cassette.main(sys.argv[2:]))
+
+    # Measure time-to-prompt: goku --profile-startup [--budget MS]
+    if "--profile-startup" in sys.argv:
+        from . import startup
+        budget = None
+        if "--budget" in sys.argv:
+            try:
+                budget = float(_option_value("--budget"))
+            except ValueError:
+                print("goku: --budget needs a number of milliseconds", file=sys.stderr)
+                sys.exit(2)
+        sys.exit(startup.profile(budget))
+
+    engine = GokuEngine()
+    engine.routing = config.use_routing()
+
+    # Capture provider and tool traffic for `goku replay`: goku --record FILE
+    if "--record" in sys.argv:
+        from . import cassette
+        path = _option_value("--record")
+        try:
+            engine.cassette = cassette.Cassette.record(path)
+        except OSError as e:
+            print(f"goku: cannot write {path}: {e}", file=sys.stderr)
+            sys.exit(2)
+
+    # Connect MCP servers while the user types; the first request waits for them
+    engine.start_background_init()
 
     ui.print_welcome()
 
@@ -80,8 +157,10 @@ async def main():
 
     ui.print_status(engine.mode)
 
+    # Refresh stale model lists and probe a new model while the user types, once startup work is done
+    idle_refresh = asyncio.create_task(_idle_refresh(engine))
+
     last_user_input = None
-    available_models = []
     while True:
         try:
             # Async prompt
@@ -114,55 +193,68 @@ async def main():
                     target = cmd_parts[1].lower()
                     if config.set_active_provider(target):
                         ui.console.print(f"[green]Switched to {target} provider.[/green]")
+                        asyncio.create_task(_probe_active_model())
                     else:
                         ui.show_error(f"Provider '{target}' not found.")
                 continue
 
             # List Models Command
             if cmd in ["/models", "/list"]:
+                from . import catalog
                 provider = config.get_active_provider()
-                ui.console.print(f"[dim]Fetching models for {provider}...[/dim]")
-                models = await asyncio.to_thread(engine.list_models)
-                
+                refresh = len(cmd_parts) > 1 and cmd_parts[1] == "refresh"
+                entry = catalog.cached(provider)
+                if entry is None or refresh:
+                    ui.console.print(f"[dim]Fetching models for {provider}...[/dim]")
+                    errors = await catalog.refresh_async([provider], force=True)
+                    if errors:
+                        ui.show_error(errors[provider])
+                    entry = catalog.cached(provider)
+                elif catalog.is_stale(provider, entry):
+                    # Show what we have now; the next /models sees the new list
+                    asyncio.create_task(catalog.refresh_async([provider]))
+
+                models = (entry or {}).get("models", [])
                 if not models:
                     ui.console.print(f"[yellow]No models found or error fetching for {provider}.[/yellow]")
-                elif isinstance(models[0], str) and models[0].startswith("Error"):
-                     ui.show_error(models[0])
                 else:
-                    available_models = models
-                    ui.console.print(f"[bold]Available Models for {provider}:[/bold]")
+                    age = (time.time() - entry["fetched"]) / 60
+                    age_text = f"{age:.0f} min" if age < 120 else f"{age / 60:.0f} h"
+                    ui.console.print(f"[bold]Available Models for {provider}:[/bold] [dim](fetched {age_text} ago)[/dim]")
                     
                     # Create a multi-column table for alignment
+                    from rich.table import Table
                     table = Table(show_header=False, padding=(0, 2), box=None, show_edge=False)
                     num_cols = 3
                     for _ in range(num_cols):
                         table.add_column()
                     
                     # Partition models into rows
-                    rows = []
                     for i in range(0, len(models), num_cols):
                         row_items = []
                         for j in range(num_cols):
                             idx = i + j
                             if idx < len(models):
-                                row_items.append(f"[cyan]{idx+1:2}.[/cyan] {models[idx]}")
+                                row_items.append(f"[cyan]{idx+1:2}.[/cyan] {models[idx]['id']}{_model_tags(models[idx])}")
                             else:
                                 row_items.append("")
                         table.add_row(*row_items)
                     
                     ui.console.print(table)
                     
-                    ui.console.print(f"\n[dim]Set with: /model <number> or <name>[/dim]")
+                    ui.console.print(f"\n[dim]Set with: /model <number> or <name> · /models refresh to refetch[/dim]")
                 continue
 
             # Model Command
             if cmd == "/model":
                 if len(cmd_parts) > 1:
+                    from . import catalog
                     arg = cmd_parts[1]
                     provider = config.get_active_provider()
                     
                     selected_model = arg
-                    # Check if it's a number and we have available_models
+                    # A number refers to the /models list of this provider
+                    available_models = catalog.models(provider)
                     if arg.isdigit() and available_models:
                         idx = int(arg) - 1
                         if 0 <= idx < len(available_models):
@@ -174,12 +266,29 @@ async def main():
                     if provider in config.PROVIDERS:
                         config.save_model(selected_model, provider)
                         ui.console.print(f"[green]Model for {provider} set to: {selected_model}[/green]")
+                        asyncio.create_task(_probe_active_model())
                 else:
                     provider = config.get_active_provider()
                     current_model = config.PROVIDERS[provider]["model"]
                     ui.console.print(f"Current model for [bold]{provider}[/bold]: [cyan]{current_model}[/cyan]")
                 continue
 
+            # Capabilities of the active model: /probe [refresh]
+            if cmd == "/probe":
+                from . import capabilities
+                provider = config.get_active_provider()
+                model = config.PROVIDERS[provider]["model"]
+                force = len(cmd_parts) > 1 and cmd_parts[1] == "refresh"
+                if force or not capabilities.is_known(provider, model):
+                    ui.console.print(f"[dim]Probing {provider}/{model}...[/dim]")
+                try:
+                    caps = await capabilities.probe_async(provider, model, force=force)
+                except capabilities.ProbeError as e:
+                    ui.show_error(f"Probe failed: {e}")
+                    continue
+                ui.console.print(f"[bold]{provider}/{model}[/bold]: {capabilities.describe(caps)}")
+                continue
+
             # URL Command
             if cmd == "/url":
                 if len(cmd_parts) > 1:
@@ -210,9 +319,16 @@ async def main():
                         status = "[green](active)[/green]" if p == active else ""
                         desc = config.SEARCH_PROVIDERS[p]["description"]
                         ui.console.print(f" - {p}: {desc} {status}")
+                    ui.console.print(f"\n[dim]Mode: {config.get_search_mode()} (switch with /search fanout or /search single)[/dim]")
                 else:
                     target = parts[1].lower()
-                    if config.set_active_search_provider(target):
+                    if target in config.SEARCH_MODES:
+                        config.set_search_mode(target)
+                        if target == "fanout":
+                            ui.console.print("[green]Search will query all configured providers at once and merge results.[/green]")
+                        else:
+                            ui.console.print("[green]Search will use the active provider only.[/green]")
+                    elif config.set_active_search_provider(target):
                         ui.console.print(f"[green]Switched search provider to {target}.[/green]")
                     else:
                         ui.show_error(f"Search provider '{target}' not found.")
@@ -290,8 +406,67 @@ async def main():
                     ui.console.print("Usage: /token [provider] <key> (or type '/token help')")
                 continue
 
+            if cmd == "/hud":
+                if len(cmd_parts) > 1 and cmd_parts[1] in ["on", "off"]:
+                    config.set_hud(cmd_parts[1] == "on")
+                    ui.console.print(f"[green]HUD turned {cmd_parts[1]}.[/green]")
+                else:
+                    ui.console.print(f"HUD: [bold]{'on' if config.use_hud() else 'off'}[/bold]")
+                    ui.console.print("Usage: /hud [on|off]")
+                continue
+
+            # Hybrid routing: /route [on|off]
+            if cmd == "/route":
+                from . import router, tracing
+                if len(cmd_parts) > 1 and cmd_parts[1] in ["on", "off"]:
+                    config.set_routing(cmd_parts[1] == "on")
+                    engine.routing = cmd_parts[1] == "on"
+                    ui.console.print(f"[green]Routing turned {cmd_parts[1]}.[/green]")
+                    if engine.routing and not router.local_available():
+                        ui.console.print("[yellow]No local model yet: every turn goes online until you run /setup.[/yellow]")
+                    continue
+                ui.console.print(f"Routing: [bold]{'on' if engine.routing else 'off'}[/bold] (usage: /route [on|off])")
+                if engine.last_route:
+                    route, confidence, reason = engine.last_route
+                    ui.console.print(f"Last turn: [cyan]{route}[/cyan] ({reason}, confidence {confidence:.2f})")
+                for name, key, count, p50, p95, _tokens in tracing.tracer.summary():
+                    if name == "route":
+                        ui.console.print(f"  {key:<9} {count:>4} turns   p50 {p50:>7.0f} ms   p95 {p95:>7.0f} ms")
+                continue
+
+            # Timing statistics for this session
+            if cmd == "/stats":
+                from . import tracing
+                if len(cmd_parts) > 1 and cmd_parts[1] == "clear":
+                    tracing.tracer.clear()
+                    ui.console.print("[green]Statistics cleared.[/green]")
+                elif len(cmd_parts) > 1 and cmd_parts[1] == "export":
+                    if len(cmd_parts) > 2 and config.set_trace_export(cmd_parts[2]):
+                        ui.console.print(f"[green]Trace export: {cmd_parts[2]}[/green]")
+                    else:
+                        ui.console.print(f"Trace export: [bold]{config.get_trace_export()}[/bold]")
+                        ui.console.print("Usage: /stats export [off|jsonl|otlp]")
+                else:
+                    rows = tracing.tracer.summary()
+                    if not rows:
+                        ui.console.print("[dim]No timings recorded yet.[/dim]")
+                    else:
+                        from rich.table import Table
+                        table = Table(box=None, padding=(0, 2))
+                        for column in ["span", "name", "count", "p50 ms", "p95 ms", "tokens"]:
+                            table.add_column(column, justify="right" if column in ["count", "p50 ms", "p95 ms", "tokens"] else "left")
+                        for name, key, count, p50, p95, tokens in rows:
+                            table.add_row(name, key, str(count), f"{p50:.0f}", f"{p95:.0f}", str(tokens) if tokens else "")
+                        ui.console.print(table)
+                        export = config.get_trace_export()
+                        if export != "off":
+                            path = config.TRACE_OTLP_FILE if export == "otlp" else config.TRACE_FILE
+                            ui.console.print(f"\n[dim]Traces are written to {path}[/dim]")
+                continue
+
             # MCP Commands
             if user_input.startswith("/mcp"):
+                await engine.wait_ready()
                 parts = user_input.split(" ")
                 if len(parts) > 1:
                     cmd = parts[1]
@@ -301,15 +476,25 @@ async def main():
                         else:
                             ui.console.print("[bold]Connected MCP Servers:[/bold]")
                             for name in engine.mcp_clients:
-                                ui.console.print(f" - {name}")
+                                status = engine.mcp_supervisor.status(name)
+                                color = "green" if status == "connected" else "yellow"
+                                ui.console.print(f" - {name} [{color}]({status})[/{color}]")
                             ui.console.print(f"\n[dim]{len(engine.mcp_tools)} tools available loaded.[/dim]")
                     elif cmd == "reload":
-                        await engine.initialize_mcp()
+                        await engine.reload_mcp()
                         ui.console.print("[green]MCP servers reloaded.[/green]")
+                    elif cmd == "daemon":
+                        if len(parts) > 2 and parts[2] in ["on", "off"]:
+                            config.set_mcp_daemon(parts[2] == "on")
+                            ui.console.print(f"[green]Shared MCP daemon turned {parts[2]}. Restart goku to apply.[/green]")
+                        else:
+                            state = "on" if config.use_mcp_daemon() else "off"
+                            ui.console.print(f"Shared MCP daemon: [bold]{state}[/bold]")
+                            ui.console.print("Usage: /mcp daemon [on|off]")
                     else:
-                        ui.console.print("Usage: /mcp [list|reload]")
+                        ui.console.print("Usage: /mcp [list|reload|daemon]")
                 else:
-                    ui.console.print("Usage: /mcp [list|reload]")
+                    ui.console.print("Usage: /mcp [list|reload|daemon]")
                 continue
                 
             if user_input.lower() in ["/clear", "clear"]:
@@ -382,10 +567,14 @@ async def main():
             try:
                 # Use generate_async directly
                 with ui.show_loading() as status:
+                    # The HUD measures TTFT and tokens/s from streamed responses
+                    engine.on_event = status.hud.handle if status.hud else None
+                    engine.stream = status.hud is not None
                     response, error = await engine.generate_async(
                         user_input, 
                         status_obj=status
                     )
+                engine.on_event = None
                 
                 if error:
                     ui.show_error(error)
@@ -434,7 +623,11 @@ async def main():
 
     # Clean shutdown
     ui.console.print("[dim]Shutting down...[/dim]")
+    idle_refresh.cancel()
     await engine.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        sys.exit(130)
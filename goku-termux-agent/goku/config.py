@@ -1,7 +1,16 @@
 import os
+import copy
 import json
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
+# Importable both as goku.config and, from the MCP servers, as a top-level module
+try:
+    from . import jsonfile
+except ImportError:
+    import jsonfile
+
 # Paths
 HOME = Path.home()
 GOKU_DIR = HOME / ".goku"
@@ -49,37 +58,105 @@ PROVIDERS = {
 
 DEFAULT_PROVIDER = "huggingface"
 
-def load_config():
-    if CONFIG_FILE.exists():
+CONFIG_LOCK_FILE = GOKU_DIR / "config.lock"
+
+# Parsed config.json, keyed by the file's (mtime, inode, size) so it is only
+# re-read when some session actually changed it
+_config_cache = {"key": None, "data": {}}
+_config_lock = threading.Lock()
+_listeners = []
+
+def _file_key():
+    try:
+        st = os.stat(CONFIG_FILE)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+def _read_config_file():
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def _cached_config():
+    """The current config (shared, do not modify). Costs a stat() when nothing changed."""
+    key = _file_key()
+    with _config_lock:
+        if key == _config_cache["key"]:
+            return _config_cache["data"]
+        old = _config_cache["data"]
+        data = _read_config_file() if key else {}
+        _config_cache.update(key=key, data=data)
+    if data != old:
+        _notify(old, data)
+    return data
+
+def on_change(callback):
+    """Call callback(old, new) whenever config.json changes, here or in another session."""
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+def remove_on_change(callback):
+    """Stop calling a callback registered with on_change."""
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+def _notify(old, new):
+    for callback in list(_listeners):
         try:
-            with open(CONFIG_FILE, 'r') as f:
-                return json.load(f)
-        except:
+            callback(old, new)
+        except Exception:
             pass
-    return {}
+
+def _file_lock():
+    """Advisory lock serialising read-modify-write cycles across goku processes."""
+    return jsonfile.file_lock(CONFIG_LOCK_FILE)
+
+def _write_config_file(data):
+    jsonfile.write(CONFIG_FILE, data, indent=4)
+
+def load_config():
+    return copy.deepcopy(_cached_config())
 
 def save_config(data):
-    GOKU_DIR.mkdir(parents=True, exist_ok=True)
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+    with _file_lock():
+        _write_config_file(data)
+    _cached_config()
+
+@contextmanager
+def edit_config():
+    """
+    Read-modify-write config.json under the lock, so concurrent sessions don't
+    overwrite each other's changes:
+
+        with edit_config() as cfg:
+            cfg["active_provider"] = "openai"
+    """
+    with _file_lock():
+        cfg = _read_config_file()
+        yield cfg
+        _write_config_file(cfg)
+    _cached_config()
 
 def get_active_provider():
-    return load_config().get("active_provider", DEFAULT_PROVIDER)
+    return _cached_config().get("active_provider", DEFAULT_PROVIDER)
 
 def set_active_provider(name):
     if name in PROVIDERS:
-        cfg = load_config()
-        cfg["active_provider"] = name
-        save_config(cfg)
+        with edit_config() as cfg:
+            cfg["active_provider"] = name
         return True
     return False
 
 def get_token(provider=None):
     if not provider:
         provider = get_active_provider()
-    
+
     # Check config file
-    cfg = load_config()
+    cfg = _cached_config()
     tokens = cfg.get("tokens", {})
     if provider in tokens:
         return tokens[provider]
@@ -98,55 +175,36 @@ def save_token(token, provider=None):
     if not provider:
         provider = get_active_provider()
     
-    cfg = load_config()
-    tokens = cfg.get("tokens", {})
-    tokens[provider] = token
-    cfg["tokens"] = tokens
-    save_config(cfg)
+    with edit_config() as cfg:
+        cfg.setdefault("tokens", {})[provider] = token
 
 def save_url(url, provider=None):
     if not provider:
         provider = get_active_provider()
-    
-    cfg = load_config()
-    urls = cfg.get("urls", {})
-    urls[provider] = url
-    cfg["urls"] = urls
-    save_config(cfg)
-    
-    # Update current session
-    if provider in PROVIDERS:
-        PROVIDERS[provider]["url"] = url
+
+    # The change listener below updates PROVIDERS for the current session
+    with edit_config() as cfg:
+        cfg.setdefault("urls", {})[provider] = url
 
 def save_model(model, provider=None):
     if not provider:
         provider = get_active_provider()
-    
-    cfg = load_config()
-    models = cfg.get("models", {})
-    models[provider] = model
-    cfg["models"] = models
-    save_config(cfg)
-    
-    # Update current session
-    if provider in PROVIDERS:
-        PROVIDERS[provider]["model"] = model
+
+    with edit_config() as cfg:
+        cfg.setdefault("models", {})[provider] = model
 
 # Backward compatibility
-# Load saved configuration overrides
-_cfg = load_config()
-_saved_models = _cfg.get("models", {})
-for _p, _m in _saved_models.items():
-    if _p in PROVIDERS:
-        PROVIDERS[_p]["model"] = _m
+# Apply saved model/url overrides, now and whenever config.json changes
+_DEFAULT_PROVIDER_SETTINGS = copy.deepcopy(PROVIDERS)
 
-_saved_urls = _cfg.get("urls", {})
-for _p, _u in _saved_urls.items():
-    if _p in PROVIDERS:
-        PROVIDERS[_p]["url"] = _u
+def _apply_provider_overrides(old, new):
+    for name, defaults in _DEFAULT_PROVIDER_SETTINGS.items():
+        PROVIDERS[name]["model"] = new.get("models", {}).get(name, defaults["model"])
+        PROVIDERS[name]["url"] = new.get("urls", {}).get(name, defaults["url"])
+
+on_change(_apply_provider_overrides)
+_apply_provider_overrides({}, _cached_config())
 
-HF_TOKEN = get_token("huggingface")
-DEFAULT_HF_MODEL = PROVIDERS["huggingface"]["model"]
 
 # Search Providers
 SEARCH_PROVIDERS = {
@@ -170,21 +228,48 @@ SEARCH_PROVIDERS = {
 DEFAULT_SEARCH_PROVIDER = "brave"
 
 def get_active_search_provider():
-    return load_config().get("active_search_provider", DEFAULT_SEARCH_PROVIDER)
+    return _cached_config().get("active_search_provider", DEFAULT_SEARCH_PROVIDER)
 
 def set_active_search_provider(name):
     if name in SEARCH_PROVIDERS:
-        cfg = load_config()
-        cfg["active_search_provider"] = name
-        save_config(cfg)
+        with edit_config() as cfg:
+            cfg["active_search_provider"] = name
         return True
     return False
 
+SEARCH_MODES = ["single", "fanout"]
+
+def get_search_mode():
+    return _cached_config().get("search_mode", "single")
+
+def set_search_mode(mode):
+    if mode in SEARCH_MODES:
+        with edit_config() as cfg:
+            cfg["search_mode"] = mode
+        return True
+    return False
+
+# Default request rates per search provider (requests/second and burst), matching
+# their free plans; override per provider with "search_rate_limits" in config.json
+SEARCH_RATE_LIMITS = {
+    "brave": {"rate": 1.0, "burst": 1},
+    "google": {"rate": 1.0, "burst": 5},
+    "bing": {"rate": 3.0, "burst": 3},
+    "duckduckgo": {"rate": 0.5, "burst": 3}
+}
+# Providers tried, in order, when the active one is rate limited
+SEARCH_FALLBACK_ORDER = ["brave", "google", "bing", "duckduckgo"]
+
+def get_search_rate_limit(provider):
+    limit = dict(SEARCH_RATE_LIMITS.get(provider, {"rate": 1.0, "burst": 1}))
+    limit.update(_cached_config().get("search_rate_limits", {}).get(provider, {}))
+    return limit
+
 def get_search_token(provider=None):
     if not provider:
         provider = get_active_search_provider()
-        
-    cfg = load_config()
+
+    cfg = _cached_config()
     tokens = cfg.get("tokens", {})
     if provider in tokens:
         return tokens[provider]
@@ -217,57 +302,81 @@ def load_mcp_servers():
         }
     }
     
-    if CONFIG_FILE.exists():
-        try:
-            with open(CONFIG_FILE, 'r') as f:
-                data = json.load(f)
-                servers = data.get("mcp_servers", {})
-                if not servers:
-                    return defaults
-                return servers
-        except:
-            pass
-    return defaults
+    servers = _cached_config().get("mcp_servers", {})
+    if not servers:
+        return defaults
+    return copy.deepcopy(servers)
 
 def save_mcp_server(name, config):
     """Save a new MCP server configuration."""
-    GOKU_DIR.mkdir(parents=True, exist_ok=True)
-    current_data = {}
-    if CONFIG_FILE.exists():
-        try:
-            with open(CONFIG_FILE, 'r') as f:
-                current_data = json.load(f)
-        except:
-            pass
-    
-    servers = current_data.get("mcp_servers", {})
-    servers[name] = config
-    current_data["mcp_servers"] = servers
-    
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(current_data, f, indent=4)
+    with edit_config() as cfg:
+        cfg.setdefault("mcp_servers", {})[name] = config
 
 def remove_mcp_server(name):
     """Remove an MCP server configuration."""
-    if not CONFIG_FILE.exists():
-        return False
-        
-    try:
-        with open(CONFIG_FILE, 'r') as f:
-            current_data = json.load(f)
-    except:
+    if name not in _cached_config().get("mcp_servers", {}):
         return False
-        
-    servers = current_data.get("mcp_servers", {})
-    if name in servers:
-        del servers[name]
-        current_data["mcp_servers"] = servers
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(current_data, f, indent=4)
+    with edit_config() as cfg:
+        removed = cfg.get("mcp_servers", {}).pop(name, None) is not None
+    return removed
+
+def __getattr__(name):
+    # Backward compatible module attributes, computed on access instead of at import
+    # so that importing config does no work beyond reading config.json once
+    if name == "HF_TOKEN":
+        return get_token("huggingface")
+    if name == "DEFAULT_HF_MODEL":
+        return PROVIDERS["huggingface"]["model"]
+    if name == "MCP_SERVERS":
+        return load_mcp_servers()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def use_hud():
+    return bool(_cached_config().get("hud", False))
+
+def set_hud(enabled):
+    with edit_config() as cfg:
+        cfg["hud"] = bool(enabled)
+
+# Tracing: spans of each turn can be appended to a file, one span per line
+# ("jsonl") or as OTLP/JSON export requests ("otlp")
+TRACE_FILE = GOKU_DIR / "traces.jsonl"
+TRACE_OTLP_FILE = GOKU_DIR / "traces.otlp.jsonl"
+TRACE_EXPORT_MODES = ["off", "jsonl", "otlp"]
+
+def get_trace_export():
+    return _cached_config().get("trace_export", "off")
+
+def set_trace_export(mode):
+    if mode in TRACE_EXPORT_MODES:
+        with edit_config() as cfg:
+            cfg["trace_export"] = mode
         return True
     return False
 
-MCP_SERVERS = load_mcp_servers()
+# Shared MCP daemon: one process owns the MCP servers for every goku session
+MCP_DAEMON_SOCKET = GOKU_DIR / "mcp.sock"
+MCP_DAEMON_LOG = GOKU_DIR / "mcp_daemon.log"
+
+def use_mcp_daemon():
+    return bool(_cached_config().get("mcp_daemon", False))
+
+def set_mcp_daemon(enabled):
+    with edit_config() as cfg:
+        cfg["mcp_daemon"] = bool(enabled)
+
+# Hybrid routing (/route): in online mode, turns the router is at least
+# ROUTER_MIN_CONFIDENCE sure are simple go to the local model; prompts longer
+# than ROUTER_LOCAL_MAX_WORDS words always go online
+ROUTER_MIN_CONFIDENCE = 0.7
+ROUTER_LOCAL_MAX_WORDS = 30
+
+def use_routing():
+    return bool(_cached_config().get("routing", False))
+
+def set_routing(enabled):
+    with edit_config() as cfg:
+        cfg["routing"] = bool(enabled)
 
 # Offline Configuration
 DEFAULT_GGUF_MODEL = "Qwen2.5-1.5B-Instruct-GGUF"
@@ -277,3 +386,138 @@ MODEL_PATH = MODELS_DIR / "qwen2.5-1.5b-instruct-q4_k_m.gguf"
 # Settings
 SESSION_MEMORY_MAX = 10
 SHOW_THOUGHTS = True
+
+# MCP supervision: health-check interval/timeout and the cap on restart backoff (seconds)
+MCP_PING_INTERVAL = 30
+MCP_PING_TIMEOUT = 10
+MCP_MAX_BACKOFF = 60
+
+# Shared MCP daemon: seconds without sessions before it exits, and how many
+# tool calls it runs at once across all sessions
+MCP_DAEMON_IDLE_TIMEOUT = 300
+MCP_DAEMON_MAX_CONCURRENCY = 4
+# How often the daemon checks config.json for edited mcp_servers (seconds)
+MCP_DAEMON_CONFIG_POLL = 2
+
+# Open a connection to the active search provider when the internet server starts
+SEARCH_PREWARM = True
+
+# Web search result cache (seconds): fresh for SEARCH_CACHE_TTL, then served
+# while refreshing in the background for up to SEARCH_CACHE_STALE_TTL more
+SEARCH_CACHE_PATH = GOKU_DIR / "web_cache.db"
+SEARCH_CACHE_TTL = 6 * 3600
+SEARCH_CACHE_STALE_TTL = 3 * 86400
+SEARCH_CACHE_MAX_ENTRIES = 1000
+
+# Fan-out search: answer once this many providers have responded, or at the deadline (seconds)
+SEARCH_FANOUT_MIN_PROVIDERS = 2
+SEARCH_FANOUT_DEADLINE = 4.0
+
+# read_webpage: stop downloading after this many bytes; default size of the returned text
+WEBPAGE_MAX_BYTES = 2 * 1024 * 1024
+WEBPAGE_MAX_TOKENS = 3000
+
+# read_webpage cache (same database): pages without a Cache-Control max-age stay
+# fresh for PAGE_CACHE_TTL seconds, then are revalidated with ETag/Last-Modified
+PAGE_CACHE_TTL = 3600
+PAGE_CACHE_MAX_ENTRIES = 300
+
+# read_webpages: parallel fetches overall and per host, per-URL deadline (seconds),
+# most URLs per call, and default size of the combined output
+WEBPAGE_CONCURRENCY = 6
+WEBPAGE_PER_HOST_CONCURRENCY = 2
+WEBPAGE_URL_TIMEOUT = 15
+WEBPAGES_MAX_URLS = 10
+WEBPAGES_MAX_TOKENS = 6000
+
+# Search API retries: attempts after the first, longest backoff/Retry-After we
+# are willing to sleep, and longest wait for a local rate-limit token (seconds)
+SEARCH_MAX_RETRIES = 2
+SEARCH_MAX_RETRY_WAIT = 10
+SEARCH_MAX_QUEUE_WAIT = 5
+
+# Threads (each with its own persistent DuckDuckGo session) serving DDG searches
+DDG_WORKERS = 2
+
+# Most times per second the HUD line under the spinner is re-rendered
+HUD_REFRESH_PER_SECOND = 4
+
+# Connections kept open per provider host by the shared HTTP session
+HTTP_POOL_SIZE = 16
+
+# goku batch: conversations run at once, provider requests in flight per provider,
+# and retries of a conversation that hit a rate limit (429)
+BATCH_CONCURRENCY = 4
+BATCH_PROVIDER_CONCURRENCY = 4
+BATCH_MAX_RETRIES = 2
+
+# Default request rate per provider for goku batch (requests/second and burst);
+# override per provider with "batch_rate_limits" in config.json
+BATCH_RATE_LIMIT = {"rate": 2.0, "burst": 4}
+
+def get_batch_rate_limit(provider):
+    limit = dict(BATCH_RATE_LIMIT)
+    limit.update(_cached_config().get("batch_rate_limits", {}).get(provider, {}))
+    return limit
+
+# `goku --profile-startup` fails when time-to-prompt exceeds this (milliseconds)
+STARTUP_BUDGET_MS = 1500
+
+# Largest reply requested from online providers, and the context window asked
+# of Ollama's /api/generate (tokens)
+RESPONSE_MAX_TOKENS = 2048
+OLLAMA_NUM_CTX = 4096
+
+# Model catalog (/models): each provider's list is kept this long (seconds)
+# before it is refetched in the background
+MODEL_CATALOG_FILE = GOKU_DIR / "models.json"
+MODEL_CATALOG_TTL = 24 * 3600
+
+# Context windows (tokens) of well-known model families, for providers whose
+# model list doesn't include one; the longest prefix of the model name wins
+MODEL_CONTEXT_HINTS = {
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4-turbo": 128000,
+    "gpt-3.5-turbo": 16385,
+    "o1": 200000,
+    "o3": 200000,
+    "o4-mini": 200000,
+    "claude": 200000,
+    "gemini-1.5-flash": 1048576,
+    "gemini-1.5-pro": 2097152,
+    "gemini-2": 1048576,
+    "llama-3.1": 131072,
+    "llama-3.2": 131072,
+    "llama-3.3": 131072,
+    "qwen2.5": 32768,
+    "qwen3": 40960,
+    "qwen3-coder": 262144,
+    "mistral": 32768,
+    "deepseek": 65536
+}
+
+# What each model accepts (native tools, streaming, system role...), rechecked
+# after CAPABILITIES_TTL seconds; with CAPABILITY_PROBE the REPL probes the
+# active model in the background the first time it is used (three tiny requests)
+CAPABILITIES_FILE = GOKU_DIR / "capabilities.json"
+CAPABILITIES_TTL = 7 * 86400
+CAPABILITY_PROBE = True
+
+# Tool selection: with more than TOOL_SELECT_MIN_TOOLS tools (e.g. several MCP
+# servers), a turn is offered the built-in tools, the TOOL_SELECT_TOP_K best
+# matches for the request, recently used tools and list_more_tools. Tool and
+# argument descriptions are cut to these lengths (characters)
+TOOL_SELECT_MIN_TOOLS = 20
+TOOL_SELECT_TOP_K = 8
+TOOL_DESCRIPTION_MAX = 300
+TOOL_ARG_DESCRIPTION_MAX = 120
+
+# Offline tool calling: the local model is offered the tools and constrained
+# by a llama.cpp grammar (kept in GRAMMAR_DIR) to answer or emit one valid call;
+# tool output beyond OFFLINE_TOOL_RESULT_MAX characters is cut
+OFFLINE_MAX_STEPS = 5
+OFFLINE_CTX_SIZE = 4096
+OFFLINE_MAX_TOKENS = 512
+OFFLINE_TOOL_RESULT_MAX = 2000
+GRAMMAR_DIR = GOKU_DIR / "grammars"
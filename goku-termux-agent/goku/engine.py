@@ -1,50 +1,162 @@
-import requests
 import subprocess
 import json
 import os
 import re
+import sys
+import time
 from . import config
 
 from . import tools as goku_tools
+from . import tracing
+
+import importlib
+import importlib.util
+# mcp_client is imported on demand: sessions using the shared daemon never load `mcp`
+MCP_AVAILABLE = importlib.util.find_spec("mcp") is not None
 
-try:
-    from . import mcp_client
-    MCP_AVAILABLE = True
-except ImportError:
-    MCP_AVAILABLE = False
-    
 import asyncio
+import contextlib
+
+_http_session = None
+# (MCP tool list, tool_selector.ToolSelector built from it and the built-in tools)
+_shared_selector = (None, None)
+
+def http_session():
+    """Shared requests.Session, so provider calls reuse pooled keep-alive connections."""
+    global _http_session
+    if _http_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=config.HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _http_session = session
+    return _http_session
 
 class GokuEngine:
     def __init__(self):
         self.mode = "online"
         self.history = []
-        self.mcp_clients = {}
-        self.mcp_tools = []
-        
-        # Initialize MCP clients if available
-        if MCP_AVAILABLE:
-            for name, cfg in config.MCP_SERVERS.items():
-                if hasattr(mcp_client, 'MCPClient'):
-                    client = mcp_client.MCPClient(name, cfg.get("command"), cfg.get("args", []), cfg.get("env"))
-                    self.mcp_clients[name] = client
+        self.mcp_supervisor = None
+        self._loop = None
+        self._background_init = None
+        # Non-interactive callers (goku ask) turn off console output, receive
+        # progress through on_event and may ask for token streaming
+        self.show_ui = True
+        self.stream = False
+        self.on_event = None
+        # Per-engine provider/model (instead of the configured ones), and an optional
+        # async context manager factory wrapped around every provider request
+        self.provider = None
+        self.model = None
+        self.limiter = None
+        # Optional cassette.Cassette recording or replaying provider and tool traffic
+        self.cassette = None
+        # Hybrid routing: simple online-mode turns go to the local model (router.py);
+        # last_route is the latest (route, confidence, reason)
+        self.routing = False
+        self.last_route = None
+
+        # Proxy to the shared MCP daemon; a local supervisor is created in initialize_mcp
+        if config.use_mcp_daemon():
+            from . import mcp_daemon
+            self.mcp_supervisor = mcp_daemon.MCPDaemonClient(config.MCP_DAEMON_SOCKET)
+
+    @property
+    def mcp_clients(self):
+        return self.mcp_supervisor.clients if self.mcp_supervisor else {}
+
+    @property
+    def mcp_tools(self):
+        return self.mcp_supervisor.tools if self.mcp_supervisor else []
 
     async def initialize_mcp(self):
         """Connect to MCP servers and fetch tools."""
-        for name, client in self.mcp_clients.items():
-            if await client.connect():
-                tools = await client.list_tools_schema()
-                self.mcp_tools.extend(tools)
-                # ui.console.print(f"[dim]Connected to MCP server: {name}[/dim]")
-
-    async def close(self):
-        """Disconnect from all MCP servers."""
-        for client in self.mcp_clients.values():
+        global MCP_AVAILABLE
+        if self.mcp_supervisor is None and MCP_AVAILABLE:
+            # Importing `mcp` takes a second or more on a phone; keep it off the event loop
             try:
-                await client.close()
+                mcp_client = await asyncio.to_thread(importlib.import_module, ".mcp_client", __package__)
+            except ImportError:
+                # Installed but broken (e.g. a missing compiled dependency): native tools only
+                MCP_AVAILABLE = False
+                return
+            self.mcp_supervisor = mcp_client.MCPSupervisor(
+                config.load_mcp_servers(),
+                ping_interval=config.MCP_PING_INTERVAL,
+                ping_timeout=config.MCP_PING_TIMEOUT,
+                max_backoff=config.MCP_MAX_BACKOFF
+            )
+        if self.mcp_supervisor:
+            await self.mcp_supervisor.start()
+            self._loop = asyncio.get_running_loop()
+            if not getattr(self.mcp_supervisor, "watches_config", False):
+                config.on_change(self._on_config_change)
+
+    def _on_config_change(self, old, new):
+        """Reconnect when mcp_servers was edited in config.json (by hand or by another session)."""
+        if old.get("mcp_servers") == new.get("mcp_servers"):
+            return
+        loop = self._loop
+        if loop and not loop.is_closed():
+            # May be called from an executor thread; reload on the engine's loop
+            loop.call_soon_threadsafe(lambda: loop.create_task(self.reload_mcp()))
+
+    def start_background_init(self):
+        """
+        Connect MCP servers and preload the prompt builder while the user is
+        typing, instead of before the first prompt is shown.
+        """
+        if self._background_init is None:
+            self._background_init = asyncio.create_task(self._initialize_in_background())
+
+    async def _initialize_in_background(self):
+        await self.initialize_mcp()
+        try:
+            await asyncio.to_thread(importlib.import_module, "langchain_core.messages")
+        except ImportError:
+            pass
+
+    async def wait_ready(self):
+        """Wait for start_background_init to finish (immediate if it already has)."""
+        if self._background_init is not None:
+            try:
+                await self._background_init
             except Exception:
                 pass
 
+    def _emit(self, event, **data):
+        """Report progress (steps, tokens, tool calls, timings) to on_event, if set."""
+        if self.on_event:
+            self.on_event({"event": event, **data})
+
+    async def reload_mcp(self):
+        """Re-read the MCP server config and reconnect, replacing the old servers."""
+        if self.mcp_supervisor:
+            await self.mcp_supervisor.reload(config.load_mcp_servers())
+
+    async def close(self, release_shared=True):
+        """
+        Disconnect from all MCP servers, release the web search client and finish
+        the cassette. release_shared=False keeps the process-wide web search
+        client, for engines closed while others (e.g. in a batch) still use it.
+        """
+        await self.wait_ready()
+        config.remove_on_change(self._on_config_change)
+        self._loop = None
+        if self.mcp_supervisor:
+            try:
+                await self.mcp_supervisor.close()
+            except Exception:
+                pass
+        # Only loaded once a search has run this session
+        web_search = sys.modules.get(f"{__package__}.web_search")
+        if web_search and release_shared:
+            await web_search.close()
+        if self.cassette:
+            self.cassette.close()
+
     def set_mode(self, mode):
         if mode in ["online", "offline"]:
             self.mode = mode
@@ -55,54 +167,66 @@ class GokuEngine:
         self.history = []
 
     def list_models(self):
-        """Fetch available models from the active provider."""
-        provider_name = config.get_active_provider()
-        provider_cfg = config.PROVIDERS.get(provider_name, config.PROVIDERS[config.DEFAULT_PROVIDER])
-        
-        # Determine models endpoint
-        if provider_name == "anthropic":
-            return ["claude-3-5-sonnet-20240620", "claude-3-opus-20240229", "claude-3-sonnet-20240229", "claude-3-haiku-20240307"]
-        
-        if provider_name == "ollama":
-            # If it's a known ollama endpoint like /api/generate, use /api/tags
-            if "api/generate" in provider_cfg["url"]:
-                base_url = provider_cfg["url"].split("/api/generate")[0]
-                url = f"{base_url}/api/tags"
-            elif "v1" in provider_cfg["url"]:
-                base_url = provider_cfg["url"].split("/v1")[0]
-                url = f"{base_url}/api/tags" # Fallback to native for better listing
-            else:
-                url = f"{provider_cfg['url'].rsplit('/', 1)[0]}/tags"
-        else:
-            base_url = provider_cfg["url"].rsplit("/", 2)[0] # remove /chat/completions
-            url = f"{base_url}/models"
-        token = config.get_token(provider_name)
-        
-        headers = {"Content-Type": "application/json"}
-        if token:
-             headers["Authorization"] = f"Bearer {token}"
-        
+        """Fetch available models from the active provider (and update the catalog)."""
+        from . import catalog
         try:
-            response = requests.get(url, headers=headers, timeout=10)
-            if response.status_code == 401:
-                return [f"Error: Unauthorized (401). Please check your API key for {provider_name}."]
-            if response.status_code == 404:
-                return [f"Error: Models endpoint not found (404). The provider {provider_name} may not support listing models at this URL."]
-            
-            response.raise_for_status()
-            data = response.json()
-            # OpenAI format: {"data": [{"id": "model-name", ...}]}
-            if "data" in data and isinstance(data["data"], list):
-                models = [m["id"] for m in data["data"]]
-                return sorted(models)
-            # Ollama (tags) format fallback: {"models": [{"name": "...", ...}]}
-            if "models" in data and isinstance(data["models"], list):
-                models = [m.get("name") or m.get("id") for m in data["models"]]
-                return sorted(filter(None, models))
-                
-            return []
-        except Exception as e:
-            return [f"Error fetching models: {e}"]
+            return [m["id"] for m in catalog.refresh(self.provider or config.get_active_provider())]
+        except catalog.CatalogError as e:
+            return [str(e)]
+
+    def _capabilities(self, provider, model):
+        """
+        What the model accepts (capabilities.get), with the context length from
+        the catalog when not learned. A replayed session uses the ones it was
+        recorded with.
+        """
+        if self.cassette and self.cassette.replaying:
+            recorded = self.cassette.recorded_capabilities()
+            if recorded is not None:
+                return recorded
+        from . import capabilities, catalog
+        caps = capabilities.get(provider, model)
+        if not caps["context_length"]:
+            caps["context_length"] = catalog.model_info(provider, model)["context_length"]
+        return caps
+
+    def _fit_to_context(self, messages, tools_chars=0):
+        """
+        Drop the oldest history messages until the request fits the model's
+        context window (from the catalog) with room for the reply and the
+        tool schemas (tools_chars characters).
+        """
+        from .extract import CHARS_PER_TOKEN  # html.parser: kept off the startup path
+        provider = self.provider or config.get_active_provider()
+        provider_cfg = config.PROVIDERS.get(provider, config.PROVIDERS[config.DEFAULT_PROVIDER])
+        model = self.model or provider_cfg["model"]
+        context = self._capabilities(provider, model)["context_length"]
+        if "api/generate" in provider_cfg["url"]:
+            context = min(context or config.OLLAMA_NUM_CTX, config.OLLAMA_NUM_CTX)
+        if not context:
+            return messages
+
+        budget = (context - config.RESPONSE_MAX_TOKENS) * CHARS_PER_TOKEN - tools_chars
+        sizes = [len(m.get("content") or "") + len(json.dumps(m.get("tool_calls") or "")) for m in messages]
+        last_user = max((i for i, m in enumerate(messages) if m["role"] == "user"), default=0)
+        drop = 0
+        # Never drops the system prompt or anything from the current prompt on
+        while sum(sizes) > budget and 1 + drop < last_user:
+            sizes[1 + drop] = 0
+            drop += 1
+        return messages[:1] + messages[1 + drop:] if drop else messages
+
+    def _tool_selector(self):
+        """The ToolSelector for the built-in and MCP tools, shared by engines with the same MCP tools."""
+        global _shared_selector
+        from .tool_selector import ToolSelector
+        mcp_tools = self.mcp_tools or None
+        source, selector = _shared_selector
+        if selector is None or source is not mcp_tools:
+            all_tools = goku_tools.TOOLS_SCHEMA + (mcp_tools or [])
+            selector = ToolSelector(all_tools, always=[t["function"]["name"] for t in goku_tools.TOOLS_SCHEMA])
+            _shared_selector = (mcp_tools, selector)
+        return selector
 
     def _get_langchain_prompt(self, messages, all_tools):
         from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
@@ -137,10 +261,13 @@ class GokuEngine:
             
         return lc_messages
 
-    def _get_online_response(self, messages):
-        provider_name = config.get_active_provider()
+    def _get_online_response(self, messages, all_tools=None):
+        import requests
+        from . import capabilities
+        provider_name = self.provider or config.get_active_provider()
         provider_cfg = config.PROVIDERS.get(provider_name, config.PROVIDERS[config.DEFAULT_PROVIDER])
-        
+        model = self.model or provider_cfg["model"]
+
         url = provider_cfg["url"]
         token = config.get_token(provider_name)
         
@@ -152,11 +279,82 @@ class GokuEngine:
             else:
                 headers["Authorization"] = f"Bearer {token}"
         
-        # Merge native tools with MCP tools
-        all_tools = goku_tools.TOOLS_SCHEMA + self.mcp_tools
-        
+        # Merge native tools with MCP tools (unless the turn selected some)
+        if all_tools is None:
+            all_tools = goku_tools.TOOLS_SCHEMA + self.mcp_tools
+
+        # A rejected payload teaches us what the model can't take; then it is resent once without it.
+        # Replays don't touch the capability cache: they use what was recorded
+        replaying = bool(self.cassette and self.cassette.replaying)
+        # What the rejection said, also when it wasn't cached (a bad tool schema)
+        overrides = {}
+        for attempt in range(2):
+            caps = {**self._capabilities(provider_name, model), **overrides}
+            payload = self._build_payload(provider_name, provider_cfg, model, messages, all_tools, caps)
+            try:
+                started = time.monotonic()
+                if self.cassette:
+                    response = self.cassette.post(http_session(), url, headers, payload, timeout=60, caps=caps)
+                else:
+                    response = http_session().post(url, headers=headers, json=payload, timeout=60, stream=bool(payload.get("stream")))
+                response.raise_for_status()
+                if payload.get("stream"):
+                    res_data = self._read_openai_stream(response, started)
+                else:
+                    res_data = response.json()
+                
+                # Normalize response format
+                if provider_name == "anthropic":
+                    return self._normalize_anthropic_response(res_data)
+                
+                # Normalize Ollama /api/generate response
+                if "response" in res_data and "done" in res_data:
+                     return {
+                        "choices": [{
+                            "message": {
+                                "role": "assistant",
+                                "content": res_data["response"],
+                                "tool_calls": None
+                            }
+                        }]
+                    }
+
+                if caps["native_tools"] is None and not replaying and (res_data.get("choices") or [{}])[0].get("message", {}).get("tool_calls"):
+                    capabilities.update(provider_name, model, native_tools=True)
+                return res_data
+                
+            except requests.exceptions.HTTPError as e:
+                error_details = ""
+                try:
+                    error_json = response.json()
+                    error_details = f": {error_json.get('error', {}).get('message', str(error_json))}"
+                except:
+                    error_details = f": {response.text[:200]}"
+                learned = capabilities.learn_from_error(provider_name, model, payload, response.status_code, error_details,
+                                                        save=not replaying)
+                overrides.update(learned)
+                if attempt == 0 and learned.keys() & {"native_tools", "streaming", "system_role"}:
+                    continue
+                if attempt == 0 and "context_length" in learned:
+                    fitted = self._fit_to_context(messages, 2 * len(json.dumps(all_tools)))
+                    if len(fitted) < len(messages):
+                        messages = fitted
+                        continue
+                raise Exception(f"Online API error ({provider_name}): {e}{error_details}")
+            except Exception as e:
+                raise Exception(f"Online API error ({provider_name}): {str(e)}")
+
+    def _build_payload(self, provider_name, provider_cfg, model, messages, all_tools, caps):
+        """
+        Request body in the provider's format. Tools go either as native schemas
+        or as text in the system prompt, whichever the model takes; both only
+        while that is still unknown.
+        """
+        native_tools = all_tools if caps["native_tools"] is not False else []
+        text_tools = all_tools if caps["native_tools"] is not True else []
+
         # Use LangChain for message structuring
-        lc_messages = self._get_langchain_prompt(messages, all_tools)
+        lc_messages = self._get_langchain_prompt(messages, text_tools)
 
         # Handle different payload formats (still need raw HTTP for now to avoid bulky LC provider installs)
         if provider_name == "anthropic":
@@ -171,14 +369,15 @@ class GokuEngine:
                 elif msg.type == "ai":
                     anthropic_messages.append({"role": "assistant", "content": msg.content})
             
-            payload = {
-                "model": provider_cfg["model"],
-                "max_tokens": 2048,
+            return {
+                "model": model,
+                "max_tokens": config.RESPONSE_MAX_TOKENS,
                 "messages": anthropic_messages,
                 "system": system_msg,
-                "tools": self._convert_tools_to_anthropic(all_tools) if all_tools else None,
+                "tools": self._convert_tools_to_anthropic(native_tools) if native_tools else None,
             }
-        elif "api/generate" in provider_cfg["url"]:
+
+        if "api/generate" in provider_cfg["url"]:
             # Ollama /api/generate format (Raw completion)
             prompt = ""
             for msg in lc_messages:
@@ -186,61 +385,102 @@ class GokuEngine:
                 prompt += f"<|im_start|>{role}\n{msg.content}<|im_end|>\n"
             prompt += "<|im_start|>assistant\n"
             
-            payload = {
-                "model": provider_cfg["model"],
+            return {
+                "model": model,
                 "prompt": prompt,
                 "stream": False,
-                "options": {"num_ctx": 4096}
-            }
-        else:
-            # OpenAI / Chat format
-            raw_messages = []
-            for msg in lc_messages:
-                role = "system" if msg.type == "system" else "user" if msg.type == "human" else "assistant"
-                raw_messages.append({"role": role, "content": msg.content})
-                
-            payload = {
-                "model": provider_cfg["model"],
-                "messages": raw_messages,
-                "max_tokens": 2048,
-                "tools": all_tools if all_tools else None,
-                "tool_choice": "auto" if all_tools else None,
-                "stream": False
+                "options": {"num_ctx": config.OLLAMA_NUM_CTX}
             }
 
-        try:
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            response.raise_for_status()
-            res_data = response.json()
+        # OpenAI / Chat format
+        raw_messages = []
+        for msg in lc_messages:
+            role = "system" if msg.type == "system" else "user" if msg.type == "human" else "assistant"
+            raw_messages.append({"role": role, "content": msg.content})
+        if caps["system_role"] is False:
+            # Models without a system role get the instructions at the top of the first user message
+            system = "\n\n".join(m["content"] for m in raw_messages if m["role"] == "system")
+            raw_messages = [m for m in raw_messages if m["role"] != "system"]
+            first_user = next((m for m in raw_messages if m["role"] == "user"), None)
+            if first_user:
+                first_user["content"] = f"{system}\n\n{first_user['content']}"
             
-            # Normalize response format
-            if provider_name == "anthropic":
-                return self._normalize_anthropic_response(res_data)
-            
-            # Normalize Ollama /api/generate response
-            if "response" in res_data and "done" in res_data:
-                 return {
-                    "choices": [{
-                        "message": {
-                            "role": "assistant",
-                            "content": res_data["response"],
-                            "tool_calls": None
-                        }
-                    }]
-                }
-            
-            return res_data
-            
-        except requests.exceptions.HTTPError as e:
-            error_details = ""
+        payload = {
+            "model": model,
+            "messages": raw_messages,
+            "max_tokens": config.RESPONSE_MAX_TOKENS,
+            "stream": self.stream and caps["streaming"] is not False
+        }
+        if native_tools:
+            payload["tools"] = native_tools
+            payload["tool_choice"] = "auto"
+        return payload
+
+    def _read_openai_stream(self, response, started):
+        """Assemble an OpenAI-style completion from SSE chunks, emitting tokens as they arrive."""
+        response.encoding = "utf-8"
+        ttft_ms = None
+        content = []
+        reasoning = []
+        tool_calls = {}
+        usage = None
+        for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
             try:
-                error_json = response.json()
-                error_details = f": {error_json.get('error', {}).get('message', str(error_json))}"
-            except:
-                error_details = f": {response.text[:200]}"
-            raise Exception(f"Online API error ({provider_name}): {e}{error_details}")
-        except Exception as e:
-            raise Exception(f"Online API error ({provider_name}): {str(e)}")
+                chunk = json.loads(data)
+            except ValueError:
+                continue
+            usage = chunk.get("usage") or usage
+            for choice in chunk.get("choices") or []:
+                delta = choice.get("delta") or {}
+                if ttft_ms is None and (delta.get("content") or delta.get("tool_calls") or delta.get("reasoning_content")):
+                    ttft_ms = round((time.monotonic() - started) * 1000)
+                if delta.get("content"):
+                    content.append(delta["content"])
+                    self._emit("token", text=delta["content"])
+                if delta.get("reasoning_content"):
+                    reasoning.append(delta["reasoning_content"])
+                # Tool calls arrive in fragments keyed by index; arguments are concatenated JSON
+                for tc in delta.get("tool_calls") or []:
+                    index = tc.get("index", len(tool_calls))
+                    call = tool_calls.setdefault(index, {
+                        "id": f"call_{index}",
+                        "type": "function",
+                        "function": {"name": "", "arguments": ""}
+                    })
+                    if tc.get("id"):
+                        call["id"] = tc["id"]
+                    function = tc.get("function") or {}
+                    call["function"]["name"] += function.get("name") or ""
+                    call["function"]["arguments"] += function.get("arguments") or ""
+
+        message = {
+            "role": "assistant",
+            "content": "".join(content),
+            "tool_calls": [tool_calls[i] for i in sorted(tool_calls)] or None
+        }
+        if reasoning:
+            message["reasoning_content"] = "".join(reasoning)
+        result = {"choices": [{"message": message}], "ttft_ms": ttft_ms}
+        if usage:
+            result["usage"] = usage
+        return result
+
+    def _convert_tools_to_anthropic(self, tools):
+        """OpenAI function schemas -> Anthropic tool definitions."""
+        converted = []
+        for tool in tools:
+            function = tool.get("function", tool)
+            converted.append({
+                "name": function["name"],
+                "description": function.get("description", ""),
+                "input_schema": function.get("parameters") or {"type": "object", "properties": {}}
+            })
+        return converted
 
     def _normalize_anthropic_response(self, data):
         """Convert Anthropic response to OpenAI-compatible format."""
@@ -290,7 +530,7 @@ class GokuEngine:
         cmd = [
             str(config.LLAMA_CPP_BIN),
             "-m", str(config.MODEL_PATH),
-            "-p", f"{self.SYSTEM_PROMPT}\nUser: {prompt}\nAssistant:",
+            "-p", f"{self.SYSTEM_PROMPT}\nCurrent time: {time.strftime('%A %d %B %Y, %H:%M')}\nUser: {prompt}\nAssistant:",
             "-n", "512",
             "--ctx-size", "2048"
         ]
@@ -341,6 +581,101 @@ class GokuEngine:
                      pass
             raise Exception(f"Offline error: {err_msg}")
 
+    def _run_llama(self, prompt, grammar_path, max_tokens=None):
+        """
+        Raw completion of a ChatML prompt by llama.cpp, constrained by a GBNF
+        grammar file. Returns None if this llama.cpp build doesn't take the flags.
+        """
+        if not config.LLAMA_CPP_BIN.exists():
+            raise FileNotFoundError("llama.cpp binary not found. Run 'goku setup' to install offline support.")
+        if not config.MODEL_PATH.exists():
+            raise FileNotFoundError("Model file not found. Run 'goku setup' to download the model.")
+        cmd = [
+            str(config.LLAMA_CPP_BIN),
+            "-m", str(config.MODEL_PATH),
+            "-p", prompt,
+            "-n", str(max_tokens or config.OFFLINE_MAX_TOKENS),
+            "--ctx-size", str(config.OFFLINE_CTX_SIZE),
+            "--temp", "0.2",
+            "--grammar-file", str(grammar_path),
+            "--no-display-prompt"
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+        if result.returncode != 0:
+            err_msg = result.stderr.strip()
+            if "invalid argument" in err_msg or "unknown argument" in err_msg:
+                return None
+            raise Exception(f"Offline error: {err_msg[-500:]}")
+        return result.stdout.replace("[end of text]", "").strip()
+
+    OFFLINE_TOOLS_PROMPT = """You are Goku, a helpful coding assistant running on the user's device.
+Current time: {time}
+
+Tools you can use:
+{tools}
+
+To use a tool, reply with only:
+<tool_call>
+{{"name": "tool_name", "arguments": {{"arg": "value"}}}}
+</tool_call>
+You then get its result and may call another tool. Answer in plain text when you have what you need or no tool is needed."""
+
+    async def _offline_tool_turn(self, prompt, status_obj=None):
+        """
+        Offline agent loop: each step the local model either answers or makes
+        one tool call, kept valid by a grammar built from the tool schemas
+        (grammar.py). Returns the answer, or None if llama.cpp can't take a grammar.
+        """
+        from . import grammar
+        from .tool_selector import LIST_MORE_TOOLS
+        tools = [t for t in self._tool_selector().select(prompt) if t["function"]["name"] != LIST_MORE_TOOLS]
+        system = self.OFFLINE_TOOLS_PROMPT.format(time=time.strftime("%A %d %B %Y, %H:%M"), tools=grammar.describe(tools))
+        conversation = f"<|im_start|>system\n{system}<|im_end|>\n"
+        for msg in self.history[-3:]:
+            if msg["role"] in ("user", "assistant"):
+                conversation += f"<|im_start|>{msg['role']}\n{msg['content']}<|im_end|>\n"
+        conversation += f"<|im_start|>user\n{prompt}<|im_end|>\n"
+
+        loop = asyncio.get_event_loop()
+        for step in range(1, config.OFFLINE_MAX_STEPS + 1):
+            self._emit("step", step=step, max_steps=config.OFFLINE_MAX_STEPS)
+            # The last step may only answer
+            grammar_path = grammar.grammar_file(tools if step < config.OFFLINE_MAX_STEPS else [])
+            with tracing.span("step", step=step):
+                with tracing.span("provider", provider="offline", model=config.DEFAULT_GGUF_MODEL) as span:
+                    started = time.monotonic()
+                    output = await loop.run_in_executor(
+                        None, self._run_llama, f"{conversation}<|im_start|>assistant\n", grammar_path
+                    )
+                    self._emit("response", latency_ms=round((time.monotonic() - started) * 1000))
+                    if output is None:
+                        return None
+                    call = grammar.parse_call(output)
+                    if call is None and output.startswith(grammar.TOOL_CALL_OPEN):
+                        # A call cut off by the token limit (e.g. create_file with a long file): once more with room
+                        span.set(retried=True)
+                        started = time.monotonic()
+                        output = await loop.run_in_executor(
+                            None, self._run_llama, f"{conversation}<|im_start|>assistant\n", grammar_path, config.OFFLINE_CTX_SIZE // 2
+                        )
+                        self._emit("response", latency_ms=round((time.monotonic() - started) * 1000))
+                        call = grammar.parse_call(output or "")
+                        if call is None:
+                            return "Error: the local model's tool call did not fit in its context."
+                if call is None:
+                    return output or "..."
+
+                name, args = call
+                result = await self._run_tool_call(f"call_{step}", name, args, status_obj)
+                result = str(result) if result else "Tool execution produced no output."
+                if len(result) > config.OFFLINE_TOOL_RESULT_MAX:
+                    result = result[:config.OFFLINE_TOOL_RESULT_MAX] + "\n[output truncated]"
+                conversation += (
+                    f"<|im_start|>assistant\n{output}<|im_end|>\n"
+                    f"<|im_start|>user\n<tool_response>\n{result}\n</tool_response><|im_end|>\n"
+                )
+        return output
+
     SYSTEM_PROMPT = """You are Goku, a powerful and friendly AI Coding Assistant.
 
 ### PERSONA:
@@ -365,22 +700,101 @@ Always prioritize clarity and correctness.
 
     async def generate_async(self, prompt, status_obj=None):
         """Async version of generate to support MCP."""
+        await self.wait_ready()
+        provider = self.provider or config.get_active_provider()
+        started = time.monotonic()
+        with tracing.span("turn", mode=self.mode, provider=provider if self.mode == "online" else "offline") as span:
+            route = self._route(prompt)
+            response = error = None
+            if route:
+                span.set(route=route)
+            if route == "local":
+                response = await self._local_turn(prompt)
+            if response is None:
+                with tracing.span("route", route="online") if route else contextlib.nullcontext():
+                    response, error = await self._generate_turn(prompt, status_obj)
+            if error:
+                span.set(error=True)
+        if self.cassette and not self.cassette.replaying:
+            self.cassette.record_turn(
+                prompt, response, error, (time.monotonic() - started) * 1000, mcp_tools=self.mcp_tools,
+                mode=self.mode, provider=provider, model=self.model or config.PROVIDERS.get(provider, {}).get("model"),
+                stream=self.stream
+            )
+        return response, error
+
+    def _route(self, prompt):
+        """"local" or "online" for this turn when routing applies, else None."""
+        if self.mode != "online" or not self.routing or self.cassette:
+            return None
+        from . import router
+        if not router.local_available():
+            return None
+        route, confidence, reason = router.classify(prompt, self.history)
+        self.last_route = (route, confidence, reason)
+        self._emit("route", route=route, confidence=confidence, reason=reason)
+        return route
+
+    async def _local_turn(self, prompt):
+        """A turn routed to the local model; None if its answer is unusable and the turn should go online."""
+        from . import router
+        with tracing.span("route", route="local") as span:
+            try:
+                response = await self._offline_response(prompt)
+            except Exception:
+                response = None
+            if router.needs_fallback(response):
+                # The time spent is counted as "fallback" in /stats and /route
+                span.set(route="fallback")
+                self.last_route = ("fallback",) + self.last_route[1:]
+                self._emit("route", route="online", reason="local answer unusable")
+                return None
+        self.history.append({"role": "user", "content": prompt})
+        self.history.append({"role": "assistant", "content": response})
+        return response
+
+    async def _offline_response(self, prompt):
+        """The local model's answer to prompt (history is not updated)."""
+        # Use a shorter history for offline to stay snappy
+        offline_history = self.history[-3:] # Only last 3 turns
+
+        # Wrap synchronous offline call
+        loop = asyncio.get_event_loop()
+        started = time.monotonic()
+        with tracing.span("provider", provider="offline", model=config.DEFAULT_GGUF_MODEL):
+            response = await loop.run_in_executor(None, self._get_offline_response, prompt, offline_history)
+        self._emit("response", latency_ms=round((time.monotonic() - started) * 1000))
+
+        # REPAIR: If model echoed its instructions (common in small offline models)
+        if "> You are Goku" in response:
+             response = response.split("### PERSONA:")[-1].split("### CRITICAL RULES:")[-1].strip()
+             # If still messy, try split by last known marker
+             if "Assistant:" in response:
+                  response = response.split("Assistant:")[-1].strip()
+        return response
+
+    async def _call_provider(self, api_messages, tools=None):
+        """One online request, inside the batch limiter (if any) and a provider span."""
+        provider = self.provider or config.get_active_provider()
+        model = self.model or config.PROVIDERS.get(provider, {}).get("model")
+        loop = asyncio.get_event_loop()
+        async with (self.limiter(provider) if self.limiter else contextlib.nullcontext()):
+            with tracing.span("provider", provider=provider, model=model, streaming=self.stream) as span:
+                started = time.monotonic()
+                res_json = await loop.run_in_executor(None, self._get_online_response, api_messages, tools)
+                span.set_usage(res_json.get("usage"))
+                span.set(ttft_ms=res_json.get("ttft_ms"))
+        self._emit("response", latency_ms=round((time.monotonic() - started) * 1000), usage=res_json.get("usage"))
+        return res_json
+
+    async def _generate_turn(self, prompt, status_obj=None):
+        step_span = parse_span = None
         try:
             if self.mode == "offline":
-                # Use a shorter history for offline to stay snappy
-                offline_history = self.history[-3:] # Only last 3 turns
-                
-                # Wrap synchronous offline call
-                loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(None, self._get_offline_response, prompt, offline_history)
-                
-                # REPAIR: If model echoed its instructions (common in small offline models)
-                if "> You are Goku" in response:
-                     response = response.split("### PERSONA:")[-1].split("### CRITICAL RULES:")[-1].strip()
-                     # If still messy, try split by last known marker
-                     if "Assistant:" in response:
-                          response = response.split("Assistant:")[-1].strip()
-                
+                response = await self._offline_tool_turn(prompt, status_obj)
+                if response is None:
+                    # llama.cpp build without grammar support: plain answer, no tools
+                    response = await self._offline_response(prompt)
                 self.history.append({"role": "user", "content": prompt})
                 self.history.append({"role": "assistant", "content": response})
                 return response, None
@@ -391,21 +805,38 @@ Always prioritize clarity and correctness.
             # Prepare this turn's ongoing messages (not yet in permanent history)
             turn_messages = []
             steps_taken = 0
+            # With many tools, offer those matching this and the previous request,
+            # the ones used recently and whatever list_more_tools unlocks
+            from .tool_selector import LIST_MORE_TOOLS
+            selector = self._tool_selector()
+            recent = self.history[-config.SESSION_MEMORY_MAX:]
+            query = " ".join([m["content"] for m in recent if m["role"] == "user"][-2:])
+            pinned = {tc["function"]["name"] for m in recent for tc in m.get("tool_calls") or []}
+            tools = tools_key = None
             MAX_STEPS = 10
             
             while steps_taken < MAX_STEPS:
                 steps_taken += 1
+                self._emit("step", step=steps_taken, max_steps=MAX_STEPS)
+                step_span = tracing.start_span("step", step=steps_taken)
 
                 # Construct combined messages for the API call
                 api_messages = [{"role": "system", "content": self.SYSTEM_PROMPT}]
                 api_messages += self.history[-config.SESSION_MEMORY_MAX:]
                 api_messages += turn_messages
+                if tools_key != len(pinned):
+                    tools = selector.select(query, pinned)
+                    tools_key = len(pinned)
+                    # Sent as schemas or described in the system prompt, at most both
+                    tools_chars = 2 * len(json.dumps(tools))
+                api_messages = self._fit_to_context(api_messages, tools_chars)
+                step_span.set(tools=len(tools))
 
                 # Call online API
-                loop = asyncio.get_event_loop()
-                res_json = await loop.run_in_executor(None, self._get_online_response, api_messages)
-                
+                res_json = await self._call_provider(api_messages, tools)
+
                 message = res_json["choices"][0]["message"]
+                parse_span = tracing.start_span("parse")
                 
                 # Check for and display thoughts/reasoning
                 thought = message.get("reasoning_content") or message.get("thought") or message.get("reasoning")
@@ -423,6 +854,8 @@ Always prioritize clarity and correctness.
                 
                 # Update UI with thought if present
                 from . import ui
+                if thought:
+                    self._emit("thought", text=thought)
                 if thought and status_obj:
                     ui.show_thought(status_obj, thought)
 
@@ -452,12 +885,13 @@ Always prioritize clarity and correctness.
                          json_match = code_block_match
                      else:
                          # Fallback: Capture any JSON array that looks like it has objects
-                         json_match = re.search(r'\[\s*\{.*?\}\s*\]', content_to_scan, re.DOTALL)
+                         json_match = re.search(r'(\[\s*\{.*?\}\s*\])', content_to_scan, re.DOTALL)
                      
                      if json_match:
                          try:
+                             # Parse the array itself; strip the whole match (fences included) from the text
                              potential_json = json_match.group(0)
-                             inferred_calls = json.loads(potential_json)
+                             inferred_calls = json.loads(json_match.group(1))
                              if isinstance(inferred_calls, list):
                                  normalized_calls = []
                                  for call in inferred_calls:
@@ -539,6 +973,9 @@ Always prioritize clarity and correctness.
                     
                     clean_msg["tool_calls"] = fixed_tool_calls
 
+                parse_span.set(tool_calls=len(clean_msg.get("tool_calls") or []))
+                parse_span.end()
+
                 # Add assistant message to the turn messages
                 turn_messages.append(clean_msg)
 
@@ -546,6 +983,7 @@ Always prioritize clarity and correctness.
                     final_text = content.strip() if content else "..."
                     # Turn complete! Save everything to permanent history
                     self.history.extend(turn_messages)
+                    step_span.end()
                     return final_text, None
                 
                 # Execute each tool call and append tool result
@@ -561,24 +999,15 @@ Always prioritize clarity and correctness.
                     except json.JSONDecodeError:
                         func_args = {}
                     
-                    from . import ui
-                    if status_obj:
-                        status_obj.stop()
-                    
-                    ui.show_tool_execution(func_name, func_args)
-                    
-                    # Tool execution routing
-                    if "__" in func_name:
-                        # MCP Tool
-                        server_name = func_name.split("__")[0]
-                        if server_name in self.mcp_clients:
-                            result = await self.mcp_clients[server_name].call_tool(func_name, func_args)
-                        else:
-                            result = f"Error: MCP server '{server_name}' not found."
-                    else:
-                        # Native Tool
-                        result = goku_tools.execute_tool(func_name, func_args)
-                    
+                    pinned.add(func_name)
+                    local = None
+                    if func_name == LIST_MORE_TOOLS:
+                        def local(args):
+                            unlocked, text = selector.more(str(args.get("query", "")), {t["function"]["name"] for t in tools})
+                            pinned.update(unlocked)
+                            return text
+                    result = await self._run_tool_call(tool_call["id"], func_name, func_args, status_obj, local)
+
                     # Tool response must be role: tool
                     turn_messages.append({
                         "role": "tool",
@@ -586,16 +1015,67 @@ Always prioritize clarity and correctness.
                         "name": func_name,
                         "content": str(result) if result else "Tool execution produced no output."
                     })
-                    
-                    if status_obj:
-                        status_obj.start()
-                        status_obj.update("[bold green]Thinking...")
+
+                step_span.end()
 
             return "Error: Maximum task steps reached. The task may be too complex or got stuck in a loop.", None
 
-        except Exception as e:
+        except BaseException as e:
+            # End the spans of the step that failed (provider or parsing error,
+            # Ctrl+C), so failed steps still show up in /stats; ended ones are untouched
+            for span in (parse_span, step_span):
+                if span is not None:
+                    span.end(error=repr(e))
+            if not isinstance(e, Exception):
+                raise
             return None, str(e)
 
+    async def _run_tool_call(self, call_id, func_name, func_args, status_obj=None, local=None):
+        """
+        Show, trace, execute (or replay) and record one tool call; returns its
+        output. local(args) answers tools that only exist inside the agent loop
+        (list_more_tools), which are not recorded.
+        """
+        from . import ui
+        # With the HUD on, the live display stays up to show the running tool
+        keep_live = getattr(status_obj, "hud", None) is not None
+        if status_obj and not keep_live:
+            status_obj.stop()
+
+        if self.show_ui:
+            ui.show_tool_execution(func_name, func_args)
+        self._emit("tool_call", id=call_id, name=func_name, args=func_args)
+        started = time.monotonic()
+
+        # Tool execution routing
+        with tracing.span("tool", tool=func_name, kind="mcp" if "__" in func_name else "native"):
+            if local:
+                result = local(func_args)
+            elif self.cassette and self.cassette.replaying:
+                result = await self.cassette.replay_tool(func_name, func_args)
+            elif "__" in func_name:
+                # MCP Tool
+                server_name = func_name.split("__")[0]
+                if self.mcp_supervisor:
+                    result = await self.mcp_supervisor.call_tool(server_name, func_name, func_args)
+                else:
+                    result = f"Error: MCP server '{server_name}' not found."
+            else:
+                # Native Tool
+                result = await goku_tools.execute_tool_async(func_name, func_args)
+        # Offline turns are not recorded, so neither are their tools
+        if self.cassette and not self.cassette.replaying and not local and self.mode == "online":
+            self.cassette.record_tool(func_name, func_args, result, (time.monotonic() - started) * 1000)
+
+        self._emit(
+            "tool_result", id=call_id, name=func_name, output=str(result),
+            duration_ms=round((time.monotonic() - started) * 1000)
+        )
+        if status_obj and not keep_live:
+            status_obj.start()
+            status_obj.update("[bold green]Thinking...")
+        return result
+
     def generate(self, prompt, status_obj=None):
         """Wrapper to run async generate in sync context if needed, but CLI should be async."""
         return asyncio.run(self.generate_async(prompt, status_obj))
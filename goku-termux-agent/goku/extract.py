@@ -0,0 +1,210 @@
+import io
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+# This module is shared by the goku package and the MCP servers (which import it
+# as a top-level module), so it must not import anything from goku itself.
+
+# Elements whose content is never readable text
+SKIP_TAGS = {"script", "style", "noscript", "svg", "template", "iframe", "canvas", "form", "button", "select"}
+# Page chrome that is dropped when the page has no <main>/<article>
+BOILERPLATE_TAGS = {"nav", "header", "footer", "aside"}
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "br", "tr", "table", "ul", "ol", "li",
+    "pre", "blockquote", "dd", "dt", "figcaption", "hr", "h1", "h2", "h3", "h4", "h5", "h6"
+}
+VOID_TAGS = {"br", "hr", "img", "input", "meta", "link", "area", "base", "col", "embed", "source", "track", "wbr"}
+BOILERPLATE_HINTS = re.compile(r"cookie|consent|banner|sidebar|share|social|subscribe|newsletter|breadcrumb|advert|promo|popup|modal", re.I)
+
+CHARS_PER_TOKEN = 4
+
+
+def sniff_content_type(content_type, head):
+    """Classify a response as html, pdf, text or binary from its header and first bytes."""
+    content_type = (content_type or "").lower()
+    start = head[:512].lstrip().lower()
+    if start.startswith(b"%pdf") or "application/pdf" in content_type:
+        return "pdf"
+    if "html" in content_type or start.startswith((b"<!doctype html", b"<html")):
+        return "html"
+    if content_type.startswith("text/") or "json" in content_type or "xml" in content_type:
+        return "text"
+    if not content_type or "octet-stream" in content_type:
+        # Unlabelled: treat it as text if it decodes cleanly
+        if b"\x00" not in start:
+            return "html" if b"<" in start and b">" in start else "text"
+    return "binary"
+
+
+def decode(data, encoding=None):
+    """Decode bytes using the declared charset, a <meta charset>, or UTF-8."""
+    if not encoding:
+        match = re.search(rb"""<meta[^>]+charset=["']?([\w-]+)""", data[:4096], re.I)
+        if match:
+            encoding = match.group(1).decode("ascii", "ignore")
+    try:
+        return data.decode(encoding or "utf-8", errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+
+class _TextExtractor(HTMLParser):
+    """Collects readable text, keeping headings, list items and links."""
+    def __init__(self, base_url=None, max_links=30):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.max_links = max_links
+        self.title = ""
+        self.parts = []          # whole-document text
+        self.main_parts = []     # text inside <main>/<article>
+        self.links = []
+        self._stack = []
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._in_title = False
+        self._href = None
+
+    def _emit(self, text):
+        if self._skip_depth:
+            return
+        self.parts.append(text)
+        if self._main_depth:
+            self.main_parts.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "title":
+            self._in_title = True
+        if tag in VOID_TAGS:
+            if tag in ("br", "hr"):
+                self._emit("\n")
+            return
+
+        hint = f"{attrs.get('class') or ''} {attrs.get('id') or ''} {attrs.get('role') or ''}"
+        skip = tag in SKIP_TAGS or tag in BOILERPLATE_TAGS or attrs.get("aria-hidden") == "true" \
+            or (tag in ("div", "section") and BOILERPLATE_HINTS.search(hint))
+        is_main = tag in ("main", "article") or attrs.get("role") == "main"
+        self._stack.append((tag, skip, is_main))
+        if skip:
+            self._skip_depth += 1
+        if is_main:
+            self._main_depth += 1
+
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self._emit("\n\n" + "#" * int(tag[1]) + " ")
+        elif tag == "li":
+            self._emit("\n- ")
+        elif tag in BLOCK_TAGS:
+            self._emit("\n\n" if tag in ("p", "pre", "blockquote", "table") else "\n")
+        elif tag == "a" and attrs.get("href") and not self._skip_depth:
+            href = attrs["href"]
+            if not href.startswith(("#", "javascript:", "mailto:")):
+                self._href = urljoin(self.base_url, href) if self.base_url else href
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        if tag in VOID_TAGS:
+            return
+        # Pop up to the matching tag to survive unclosed elements
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                for _tag, skip, is_main in self._stack[i:]:
+                    if skip:
+                        self._skip_depth -= 1
+                    if is_main:
+                        self._main_depth -= 1
+                del self._stack[i:]
+                break
+        if tag == "a" and self._href:
+            if len(self.links) < self.max_links and self._href not in self.links:
+                self.links.append(self._href)
+                self._emit(f" [{len(self.links)}]")
+            self._href = None
+        elif tag in BLOCK_TAGS and tag != "li":
+            self._emit("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+            return
+        self._emit(data)
+
+
+def _clean(text):
+    text = re.sub(r"[ \t\r\f\v]+", " ", text)
+    text = re.sub(r" *\n *", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    # Drop lines of lone punctuation/separators left behind by layouts
+    lines = [line for line in text.split("\n") if not re.fullmatch(r"[\s|·•\-–—]*[|·•]+[\s|·•\-–—]*", line)]
+    return "\n".join(lines).strip()
+
+
+def html_to_text(html, base_url=None):
+    """Readable text of an HTML page: main content, headings as markdown and numbered links."""
+    parser = _TextExtractor(base_url)
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass
+
+    main_text = _clean("".join(parser.main_parts))
+    text = main_text if len(main_text) >= 200 else _clean("".join(parser.parts))
+
+    out = []
+    title = " ".join(parser.title.split())
+    if title:
+        out.append(f"Title: {title}\n")
+    out.append(text)
+    # Only list the links whose markers survived in the chosen text
+    links = [(i, url) for i, url in enumerate(parser.links, 1) if f"[{i}]" in text]
+    if links:
+        out.append("\nLinks:\n" + "\n".join(f"[{i}] {url}" for i, url in links))
+    return "\n".join(out)
+
+
+def pdf_to_text(data):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return "[PDF document: install the `pypdf` package to extract its text]"
+    try:
+        reader = PdfReader(io.BytesIO(data))
+    except Exception as e:
+        return f"[PDF document could not be parsed: {e}]"
+    pages = []
+    for i, page in enumerate(reader.pages, 1):
+        try:
+            page_text = (page.extract_text() or "").strip()
+        except Exception:
+            continue
+        if page_text:
+            pages.append(f"## Page {i}\n{page_text}")
+    return _clean("\n\n".join(pages)) or "[PDF document without extractable text]"
+
+
+def extract_text(data, content_type=None, encoding=None, url=None):
+    """Turn a (possibly truncated) response body into readable text."""
+    kind = sniff_content_type(content_type, data)
+    if kind == "pdf":
+        return pdf_to_text(data)
+    if kind == "html":
+        return html_to_text(decode(data, encoding), base_url=url)
+    if kind == "text":
+        return _clean(decode(data, encoding))
+    return f"[Binary content ({content_type or 'unknown type'}), {len(data)} bytes not shown]"
+
+
+def truncate_to_budget(text, max_tokens):
+    """Cut text to roughly max_tokens, preferring a paragraph or line boundary."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n\n", 0, max_chars)
+    if cut < max_chars // 2:
+        cut = text.rfind("\n", 0, max_chars)
+    if cut < max_chars // 2:
+        cut = max_chars
+    return text[:cut].rstrip() + f"\n\n... [TRUNCATED: {len(text) - cut} more characters]"
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import re
+
+from . import config
+
+# llama.cpp GBNF grammars for offline tool calling. The local model may either
+# answer in plain text or emit exactly one call in Qwen's native format:
+#   <tool_call>
+#   {"name": "read_file", "arguments": {"path": "..."}}
+#   </tool_call>
+# where the name is one of the offered tools and the arguments match its JSON
+# schema (required properties first, in schema order), so every call parses.
+
+TOOL_CALL_OPEN = "<tool_call>"
+TOOL_CALL_CLOSE = "</tool_call>"
+NEWLINE = "\n"
+
+_BASE = r'''
+ws ::= " "?
+string ::= "\"" ( [^"\\\x7F\x00-\x1F] | "\\" ( ["\\/bfnrt] | "u" [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] ) )* "\""
+integer ::= "-"? ( "0" | [1-9] [0-9]* )
+number ::= integer ( "." [0-9]+ )? ( [eE] [-+]? [0-9]+ )?
+boolean ::= "true" | "false"
+null ::= "null"
+value ::= object | array | string | number | boolean | null
+object ::= "{" ws ( string ws ":" ws value ( ws "," ws string ws ":" ws value )* )? ws "}"
+array ::= "[" ws ( value ( ws "," ws value )* )? ws "]"
+'''
+
+_PRIMITIVES = {"string": "string", "integer": "integer", "number": "number", "boolean": "boolean", "null": "null"}
+
+_cache = {}
+
+
+class _Builder:
+    def __init__(self):
+        self.rules = {}
+
+    def add(self, name, body):
+        name = re.sub(r"[^a-zA-Z0-9-]+", "-", name).strip("-").lower() or "rule"
+        unique, n = name, 1
+        while unique in self.rules and self.rules[unique] != body:
+            n += 1
+            unique = f"{name}-{n}"
+        self.rules[unique] = body
+        return unique
+
+    def schema(self, schema, name):
+        """Rule name for a JSON schema (the subset tool schemas use; anything else is any value)."""
+        if not isinstance(schema, dict):
+            return "value"
+        if "const" in schema:
+            return self.add(f"{name}-const", _literal(schema["const"]))
+        if isinstance(schema.get("enum"), list) and schema["enum"]:
+            return self.add(f"{name}-enum", " | ".join(_literal(v) for v in schema["enum"]))
+        for key in ("anyOf", "oneOf"):
+            if isinstance(schema.get(key), list) and schema[key]:
+                options = [self.schema(s, f"{name}-{i}") for i, s in enumerate(schema[key])]
+                return self.add(f"{name}-any", " | ".join(options))
+        kind = schema.get("type")
+        if isinstance(kind, list):
+            options = [self.schema({**schema, "type": k}, f"{name}-{k}") for k in kind]
+            return self.add(f"{name}-types", " | ".join(options))
+        if kind in _PRIMITIVES:
+            return _PRIMITIVES[kind]
+        if kind == "array":
+            item = self.schema(schema.get("items"), f"{name}-item")
+            return self.add(f"{name}-array", f'"[" ws ( {item} ( ws "," ws {item} )* )? ws "]"')
+        if kind == "object" or "properties" in schema:
+            return self.object(schema, name)
+        return "value"
+
+    def object(self, schema, name):
+        properties = schema.get("properties") or {}
+        if not properties:
+            return "object"
+        required = [p for p in schema.get("required") or [] if p in properties]
+        optional = [p for p in properties if p not in required]
+        pairs = {p: f'{_literal(p)} ws ":" ws {self.schema(properties[p], f"{name}-{p}")}' for p in properties}
+        body = ' ws "," ws '.join(pairs[p] for p in required)
+        if optional:
+            # Any of the optional properties, in any order
+            rest = self.add(f"{name}-optional", " | ".join(f"( {pairs[p]} )" for p in optional))
+            body = f'{body} ( ws "," ws {rest} )*' if required else f"( {rest} ( ws \",\" ws {rest} )* )?"
+        return self.add(f"{name}-object", f'"{{" ws {body} ws "}}"')
+
+
+def _text(text):
+    """GBNF string literal matching text."""
+    return json.dumps(text)
+
+
+def _literal(value):
+    """GBNF string literal matching value's JSON encoding."""
+    return _text(json.dumps(value))
+
+
+def for_tools(tools):
+    """
+    GBNF text: a plain answer or one <tool_call> for one of tools
+    (OpenAI-style schemas); only a plain answer if tools is empty.
+    """
+    key = json.dumps(tools, sort_keys=True)
+    if key in _cache:
+        return _cache[key]
+    builder = _Builder()
+    calls = []
+    for tool in tools:
+        function = tool["function"]
+        args = builder.schema(function.get("parameters") or {"type": "object"}, f"{function['name']}-args")
+        calls.append(builder.add(
+            f"call-{function['name']}",
+            f'"{{" ws {_literal("name")} ws ":" ws {_literal(function["name"])} ws "," ws {_literal("arguments")} ws ":" ws {args} ws "}}"'
+        ))
+    lines = [
+        "root ::= call | answer" if calls else "root ::= answer",
+        # A plain answer can't start with "<" or whitespace, so it can't open a call the grammar doesn't check
+        "answer ::= [^<\\x00-\\x20] [^\\x00]*"
+    ]
+    if calls:
+        lines.append(f"call ::= {_text(TOOL_CALL_OPEN + NEWLINE)} ( {' | '.join(calls)} ) {_text(NEWLINE + TOOL_CALL_CLOSE)}")
+    lines += [f"{name} ::= {body}" for name, body in builder.rules.items()]
+    text = "\n".join(lines) + "\n" + _BASE.strip() + "\n"
+    _cache[key] = text
+    return text
+
+
+def grammar_file(tools):
+    """Path of a file holding for_tools(tools), written once per distinct tool set."""
+    text = for_tools(tools)
+    path = config.GRAMMAR_DIR / f"tools-{hashlib.sha1(text.encode()).hexdigest()[:12]}.gbnf"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(text)
+        tmp.replace(path)
+    return path
+
+
+def describe(tools):
+    """Compact tool list for the local model's prompt: `- name(arg: type, opt?: type): description`."""
+    lines = []
+    for tool in tools:
+        function = tool["function"]
+        parameters = function.get("parameters") or {}
+        required = parameters.get("required") or []
+        args = ", ".join(
+            f"{name}{'' if name in required else '?'}: {schema.get('type', 'any') if isinstance(schema, dict) else 'any'}"
+            for name, schema in (parameters.get("properties") or {}).items()
+        )
+        lines.append(f"- {function['name']}({args}): {function.get('description') or ''}".rstrip(": "))
+    return "\n".join(lines)
+
+
+def parse_call(text):
+    """(name, arguments) if text is a tool call, else None."""
+    text = text.strip()
+    if not (text.startswith(TOOL_CALL_OPEN) and text.endswith(TOOL_CALL_CLOSE)):
+        return None
+    try:
+        call = json.loads(text[len(TOOL_CALL_OPEN):-len(TOOL_CALL_CLOSE)])
+    except ValueError:
+        return None
+    if not isinstance(call, dict) or not isinstance(call.get("name"), str):
+        return None
+    arguments = call.get("arguments")
+    return call["name"], arguments if isinstance(arguments, dict) else {}
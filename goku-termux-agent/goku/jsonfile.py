@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Small JSON objects in ~/.goku shared by all sessions (model catalog,
+# capabilities). Reads are cached until the file changes on disk; writes
+# replace the file atomically, so a reader never sees half of one.
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def read(path):
+    """The file's object (shared, do not modify), or {} if it is missing or unreadable."""
+    path = str(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {}
+    key = (st.st_mtime_ns, st.st_size, st.st_ino)
+    with _lock:
+        cached = _cache.get(path)
+        if cached is None or cached[0] != key:
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            cached = _cache[path] = (key, data if isinstance(data, dict) else {})
+        return cached[1]
+
+
+@contextmanager
+def file_lock(lock_path):
+    """Advisory lock on lock_path, serialising read-modify-write cycles across goku processes."""
+    lock_path = Path(lock_path)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def write(path, data, indent=None):
+    """Replace path with data: written to a temp file and renamed over it, so readers never see a partial file."""
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.stem}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    with _lock:
+        _cache.pop(str(path), None)
+
+
+def update(path, key, value):
+    """Set one top-level key, keeping whatever other sessions wrote meanwhile."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with file_lock(path.with_name(path.name + ".lock")):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data[key] = value
+        write(path, data)
@@ -2,54 +2,97 @@ import os
 import asyncio
 import json
 import logging
+import random
+import time
+from contextlib import AsyncExitStack
 from typing import Dict, Any, List, Optional
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
+from . import tracing
+
 class MCPClient:
     """
     Client for connecting to Model Context Protocol (MCP) servers.
     Manages the connection and tool execution for a single server.
     """
-    def __init__(self, name: str, command: str, args: List[str], env: Optional[Dict[str, str]] = None):
+    def __init__(self, name: str, command: str, args: List[str], env: Optional[Dict[str, str]] = None,
+                 timeout: Optional[float] = None, max_concurrency: Optional[int] = None):
         self.name = name
         self.command = command
         self.args = args
         self.env = env or {}
+        self.timeout = timeout
         self.session: Optional[ClientSession] = None
-        self._exit_stack = None
         self.tools_cache = []
+        self._runner: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    @property
+    def is_connected(self) -> bool:
+        return self.session is not None and self._runner is not None and not self._runner.done()
 
-    async def connect(self):
-        """Connects to the MCP server via stdio."""
+    def _transport(self):
+        """Returns the async context manager yielding (read, write) streams."""
         server_params = StdioServerParameters(
             command=self.command,
             args=self.args,
             env={**os.environ, **self.env}
         )
-        
+        return stdio_client(server_params)
+
+    async def connect(self, verbose: bool = True):
+        """Connects to the MCP server."""
+        if self._runner and not self._runner.done():
+            await self.close()
+
+        # The transport contexts are entered and exited by a dedicated task: anyio
+        # cancel scopes must be closed by the task that opened them, otherwise
+        # closing from another task (e.g. on reload) leaks the subprocess.
+        self._stop = asyncio.Event()
+        ready = asyncio.get_running_loop().create_future()
+        self._runner = asyncio.create_task(self._run(ready, verbose))
+        return await ready
+
+    async def _run(self, ready, verbose):
         try:
-            # We need to manage the context manager manually to keep connection alive
-            from contextlib import AsyncExitStack
-            self._exit_stack = AsyncExitStack()
-            
-            read, write = await self._exit_stack.enter_async_context(stdio_client(server_params))
-            self.session = await self._exit_stack.enter_async_context(ClientSession(read, write))
-            await self.session.initialize()
-            
-            # Cache available tools
-            result = await self.session.list_tools()
-            self.tools_cache = result.tools
-            return True
+            async with AsyncExitStack() as stack:
+                # stdio/SSE yield (read, write); streamable HTTP adds a session-id getter
+                streams = await stack.enter_async_context(self._transport())
+                read, write = streams[0], streams[1]
+                session = await stack.enter_async_context(ClientSession(read, write))
+                await session.initialize()
+
+                # Cache available tools
+                result = await session.list_tools()
+                self.tools_cache = result.tools
+                self.session = session
+                ready.set_result(True)
+                await self._stop.wait()
         except Exception as e:
-            print(f"Failed to connect to MCP server '{self.name}': {e}")
+            if not ready.done() and verbose:
+                print(f"Failed to connect to MCP server '{self.name}': {e}")
+        finally:
+            self.session = None
+            if not ready.done():
+                ready.set_result(False)
+
+    async def ping(self, timeout: float = 10.0) -> bool:
+        """Checks that the server still answers requests."""
+        if not self.is_connected:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            return True
+        except Exception:
             return False
 
     async def list_tools_schema(self) -> List[Dict[str, Any]]:
         """Returns tools in OpenAI/HF function calling format."""
         if not self.session:
             return []
-            
+
         schemas = []
         for tool in self.tools_cache:
             schema = {
@@ -67,14 +110,14 @@ class MCPClient:
         """Calls a tool on the server."""
         if not self.session:
             return f"Error: MCP server '{self.name}' not connected."
-        
+
         # Remove namespace prefix if present
         actual_tool_name = tool_name
         if tool_name.startswith(f"{self.name}__"):
             actual_tool_name = tool_name[len(f"{self.name}__"):]
-            
+
         try:
-            result = await self.session.call_tool(actual_tool_name, arguments)
+            result = await self._call(actual_tool_name, arguments)
             # Format result content
             output = []
             for content in result.content:
@@ -84,12 +127,251 @@ class MCPClient:
                     output.append(f"[Image: {content.mimeType}]")
                 elif content.type == "resource":
                      output.append(f"[Resource: {content.uri}]")
-            
+
             return "\n".join(output)
+        except asyncio.TimeoutError:
+            return f"Error executing tool '{actual_tool_name}' on '{self.name}': timed out after {self.timeout}s"
         except Exception as e:
             return f"Error executing tool '{actual_tool_name}' on '{self.name}': {str(e)}"
 
+    async def _call(self, tool_name: str, arguments: Dict[str, Any]):
+        """Runs a call within the server's concurrency limit and request timeout."""
+        if self._semaphore is None:
+            return await asyncio.wait_for(self.session.call_tool(tool_name, arguments), self.timeout)
+        async with self._semaphore:
+            return await asyncio.wait_for(self.session.call_tool(tool_name, arguments), self.timeout)
+
+    async def close(self):
+        """Closes the connection and waits for the server process to exit."""
+        runner = self._runner
+        self._runner = None
+        if not runner:
+            return
+        if self._stop:
+            self._stop.set()
+        try:
+            await asyncio.wait_for(runner, timeout=5.0)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            runner.cancel()
+        except Exception:
+            pass
+
+
+class HTTPMCPClient(MCPClient):
+    """
+    Client for MCP servers reachable over HTTP (streamable HTTP or SSE), e.g. a
+    long-lived server on this device or another machine on the LAN. The HTTP
+    connection pool is kept alive for the lifetime of the session.
+    """
+    def __init__(self, name: str, url: str, transport: str = "http", headers: Optional[Dict[str, str]] = None,
+                 timeout: Optional[float] = 60.0, max_concurrency: Optional[int] = 4):
+        super().__init__(name, None, [], timeout=timeout, max_concurrency=max_concurrency)
+        self.url = url
+        self.transport = transport
+        self.headers = headers or {}
+        self.max_connections = max_concurrency or 4
+
+    def _http_client_factory(self, headers=None, timeout=None, auth=None):
+        import httpx
+        import importlib.util
+
+        return httpx.AsyncClient(
+            headers=headers,
+            timeout=timeout or httpx.Timeout(30.0, read=300.0),
+            auth=auth,
+            follow_redirects=True,
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(
+                max_connections=self.max_connections + 1, # +1 for the SSE stream
+                max_keepalive_connections=self.max_connections + 1,
+                keepalive_expiry=300.0
+            )
+        )
+
+    def _transport(self):
+        if self.transport == "sse":
+            from mcp.client.sse import sse_client
+            return sse_client(self.url, headers=self.headers, httpx_client_factory=self._http_client_factory)
+        from mcp.client.streamable_http import streamablehttp_client
+        return streamablehttp_client(self.url, headers=self.headers, httpx_client_factory=self._http_client_factory)
+
+
+def create_client(name: str, cfg: Dict[str, Any]) -> MCPClient:
+    """
+    Builds a client from an entry of config.MCP_SERVERS. Entries with a "url"
+    use HTTP ("transport": "http" or "sse", guessed from a trailing /sse);
+    the others spawn "command" over stdio.
+    """
+    timeout = cfg.get("timeout")
+    max_concurrency = cfg.get("max_concurrency")
+    if cfg.get("url"):
+        url = cfg["url"]
+        transport = cfg.get("transport") or ("sse" if url.rstrip("/").endswith("/sse") else "http")
+        return HTTPMCPClient(
+            name, url, transport=transport, headers=cfg.get("headers"),
+            timeout=timeout if timeout is not None else 60.0,
+            max_concurrency=max_concurrency if max_concurrency is not None else 4
+        )
+    return MCPClient(name, cfg.get("command"), cfg.get("args", []), cfg.get("env"),
+                     timeout=timeout, max_concurrency=max_concurrency)
+
+
+class MCPSupervisor:
+    """
+    Owns the MCP clients of a session: connects them, pings them periodically,
+    restarts crashed servers with exponential backoff and keeps a single,
+    de-duplicated tool catalog that is swapped atomically on reload.
+    """
+    def __init__(self, servers: Dict[str, Dict[str, Any]], ping_interval: float = 30.0,
+                 ping_timeout: float = 10.0, max_backoff: float = 60.0):
+        self.servers = dict(servers)
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.max_backoff = max_backoff
+        self.clients: Dict[str, MCPClient] = {}
+        self.tools: List[Dict[str, Any]] = []
+        self._failures: Dict[str, int] = {}
+        self._next_attempt: Dict[str, float] = {}
+        self._restarting: Dict[str, asyncio.Task] = {}
+        self._monitor: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def status(self, name: str) -> str:
+        client = self.clients.get(name)
+        if client and client.is_connected:
+            return "connected"
+        if name in self._restarting:
+            return "restarting"
+        return "disconnected"
+
+    async def start(self):
+        """Connect to all configured servers and start the health monitor."""
+        await self.reload(self.servers)
+        if self._monitor is None or self._monitor.done():
+            self._monitor = asyncio.create_task(self._monitor_loop())
+
+    async def reload(self, servers: Optional[Dict[str, Dict[str, Any]]] = None):
+        """Reconnect to the given servers, then swap clients and tools in one step."""
+        async with self._lock:
+            if servers is not None:
+                self.servers = dict(servers)
+
+            new_clients = {name: create_client(name, cfg) for name, cfg in self.servers.items()}
+            await asyncio.gather(*(c.connect() for c in new_clients.values()))
+
+            old_clients = self.clients
+            self.clients = new_clients
+            self._failures = {name: 0 for name in new_clients}
+            self._next_attempt = {}
+            self.tools = await self._build_tools()
+
+            for task in self._restarting.values():
+                task.cancel()
+            self._restarting = {}
+
+        for client in old_clients.values():
+            try:
+                await client.close()
+            except Exception:
+                pass
+
+    async def _build_tools(self) -> List[Dict[str, Any]]:
+        tools = []
+        for client in self.clients.values():
+            tools.extend(await client.list_tools_schema())
+        return tools
+
+    async def call_tool(self, server_name: str, tool_name: str, arguments: Dict[str, Any]) -> str:
+        client = self.clients.get(server_name)
+        if client is None:
+            return f"Error: MCP server '{server_name}' not found."
+
+        # A dead server gets one immediate restart attempt (outside its backoff
+        # window) before giving up on the call; one already running is joined
+        if not client.is_connected:
+            pending = self._restarting.get(server_name)
+            if pending is None and time.monotonic() >= self._next_attempt.get(server_name, 0):
+                pending = self._schedule_restart(server_name)
+            if pending is not None:
+                # wait() neither raises if a reload cancels the restart nor cancels it if we are
+                await asyncio.wait({pending})
+            client = self.clients.get(server_name)
+            if client is None or not client.is_connected:
+                return f"Error: MCP server '{server_name}' not connected."
+
+        with tracing.span("mcp", server=server_name, tool=tool_name, transport=getattr(client, "transport", "stdio")) as span:
+            result = await client.call_tool(tool_name, arguments)
+            if result.startswith("Error"):
+                span.set(error=True)
+        if result.startswith("Error executing tool") and not await client.ping(self.ping_timeout):
+            self._schedule_restart(server_name)
+        return result
+
+    def _schedule_restart(self, name: str) -> asyncio.Task:
+        """Restart name in the background, unless that is already happening; returns the restart task."""
+        if name in self._restarting:
+            return self._restarting[name]
+        task = asyncio.create_task(self._restart(name))
+        self._restarting[name] = task
+
+        def done(t):
+            # A reload may have replaced the registry meanwhile
+            if self._restarting.get(name) is t:
+                del self._restarting[name]
+
+        task.add_done_callback(done)
+        return task
+
+    async def _restart(self, name: str):
+        cfg = self.servers.get(name)
+        old = self.clients.get(name)
+        if cfg is None:
+            return
+        if old is not None:
+            await old.close()
+
+        client = create_client(name, cfg)
+        if await client.connect(verbose=False):
+            if self.clients.get(name) is not old:
+                # A reload replaced this server meanwhile; discard our copy
+                await client.close()
+                return
+            self.clients = {**self.clients, name: client}
+            self._failures[name] = 0
+            self._next_attempt.pop(name, None)
+            self.tools = await self._build_tools()
+        else:
+            failures = self._failures.get(name, 0) + 1
+            self._failures[name] = failures
+            delay = min(self.max_backoff, 2 ** failures) * random.uniform(0.8, 1.2)
+            self._next_attempt[name] = time.monotonic() + delay
+
+    async def _monitor_loop(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            if self._lock.locked():
+                continue
+            for name, client in list(self.clients.items()):
+                if name in self._restarting:
+                    continue
+                if client.is_connected and await client.ping(self.ping_timeout):
+                    continue
+                if time.monotonic() >= self._next_attempt.get(name, 0):
+                    logging.getLogger(__name__).info("Restarting MCP server '%s'", name)
+                    self._schedule_restart(name)
+
     async def close(self):
-        """Closes the connection."""
-        if self._exit_stack:
-            await self._exit_stack.aclose()
+        """Stop monitoring and close every client."""
+        if self._monitor:
+            self._monitor.cancel()
+            self._monitor = None
+        for task in self._restarting.values():
+            task.cancel()
+        self._restarting = {}
+        for client in self.clients.values():
+            try:
+                await client.close()
+            except Exception:
+                pass
+        self.clients = {}
+        self.tools = []
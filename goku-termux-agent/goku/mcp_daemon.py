@@ -0,0 +1,359 @@
+"""
+Shared MCP daemon.
+
+A single background process owns the MCP server subprocesses and serves every
+goku session over a Unix socket, so extra terminal tabs don't each spawn their
+own copy of every server. The wire protocol is newline-delimited JSON:
+
+    -> {"id": 1, "method": "call_tool", "params": {"server": ..., "tool": ..., "arguments": {...}}}
+    <- {"id": 1, "result": "..."}            or  {"id": 1, "error": "..."}
+
+Request ids are scoped to the connection (session). Tool calls are queued per
+session and served round-robin so one busy session can't starve the others.
+Run it in the foreground with `python -m goku.mcp_daemon`; sessions with
+`mcp_daemon` enabled in config start it on demand.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import itertools
+import subprocess
+from collections import deque
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from . import config
+from . import tracing
+
+# Tool results can be large; the default 64KiB line limit is too small
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+class MCPDaemon:
+    """Serves one MCPSupervisor to many sessions with fair scheduling."""
+    def __init__(self, socket_path: Path, idle_timeout: float = 300, max_concurrency: int = 4):
+        self.socket_path = Path(socket_path)
+        self.idle_timeout = idle_timeout
+        self.max_concurrency = max_concurrency
+        self.supervisor = None
+        self.sessions: Dict[int, asyncio.StreamWriter] = {}
+        self._session_ids = itertools.count(1)
+        self._write_locks: Dict[int, asyncio.Lock] = {}
+        self._queues: Dict[int, deque] = {}
+        self._ready: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._last_activity = time.monotonic()
+
+    async def serve(self):
+        from . import mcp_client
+
+        self.supervisor = mcp_client.MCPSupervisor(
+            config.load_mcp_servers(),
+            ping_interval=config.MCP_PING_INTERVAL,
+            ping_timeout=config.MCP_PING_TIMEOUT,
+            max_backoff=config.MCP_MAX_BACKOFF
+        )
+        await self.supervisor.start()
+
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        server = await asyncio.start_unix_server(self._handle_session, path=str(self.socket_path), limit=STREAM_LIMIT)
+        os.chmod(self.socket_path, 0o600)
+
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+        watchers = [asyncio.create_task(self._idle_watch()), asyncio.create_task(self._config_watch())]
+        try:
+            await self._stopping.wait()
+        finally:
+            server.close()
+            for task in workers + watchers:
+                task.cancel()
+            await self.supervisor.close()
+            try:
+                self.socket_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    async def _handle_session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session_id = next(self._session_ids)
+        self.sessions[session_id] = writer
+        self._write_locks[session_id] = asyncio.Lock()
+        self._last_activity = time.monotonic()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._last_activity = time.monotonic()
+
+                method = request.get("method")
+                if method == "call_tool":
+                    self._queues.setdefault(session_id, deque()).append(request)
+                    if session_id not in self._ready:
+                        self._ready.append(session_id)
+                    self._wakeup.set()
+                else:
+                    asyncio.create_task(self._dispatch(session_id, request))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            # Drop queued calls of a session that went away
+            self.sessions.pop(session_id, None)
+            self._write_locks.pop(session_id, None)
+            self._queues.pop(session_id, None)
+            if session_id in self._ready:
+                self._ready.remove(session_id)
+            self._last_activity = time.monotonic()
+            writer.close()
+
+    async def _worker(self):
+        while True:
+            while not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            session_id = self._ready.popleft()
+            queue = self._queues.get(session_id)
+            if not queue:
+                continue
+            request = queue.popleft()
+            if queue:
+                # Back of the line: the next worker serves another session first
+                self._ready.append(session_id)
+            await self._dispatch(session_id, request)
+
+    async def _dispatch(self, session_id: int, request: Dict[str, Any]):
+        params = request.get("params") or {}
+        method = request.get("method")
+        response = {"id": request.get("id")}
+        try:
+            if method == "hello":
+                response["result"] = {"session": session_id, "pid": os.getpid()}
+            elif method == "ping":
+                response["result"] = "pong"
+            elif method == "list_tools":
+                response["result"] = {
+                    "tools": self.supervisor.tools,
+                    "servers": {name: self.supervisor.status(name) for name in self.supervisor.clients}
+                }
+            elif method == "call_tool":
+                response["result"] = await self.supervisor.call_tool(
+                    params.get("server"), params.get("tool"), params.get("arguments") or {}
+                )
+            elif method == "reload":
+                await self.supervisor.reload(config.load_mcp_servers())
+                response["result"] = "ok"
+            else:
+                response["error"] = f"Unknown method '{method}'"
+        except Exception as e:
+            response["error"] = str(e)
+
+        writer = self.sessions.get(session_id)
+        lock = self._write_locks.get(session_id)
+        if writer is None or lock is None:
+            return
+        async with lock:
+            try:
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def _idle_watch(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 5))
+            busy = self.sessions or any(self._queues.values())
+            if not busy and time.monotonic() - self._last_activity >= self.idle_timeout:
+                self._stopping.set()
+                return
+
+    async def _config_watch(self):
+        # The daemon, not each of its sessions, follows mcp_servers edits, so one
+        # edit reconnects the shared servers once; a stat() per poll when unchanged
+        while True:
+            await asyncio.sleep(config.MCP_DAEMON_CONFIG_POLL)
+            servers = config.load_mcp_servers()
+            if servers != self.supervisor.servers:
+                try:
+                    await self.supervisor.reload(servers)
+                except Exception:
+                    pass
+
+
+class MCPDaemonClient:
+    """
+    Session-side stand-in for MCPSupervisor that forwards everything to the
+    shared daemon. It does not import `mcp`, so sessions using the daemon stay
+    light; the daemon is spawned on first use if it isn't running.
+    """
+    def __init__(self, socket_path: Path, spawn: bool = True, connect_timeout: float = 15.0):
+        self.socket_path = Path(socket_path)
+        self.spawn = spawn
+        self.connect_timeout = connect_timeout
+        self.session_id = None
+        self.tools: List[Dict[str, Any]] = []
+        self._servers: Dict[str, str] = {}
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def clients(self):
+        return dict(self._servers)
+
+    @property
+    def is_connected(self) -> bool:
+        return self._read_task is not None and not self._read_task.done()
+
+    def status(self, name: str) -> str:
+        return self._servers.get(name, "disconnected") if self.is_connected else "disconnected"
+
+    async def start(self):
+        """Connect to (or spawn) the daemon and fetch the shared tool catalog."""
+        if await self._ensure_connected():
+            await self._refresh()
+
+    # The daemon reloads by itself when config.json changes (MCPDaemon._config_watch)
+    watches_config = True
+
+    async def reload(self, servers=None):
+        """Ask the daemon to re-read its server config; affects every session."""
+        if await self._ensure_connected():
+            await self._request("reload")
+            await self._refresh()
+
+    async def _refresh(self):
+        result = await self._request("list_tools")
+        self._servers = result.get("servers", {})
+        self.tools = result.get("tools", [])
+
+    async def call_tool(self, server_name: str, tool_name: str, arguments: Dict[str, Any]) -> str:
+        with tracing.span("mcp", server=server_name, tool=tool_name, transport="daemon") as span:
+            if not await self._ensure_connected():
+                span.set(error=True)
+                return "Error: MCP daemon not reachable."
+            try:
+                return await self._request("call_tool", {"server": server_name, "tool": tool_name, "arguments": arguments})
+            except Exception as e:
+                span.set(error=True)
+                return f"Error executing tool '{tool_name}' via MCP daemon: {e}"
+
+    async def _ensure_connected(self) -> bool:
+        async with self._connect_lock:
+            if self.is_connected:
+                return True
+            if await self._open():
+                return True
+            if not self.spawn:
+                return False
+
+            _spawn_daemon()
+            deadline = time.monotonic() + self.connect_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.2)
+                if await self._open():
+                    return True
+            return False
+
+    async def _open(self) -> bool:
+        if not self.socket_path.exists():
+            return False
+        try:
+            self._reader, self._writer = await asyncio.open_unix_connection(str(self.socket_path), limit=STREAM_LIMIT)
+        except (ConnectionError, FileNotFoundError, OSError):
+            return False
+        self._read_task = asyncio.create_task(self._read_loop())
+        hello = await self._request("hello")
+        self.session_id = hello.get("session")
+        return True
+
+    async def _request(self, method: str, params: Optional[Dict[str, Any]] = None):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write((json.dumps({"id": request_id, "method": method, "params": params or {}}) + "\n").encode())
+            await self._writer.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._pending.get(response.get("id"))
+                if future is None or future.done():
+                    continue
+                if "error" in response:
+                    future.set_exception(RuntimeError(response["error"]))
+                else:
+                    future.set_result(response.get("result"))
+        except (ConnectionError, json.JSONDecodeError):
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("MCP daemon connection lost"))
+
+    async def close(self):
+        """Disconnect this session; the daemon stays up until it goes idle."""
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+        if self._read_task:
+            self._read_task.cancel()
+            self._read_task = None
+
+
+def _spawn_daemon():
+    """Start the daemon detached from this session's terminal."""
+    config.GOKU_DIR.mkdir(parents=True, exist_ok=True)
+    package_root = str(Path(__file__).resolve().parent.parent)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+    with open(config.MCP_DAEMON_LOG, "a") as log:
+        subprocess.Popen(
+            [sys.executable, "-m", "goku.mcp_daemon"],
+            stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+            env=env, start_new_session=True
+        )
+
+
+def main():
+    import fcntl
+
+    config.GOKU_DIR.mkdir(parents=True, exist_ok=True)
+    # Only one daemon per socket: sessions racing to spawn it lose here quietly
+    lock_file = open(f"{config.MCP_DAEMON_SOCKET}.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        print("MCP daemon already running.")
+        return
+
+    daemon = MCPDaemon(
+        config.MCP_DAEMON_SOCKET,
+        idle_timeout=config.MCP_DAEMON_IDLE_TIMEOUT,
+        max_concurrency=config.MCP_DAEMON_MAX_CONCURRENCY
+    )
+    try:
+        asyncio.run(daemon.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import json
+import sys
+import time
+
+from . import config
+
+# Exit codes: success, the model/provider failed, bad usage or setup
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="goku ask",
+        description="Answer one prompt and exit. Without a prompt argument, or with `-` among the arguments, stdin is read and appended to the prompt."
+    )
+    parser.add_argument("prompt", nargs="*", help="The prompt; `-` stands for stdin")
+    parser.add_argument("--json", action="store_true", help="Write JSON-lines events (tokens, tool calls, timings) to stdout")
+    parser.add_argument("--stream", action="store_true", help="Print the answer as it is generated")
+    parser.add_argument("--mcp", action="store_true", help="Connect MCP servers (only native tools are available otherwise)")
+    parser.add_argument("--offline", action="store_true", help="Use the local model")
+    parser.add_argument("--record", metavar="FILE", help="Save provider and tool traffic to a cassette for `goku replay`")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Report tool calls on stderr")
+    return parser.parse_args(argv)
+
+
+def _read_prompt(args):
+    # stdin is read for `-`, or for no prompt words when something is piped in;
+    # an interactive terminal without `-` gets the usage error instead of a hang
+    words = [w for w in args.prompt if w != "-"]
+    prompt = " ".join(words).strip()
+    if sys.stdin is not None and ("-" in args.prompt or (not words and not sys.stdin.isatty())):
+        piped = sys.stdin.read().strip()
+        if piped:
+            prompt = f"{prompt}\n\n{piped}" if prompt else piped
+    return prompt
+
+
+async def main(argv):
+    """`goku ask ...` / `... | goku -`: one prompt, no REPL. Returns the exit code."""
+    args = _parse_args(argv)
+    prompt = _read_prompt(args)
+    if not prompt:
+        print("goku ask: no prompt given (pass it as an argument or on stdin)", file=sys.stderr)
+        return EXIT_USAGE
+
+    started = time.monotonic()
+    streamed = []
+
+    def on_event(event):
+        event["elapsed_ms"] = round((time.monotonic() - started) * 1000)
+        if args.json:
+            sys.stdout.write(json.dumps(event, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+        elif event["event"] == "token" and args.stream:
+            streamed.append(event["text"])
+            sys.stdout.write(event["text"])
+            sys.stdout.flush()
+        elif event["event"] == "tool_call" and args.verbose:
+            print(f"[tool] {event['name']} {json.dumps(event['args'])}", file=sys.stderr)
+
+    from .engine import GokuEngine
+    engine = GokuEngine()
+    engine.show_ui = False
+    engine.stream = args.json or args.stream
+    engine.on_event = on_event
+    if args.offline:
+        engine.set_mode("offline")
+    if args.record:
+        from . import cassette
+        try:
+            engine.cassette = cassette.Cassette.record(args.record)
+        except OSError as e:
+            print(f"goku ask: cannot write {args.record}: {e}", file=sys.stderr)
+            return EXIT_USAGE
+
+    provider = config.get_active_provider()
+    if engine.mode == "online" and provider != "ollama" and not config.get_token(provider):
+        env_var = config.PROVIDERS.get(provider, {}).get("token_env")
+        message = f"No API key for {provider}. Set one with /token in goku or the {env_var} variable."
+        if args.json:
+            engine._emit("error", message=message)
+        else:
+            print(f"Error: {message}", file=sys.stderr)
+        return EXIT_USAGE
+
+    try:
+        if args.mcp:
+            await engine.initialize_mcp()
+        engine._emit("start", mode=engine.mode, provider=provider, model=config.PROVIDERS.get(provider, {}).get("model"))
+        response, error = await engine.generate_async(prompt)
+    finally:
+        await engine.close()
+
+    if error:
+        if args.json:
+            engine._emit("error", message=error)
+        else:
+            print(f"Error: {error}", file=sys.stderr)
+        return EXIT_ERROR
+
+    if args.json:
+        engine._emit("done", text=response)
+    elif streamed:
+        # The streamed text can include intermediate steps; end the line cleanly
+        sys.stdout.write("\n")
+    else:
+        print(response)
+    return EXIT_OK
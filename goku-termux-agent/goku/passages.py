@@ -0,0 +1,127 @@
+import math
+import re
+from collections import Counter
+
+# This module is shared by the goku package and the MCP servers (which import it
+# as a top-level module), so it must not import anything from goku itself.
+
+# numpy is imported on first use: it takes longer to import than most scoring
+# (and tokenize alone never needs it)
+np = False
+
+
+def _numpy():
+    global np
+    if np is False:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = None
+    return np
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which",
+    "who", "why", "with", "do", "does", "can", "i", "you", "me", "my"
+}
+WORD_RE = re.compile(r"\S+")
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def chunk(text, size=120, overlap=30):
+    """Split text into overlapping windows of `size` words, as (start, end) character offsets."""
+    words = [m.span() for m in WORD_RE.finditer(text)]
+    if not words:
+        return []
+    step = max(1, size - overlap)
+    spans = []
+    for i in range(0, len(words), step):
+        window = words[i:i + size]
+        spans.append((window[0][0], window[-1][1]))
+        if i + size >= len(words):
+            break
+    return spans
+
+
+class BM25:
+    """
+    Okapi BM25 over a fixed set of documents (lists of tokens). Scoring builds a
+    (documents x query terms) term-frequency matrix and evaluates it in one
+    vectorized expression when numpy is available (and vectorize is set), with a
+    pure Python fallback.
+    """
+    def __init__(self, docs, k1=1.5, b=0.75, vectorize=True):
+        self.k1 = k1
+        self.b = b
+        self.vectorize = vectorize
+        self.counts = [Counter(d) for d in docs]
+        self.lengths = [len(d) for d in docs]
+        self.avg_length = (sum(self.lengths) / len(docs)) if docs else 0.0
+        self.df = Counter()
+        for c in self.counts:
+            self.df.update(c.keys())
+
+    def idf(self, term):
+        n = len(self.counts)
+        df = self.df.get(term, 0)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def scores(self, query_tokens):
+        terms = list(dict.fromkeys(t for t in query_tokens if t in self.df))
+        if not terms or not self.counts:
+            return [0.0] * len(self.counts)
+        idf = [self.idf(t) for t in terms]
+        avg = self.avg_length or 1.0
+
+        np = _numpy() if self.vectorize else None
+        if np is not None:
+            tf = np.array([[c.get(t, 0) for t in terms] for c in self.counts], dtype=float)
+            norm = self.k1 * (1 - self.b + self.b * np.array(self.lengths, dtype=float) / avg)
+            weights = tf * (self.k1 + 1) / (tf + norm[:, None])
+            return (weights @ np.array(idf)).tolist()
+
+        scores = []
+        for c, length in zip(self.counts, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / avg)
+            score = 0.0
+            for t, w in zip(terms, idf):
+                f = c.get(t, 0)
+                if f:
+                    score += w * f * (self.k1 + 1) / (f + norm)
+            scores.append(score)
+        return scores
+
+
+def top_passages(text, query, max_tokens, size=120, overlap=30, chars_per_token=4):
+    """
+    The best-matching passages of `text` for `query` that fit in max_tokens,
+    returned in reading order as dicts with start, end, score and text.
+    """
+    spans = chunk(text, size, overlap)
+    if not spans:
+        return []
+    scores = BM25([tokenize(text[s:e]) for s, e in spans]).scores(tokenize(query))
+
+    budget = max_tokens * chars_per_token
+    chosen = []
+    for i in sorted(range(len(spans)), key=lambda i: scores[i], reverse=True):
+        if scores[i] <= 0:
+            break
+        start, end = spans[i]
+        # Overlapping windows would repeat text; keep the better-scoring one
+        if any(start < e and s < end for s, e, _score in chosen):
+            continue
+        if end - start > budget:
+            continue
+        chosen.append((start, end, scores[i]))
+        budget -= end - start
+
+    return [
+        {"start": s, "end": e, "score": round(score, 2), "text": text[s:e]}
+        for s, e, score in sorted(chosen)
+    ]
@@ -0,0 +1,79 @@
+import asyncio
+import email.utils
+import random
+import time
+
+# This module is shared by the goku package and the MCP servers (which import it
+# as a top-level module), so it must not import anything from goku itself.
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens per second, holding at most `burst`.
+    Callers wait for a token, or give up if the wait would exceed max_wait.
+    Usable from successive event loops (e.g. one asyncio.run per search_sync
+    call); the tokens carry over, the lock is per loop.
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = None
+        self._lock_loop = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill()
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0 if self.tokens >= 1 else float("inf")
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self, max_wait=None):
+        """Take a token, sleeping as needed. Returns False if that would take longer than max_wait."""
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop:
+            # An asyncio.Lock that was ever contended is bound to that loop
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        async with self._lock:
+            wait = self.wait_time()
+            if max_wait is not None and wait > max_wait:
+                return False
+            if wait > 0:
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= 1
+            return True
+
+    def penalize(self, seconds):
+        """Empty the bucket for `seconds`, e.g. after the server answered 429."""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0, retry_after=None):
+    """Delay before retry number `attempt` (0-based): Retry-After if given, else full-jitter exponential."""
+    if retry_after is not None:
+        return min(cap, retry_after)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,91 @@
+import re
+
+from . import config
+
+# Hybrid routing (/route on): in online mode, turns that look simple (small
+# talk, short questions, rewording text given inline) go to the local model,
+# and everything else online. A local answer that looks unsure or broken is
+# thrown away and the turn goes online after all.
+
+LOCAL = "local"
+ONLINE = "online"
+
+_CODE = re.compile(r"```|`[^`\n]+`|\b(?:def|class|import|return|function|const|SELECT|sudo|pip|npm)\b|[{};]\s*$|=>|\w+\(\)", re.MULTILINE)
+# Requests a tool (or a bigger model) is needed for
+_TOOL_WORDS = re.compile(
+    r"\b(?:file|files|folder|director(?:y|ies)|read|write|edit|create|delete|run|execute|install|command|shell|"
+    r"search|google|look up|browse|website|url|download|latest|news|today'?s|price|weather|repo|git|build|test|"
+    r"error|bug|debug|fix|code|script|implement|refactor|deploy)\b|https?://|~/|\./|/\w+/|\w\.(?:py|js|ts|json|md|txt|sh|toml|yaml|yml)\b",
+    re.IGNORECASE
+)
+_COMPLEX_WORDS = re.compile(
+    r"\b(?:explain|why|compare|difference|design|architecture|plan|analy[sz]e|step by step|in detail|pros and cons|"
+    r"optimi[sz]e|prove|calculate|solve|essay|review)\b",
+    re.IGNORECASE
+)
+_SMALL_TALK = re.compile(
+    r"^(?:hi|hello|hey|yo|thanks|thank you|thx|ty|ok|okay|cool|nice|great|awesome|bye|goodbye|good (?:morning|night|evening)|"
+    r"lol|haha|yes|no|sure|got it|how are you|who are you|what(?:'s| is) your name|what time is it|what(?:'s| is) the (?:time|date))\b",
+    re.IGNORECASE
+)
+_REWRITE_WORDS = re.compile(r"\b(?:rephrase|reword|rewrite|shorten|paraphrase|fix (?:the )?grammar|translate|summari[sz]e|simplify)\b", re.IGNORECASE)
+# Words that point back at earlier turns, which the local model doesn't see
+_REFERENCES = re.compile(r"\b(?:it|that|this|these|those|them|above|again|same|previous|earlier|more|continue)\b", re.IGNORECASE)
+# Local answers that should not be shown
+_UNSURE = re.compile(
+    r"i (?:don't|do not) know|i'?m not sure|i (?:can't|cannot|am unable to) (?:access|browse|check|run|see)|"
+    r"as an ai|real-time|<function|\"function\"\s*:|### (?:PERSONA|CRITICAL RULES)",
+    re.IGNORECASE
+)
+
+
+def local_available():
+    return config.LLAMA_CPP_BIN.exists() and config.MODEL_PATH.exists()
+
+
+def classify(prompt, history=()):
+    """
+    (route, confidence, reason) for a user turn: LOCAL only when at least
+    ROUTER_MIN_CONFIDENCE sure that the local model can answer it.
+    """
+    text = prompt.strip()
+    words = text.split()
+    if not words:
+        return ONLINE, 1.0, "empty"
+    if _CODE.search(text):
+        return ONLINE, 0.9, "code"
+    if len(words) > config.ROUTER_LOCAL_MAX_WORDS:
+        return ONLINE, 0.8, "long"
+
+    # "thanks!", "hi there"; but not "ok, now do it again"
+    match = _SMALL_TALK.match(text)
+    rest = text[match.end():] if match else ""
+    small_talk = bool(match) and len(rest.split()) <= 2 and not _REFERENCES.search(rest)
+    # "translate: ..." carries its own text; "translate that" needs the conversation
+    rewrite = bool(_REWRITE_WORDS.search(text)) and (":" in text or '"' in text or len(words) > 8)
+    if not rewrite and _TOOL_WORDS.search(text):
+        return ONLINE, 0.85, "needs tools"
+    if history and not small_talk and _REFERENCES.search(text):
+        return ONLINE, 0.75, "refers to earlier turns"
+
+    confidence = 0.5
+    if small_talk:
+        confidence += 0.4
+    if rewrite:
+        confidence += 0.3
+    if len(words) <= 8:
+        confidence += 0.2
+    if _COMPLEX_WORDS.search(text):
+        confidence -= 0.3
+    confidence = round(max(0.0, min(1.0, confidence)), 2)
+
+    reason = "small talk" if small_talk else "rewrite" if rewrite else "short" if len(words) <= 8 else "plain"
+    if confidence >= config.ROUTER_MIN_CONFIDENCE:
+        return LOCAL, confidence, reason
+    return ONLINE, round(1 - confidence, 2), "complex" if _COMPLEX_WORDS.search(text) else reason
+
+
+def needs_fallback(response):
+    """True if a local answer is empty, unsure or leaked prompt/tool syntax."""
+    text = (response or "").strip()
+    return len(text) < 2 or bool(_UNSURE.search(text))
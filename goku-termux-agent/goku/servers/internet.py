@@ -1,12 +1,16 @@
 import asyncio
 import json
-import httpx
 import os
 import sys
+import urllib.parse
 
 # Hack to import config from parent
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
+import extract
+import passages
+import web_cache
+import web_search
 
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
@@ -34,14 +38,40 @@ async def list_tools() -> list[types.Tool]:
         ),
         types.Tool(
             name="read_webpage",
-            description="Read the text content of a webpage.",
+            description="Read the text content of a webpage. Pass a query to get only the passages that answer it; each passage shows its character offset, and offset=N reads the page from there.",
             inputSchema={
                 "type": "object",
                 "properties": {
-                    "url": {"type": "string", "description": "URL to read"}
+                    "url": {"type": "string", "description": "URL to read"},
+                    "query": {"type": "string", "description": "Optional question; returns only the most relevant passages"},
+                    "offset": {"type": "integer", "description": "Character offset to start reading from"},
+                    "max_tokens": {"type": "integer", "description": "Approximate size limit of the returned text"}
                 },
                 "required": ["url"]
             }
+        ),
+        types.Tool(
+            name="read_webpages",
+            description="Read several webpages at once (e.g. the top search results). Faster than calling read_webpage repeatedly; pages that are too slow are skipped.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "urls": {"type": "array", "items": {"type": "string"}, "description": "URLs to read"},
+                    "query": {"type": "string", "description": "Optional question; only the parts of each page relevant to it are returned"},
+                    "max_tokens": {"type": "integer", "description": "Approximate size limit of the combined output"}
+                },
+                "required": ["urls"]
+            }
+        ),
+        types.Tool(
+            name="search_cache_stats",
+            description="Diagnostics: show web search and page cache statistics (entries, hits, misses). Pass clear=true to empty both caches.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "clear": {"type": "boolean", "description": "Empty the cache"}
+                }
+            }
         )
     ]
 
@@ -51,25 +81,9 @@ async def call_tool(name: str, arguments: dict) -> list[types.TextContent]:
         query = arguments.get("query")
         if not query:
             return [types.TextContent(type="text", text="Error: query required")]
-        
-        try:
-            # Use active provider
-            active_provider = config.get_active_search_provider()
-            
-            if active_provider == "brave":
-                results = await _search_brave(query)
-            elif active_provider == "google":
-                results = await _search_google(query)
-            elif active_provider == "bing":
-                results = await _search_bing(query)
-            elif active_provider == "duckduckgo":
-                results = await _search_ddg(query)
-            else:
-                results = f"Error: Unknown search provider '{active_provider}'"
-                
-            return [types.TextContent(type="text", text=results)]
-        except Exception as e:
-            return [types.TextContent(type="text", text=f"Search error: {e}")]
+
+        text = await web_search.search_text(query)
+        return [types.TextContent(type="text", text=text)]
 
     elif name == "read_webpage":
         url = arguments.get("url")
@@ -77,124 +91,261 @@ async def call_tool(name: str, arguments: dict) -> list[types.TextContent]:
             return [types.TextContent(type="text", text="Error: url required")]
         
         try:
-            # Basic fetch
-            async with httpx.AsyncClient(follow_redirects=True, timeout=10.0) as client:
-                resp = await client.get(url)
-                resp.raise_for_status()
-                # Simple text extraction (could use readability in future)
-                text = resp.text[:8000] # Limit size
-                return [types.TextContent(type="text", text=f"Source: {url}\n\n{text}")]
+            max_tokens = int(arguments.get("max_tokens") or config.WEBPAGE_MAX_TOKENS)
+            text = await _read_page(url)
+            if arguments.get("offset"):
+                text = _window(text, int(arguments["offset"]), max_tokens)
+            elif arguments.get("query"):
+                text = _focus(text, arguments["query"], max_tokens)
+            else:
+                text = extract.truncate_to_budget(text, max_tokens)
+            return [types.TextContent(type="text", text=f"Source: {url}\n\n{text}")]
         except Exception as e:
             return [types.TextContent(type="text", text=f"Fetch error: {e}")]
 
-    raise ValueError(f"Tool {name} not found")
+    elif name == "read_webpages":
+        urls = [u for u in (arguments.get("urls") or []) if isinstance(u, str) and u.strip()]
+        if not urls:
+            return [types.TextContent(type="text", text="Error: urls required")]
+        max_tokens = int(arguments.get("max_tokens") or config.WEBPAGES_MAX_TOKENS)
+        text = await _read_pages(urls[:config.WEBPAGES_MAX_URLS], arguments.get("query"), max_tokens)
+        return [types.TextContent(type="text", text=text)]
 
-async def _search_brave(query, count=5):
-    api_key = config.get_search_token("brave")
-    if not api_key:
-        return "Error: Brave Search API key not configured. Use `/token brave <key>`."
+    elif name == "search_cache_stats":
+        cache = web_search.get_search_cache()
+        pages = _get_page_cache()
+        if arguments.get("clear"):
+            cache.clear()
+            pages.clear()
+        stats = {"search": cache.stats(), "pages": pages.stats()}
+        return [types.TextContent(type="text", text=json.dumps(stats, indent=2))]
 
-    url = "https://api.search.brave.com/res/v1/web/search"
-    headers = {"X-Subscription-Token": api_key, "Accept": "application/json"}
-    params = {"q": query, "count": count}
+    raise ValueError(f"Tool {name} not found")
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, headers=headers, params=params)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        results = []
-        items = data.get("web", {}).get("results", [])
-        if not items:
-            return "No results found."
-
-        for item in items:
-            title = item.get("title", "No Title")
-            link = item.get("url", "")
-            snippet = item.get("description", "")
-            results.append(f"Title: {title}\nLink: {link}\nSnippet: {snippet}\n---")
-        return "\n".join(results)
-
-async def _search_google(query, count=5):
-    api_key = config.get_search_token("google")
-    if not api_key:
-        return "Error: Google API key not configured. Use `/token google <KEY>`."
-    
-    cx = None
-    if ":" in api_key:
-        parts = api_key.split(":")
-        api_key = parts[0]
-        cx = parts[1]
-    
-    if not cx:
-         return "Error: Google Search requires a Context ID (CX). Please set token as `API_KEY:CX_ID`."
-
-    url = "https://customsearch.googleapis.com/customsearch/v1"
-    params = {"key": api_key, "cx": cx, "q": query, "num": count}
-
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, params=params)
+async def _fetch(url, max_bytes, headers=None):
+    """
+    Stream a response body, stopping once max_bytes have arrived. Returns a dict
+    with status, body, content_type, encoding, url, truncated and the caching headers.
+    """
+    chunks = []
+    size = 0
+    truncated = False
+    async with web_search.get_client().stream("GET", url, headers=headers) as resp:
+        page = {
+            "status": resp.status_code,
+            "url": str(resp.url),
+            "etag": resp.headers.get("etag"),
+            "last_modified": resp.headers.get("last-modified"),
+            "cache_control": resp.headers.get("cache-control")
+        }
+        if resp.status_code == 304:
+            return page
         resp.raise_for_status()
-        data = resp.json()
-        
-        results = []
-        items = data.get("items", [])
-        if not items:
-            return "No results found."
-
-        for item in items:
-            title = item.get("title", "No Title")
-            link = item.get("link", "")
-            snippet = item.get("snippet", "")
-            results.append(f"Title: {title}\nLink: {link}\nSnippet: {snippet}\n---")
-        return "\n".join(results)
-
-async def _search_bing(query, count=5):
-    api_key = config.get_search_token("bing")
-    if not api_key:
-        return "Error: Bing API key not configured. Use `/token bing <key>`."
-        
-    url = "https://api.bing.microsoft.com/v7.0/search"
-    headers = {"Ocp-Apim-Subscription-Key": api_key}
-    params = {"q": query, "count": count}
+        async for chunk in resp.aiter_bytes():
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= max_bytes:
+                truncated = True
+                break
+        page.update(
+            body=b"".join(chunks)[:max_bytes],
+            content_type=resp.headers.get("content-type", ""),
+            encoding=resp.charset_encoding,
+            truncated=truncated
+        )
+        return page
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, headers=headers, params=params)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        results = []
-        items = data.get("webPages", {}).get("value", [])
-        
-        if not items:
-             return "No results found."
-        
-        for item in items:
-            title = item.get("name", "No Title")
-            link = item.get("url", "")
-            snippet = item.get("snippet", "")
-            results.append(f"Title: {title}\nLink: {link}\nSnippet: {snippet}\n---")
-        return "\n".join(results)
-
-async def _search_ddg(query, count=5):
-    # Use the duckduckgo_search library which is installed
-    from duckduckgo_search import DDGS
-    
-    def run_ddg():
-        with DDGS() as ddgs:
-            results = list(ddgs.text(query, max_results=count))
-            formatted = []
-            for r in results:
-                formatted.append(f"Title: {r['title']}\nLink: {r['href']}\nSnippet: {r['body']}\n---")
-            if not formatted:
-                return "No results found."
-            return "\n".join(formatted)
-
-    return await asyncio.to_thread(run_ddg)
+_page_cache = None
+
+def _get_page_cache():
+    global _page_cache
+    if _page_cache is None:
+        _page_cache = web_cache.PageCache(
+            config.SEARCH_CACHE_PATH,
+            default_ttl=config.PAGE_CACHE_TTL,
+            max_entries=config.PAGE_CACHE_MAX_ENTRIES
+        )
+    return _page_cache
+
+async def _read_page(url):
+    """
+    Readable text of a page. Fresh cached copies are returned directly; stale
+    ones are revalidated with a conditional request so an unchanged page costs
+    a 304 instead of a download and re-extraction.
+    """
+    cache = _get_page_cache()
+    cached = cache.get(url)
+    if cached and cached["fresh"]:
+        cache.hits += 1
+        return cached["text"]
+
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    try:
+        page = await _fetch(url, config.WEBPAGE_MAX_BYTES, headers=headers)
+    except Exception:
+        if cached:
+            # Offline or server down: the last copy beats nothing
+            return cached["text"]
+        raise
+
+    max_age = cache.max_age_for(page["cache_control"])
+    if page["status"] == 304 and cached:
+        cache.revalidated += 1
+        cache.touch(url, max_age)
+        return cached["text"]
+
+    cache.misses += 1
+    text = await asyncio.to_thread(extract.extract_text, page["body"], page["content_type"], page["encoding"], page["url"])
+    if page["truncated"]:
+        text += f"\n\n[Download stopped after {config.WEBPAGE_MAX_BYTES // 1024} KB]"
+    if page["etag"] or page["last_modified"] or max_age:
+        cache.put(url, text, page["etag"], page["last_modified"], max_age)
+    return text
+
+_fetch_slots = None
+# host -> [semaphore, fetches holding or waiting for it]; dropped when that reaches 0
+_host_slots = {}
+
+async def _read_page_limited(url, timeout=None):
+    """
+    _read_page within the global and per-host concurrency limits. The timeout
+    starts once both slots are held, so queued pages are not timed out unread.
+    """
+    global _fetch_slots
+    if _fetch_slots is None:
+        _fetch_slots = asyncio.Semaphore(config.WEBPAGE_CONCURRENCY)
+    host = urllib.parse.urlsplit(url).netloc.lower()
+    slot = _host_slots.setdefault(host, [asyncio.Semaphore(config.WEBPAGE_PER_HOST_CONCURRENCY), 0])
+    slot[1] += 1
+    try:
+        async with slot[0]:
+            async with _fetch_slots:
+                return await asyncio.wait_for(_read_page(url), timeout)
+    finally:
+        slot[1] -= 1
+        if slot[1] == 0:
+            del _host_slots[host]
+
+def _focus(text, query, max_tokens):
+    """The passages that best answer the query (BM25), labelled with their offsets."""
+    if len(text) <= max_tokens * extract.CHARS_PER_TOKEN:
+        return text
+    found = passages.top_passages(text, query, max_tokens, chars_per_token=extract.CHARS_PER_TOKEN)
+    if not found:
+        return extract.truncate_to_budget(text, max_tokens)
+    sections = [f"[chars {p['start']}-{p['end']} of {len(text)}]\n{p['text']}" for p in found]
+    return "\n\n".join(sections) + "\n\n(Use offset=<start> to read around a passage.)"
+
+def _window(text, offset, max_tokens):
+    """The slice of text starting at offset (snapped back to a line start)."""
+    offset = max(0, min(offset, len(text)))
+    line_start = text.rfind("\n", 0, offset) + 1
+    if offset - line_start < 200:
+        offset = line_start
+    end = min(len(text), offset + max_tokens * extract.CHARS_PER_TOKEN)
+    return f"[chars {offset}-{end} of {len(text)}]\n{text[offset:end]}"
+
+async def _read_pages(urls, query, max_tokens):
+    """
+    Fetch pages concurrently, each with its own deadline, and combine them into
+    one budgeted answer. Slow or failing pages are reported instead of failing
+    the whole call.
+    """
+    async def one(url):
+        try:
+            return await _read_page_limited(url, config.WEBPAGE_URL_TIMEOUT), None
+        except asyncio.TimeoutError:
+            return None, f"timed out after {config.WEBPAGE_URL_TIMEOUT}s"
+        except Exception as e:
+            return None, str(e)
+
+    results = await asyncio.gather(*(one(url) for url in urls))
+
+    # Split the budget evenly; what short pages don't use goes to the longer ones
+    ok = [text for text, _err in results if text is not None]
+    remaining = max_tokens
+    budgets = {}
+    for i, text in sorted(enumerate(ok), key=lambda item: len(item[1])):
+        share = remaining // (len(ok) - len(budgets))
+        budgets[i] = min(share, len(text) // extract.CHARS_PER_TOKEN + 1)
+        remaining -= budgets[i]
+
+    sections = []
+    k = 0
+    for n, (url, (text, err)) in enumerate(zip(urls, results), 1):
+        if text is None:
+            sections.append(f"### [{n}] {url}\n[Fetch error: {err}]")
+            continue
+        budget = budgets[k]
+        k += 1
+        body = _focus(text, query, budget) if query else extract.truncate_to_budget(text, budget)
+        sections.append(f"### [{n}] {url}\n{body}")
+    return "\n\n".join(sections)
+
+async def _serve_http(transport, host, port):
+    """Serve over streamable HTTP (/mcp) or SSE (/sse) as a long-lived process."""
+    import contextlib
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import Response
+    from starlette.routing import Mount, Route
+
+    if transport == "sse":
+        from mcp.server.sse import SseServerTransport
+        sse = SseServerTransport("/messages/")
+
+        async def handle_sse(request):
+            async with sse.connect_sse(request.scope, request.receive, request._send) as streams:
+                await app.run(streams[0], streams[1], app.create_initialization_options())
+            return Response()
+
+        starlette_app = Starlette(routes=[
+            Route("/sse", endpoint=handle_sse, methods=["GET"]),
+            Mount("/messages/", app=sse.handle_post_message)
+        ])
+    else:
+        from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+        session_manager = StreamableHTTPSessionManager(app=app, stateless=True)
+
+        async def handle_streamable_http(scope, receive, send):
+            await session_manager.handle_request(scope, receive, send)
+
+        @contextlib.asynccontextmanager
+        async def lifespan(_app):
+            async with session_manager.run():
+                yield
+
+        starlette_app = Starlette(routes=[Mount("/mcp", app=handle_streamable_http)], lifespan=lifespan)
+
+    server = uvicorn.Server(uvicorn.Config(starlette_app, host=host, port=port, log_level="warning"))
+    await server.serve()
 
 async def main():
-    async with stdio_server() as (read_stream, write_stream):
-        await app.run(read_stream, write_stream, app.create_initialization_options())
+    import argparse
+    parser = argparse.ArgumentParser(description="Goku internet MCP server")
+    parser.add_argument("--transport", choices=["stdio", "http", "sse"], default="stdio")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if config.SEARCH_PREWARM:
+        asyncio.create_task(web_search.prewarm())
+
+    try:
+        if args.transport != "stdio":
+            await _serve_http(args.transport, args.host, args.port)
+            return
+
+        async with stdio_server() as (read_stream, write_stream):
+            await app.run(read_stream, write_stream, app.create_initialization_options())
+    finally:
+        await web_search.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
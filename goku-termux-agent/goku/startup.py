@@ -0,0 +1,106 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from . import config
+from . import ui
+
+# Imported on first use; any of them on the startup path costs a phone 100 ms-1 s
+DEFERRED = ("mcp", "langchain_core", "langchain", "requests", "numpy", "rich.markdown")
+
+# What `goku` does before showing the first prompt, minus the terminal itself
+_PROBE = """
+import json
+import sys
+import time
+start = time.perf_counter()
+from goku import cli, config
+from goku.engine import GokuEngine
+try:
+    import prompt_toolkit
+except ImportError:
+    pass
+GokuEngine()
+config.get_active_provider()
+config.get_token()
+elapsed = round((time.perf_counter() - start) * 1000, 1)
+print(json.dumps([name for name in %r if name in sys.modules]))
+print(elapsed)
+""" % (DEFERRED,)
+
+
+def _parse_importtime(stderr):
+    """Self time (ms) per top-level package from `python -X importtime` output."""
+    totals = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, _cumulative, name = line[len("import time:"):].split("|", 2)
+            totals[name.strip().split(".")[0]] += int(self_us) / 1000
+        except ValueError:
+            continue
+    return totals
+
+
+def _run_probe():
+    env = dict(os.environ)
+    root = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in [root, env.get("PYTHONPATH")] if p)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        capture_output=True, text=True, env=env, stdin=subprocess.DEVNULL
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "probe failed")
+    lines = proc.stdout.strip().splitlines()
+    return wall_ms, float(lines[-1]), _parse_importtime(proc.stderr), json.loads(lines[-2])
+
+
+def measure(runs=3):
+    """
+    Run goku's startup path in fresh interpreters: (median time-to-prompt in ms,
+    in-process ms and import self times of the last run, DEFERRED modules that
+    were imported). Raises RuntimeError if startup fails.
+    """
+    results = [_run_probe() for _ in range(runs)]
+    # The last run has the warmest disk cache; it shows the import cost itself
+    _wall, in_process_ms, imports, eager = results[-1]
+    return statistics.median(r[0] for r in results), in_process_ms, imports, eager
+
+
+def profile(budget_ms=None, runs=3, top=15):
+    """
+    Start goku's startup path in fresh interpreters, print where the time goes
+    and return an exit code: 0 within budget, 1 over it or if a DEFERRED module
+    was imported before the prompt, 2 if startup failed.
+    """
+    budget_ms = budget_ms or config.STARTUP_BUDGET_MS
+    try:
+        wall_ms, in_process_ms, imports, eager = measure(runs)
+    except Exception as e:
+        ui.show_error(f"Startup probe failed: {e}")
+        return 2
+
+    ui.console.print("[bold]Import time by package[/bold] [dim](python -X importtime, self time)[/dim]")
+    for name, ms in sorted(imports.items(), key=lambda item: item[1], reverse=True)[:top]:
+        ui.console.print(f"  {name:<24} {ms:8.1f} ms")
+    ui.console.print(f"  {'all imports':<24} {sum(imports.values()):8.1f} ms")
+    ui.console.print(f"  {'in-process to prompt':<24} {in_process_ms:8.1f} ms")
+
+    over = wall_ms > budget_ms
+    color = "red" if over else "green"
+    ui.console.print(
+        f"\n[bold]Time to prompt:[/bold] [{color}]{wall_ms:.0f} ms[/{color}] "
+        f"(median of {runs}, incl. interpreter start; budget {budget_ms:.0f} ms)"
+    )
+    if eager:
+        ui.console.print(f"[red]Imported before the prompt (should load on first use): {', '.join(eager)}[/red]")
+    return 1 if over or eager else 0
@@ -0,0 +1,134 @@
+import re
+
+from . import config
+from .passages import BM25, tokenize
+
+# With several MCP servers connected, sending every schema on every step costs
+# thousands of prompt tokens. Past TOOL_SELECT_MIN_TOOLS tools, a turn is offered
+# the built-in tools, the best BM25 matches for the request, the tools used
+# recently and list_more_tools, which unlocks the rest by keyword. Schemas are
+# minified either way.
+
+LIST_MORE_TOOLS = "list_more_tools"
+
+LIST_MORE_TOOLS_SCHEMA = {
+    "type": "function",
+    "function": {
+        "name": LIST_MORE_TOOLS,
+        "description": "Find tools that are not listed here. Call it when none of the listed tools fits; the tools it returns can be called next.",
+        "parameters": {
+            "type": "object",
+            "properties": {"query": {"type": "string", "description": "Keywords for what the tool should do."}},
+            "required": ["query"]
+        }
+    }
+}
+
+# Schema keys models don't need
+_DROP_KEYS = {"title", "$schema", "examples"}
+# Where a docstring-style description starts repeating the parameters
+_DOC_SECTION = re.compile(r"\n\s*(?:Args|Arguments|Parameters|Params|Returns|Raises|Example|Examples):", re.IGNORECASE)
+_CAMEL = re.compile(r"([a-z0-9])([A-Z])")
+
+
+def _terms(text):
+    # "github__list_pull_requests", "getFileContents": split names into words;
+    # plurals folded so "files" finds "file"
+    words = tokenize(_CAMEL.sub(r"\1 \2", text or "").replace("_", " "))
+    return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words]
+
+
+def _shorten(text, limit):
+    """Whitespace collapsed, cut after the last whole sentence within limit."""
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    cut = max(text.rfind(end, 0, limit) for end in (". ", "! ", "? "))
+    return text[:cut + 1] if cut > 0 else text[:limit - 1].rstrip() + "…"
+
+
+def _minify_schema(node, name=None):
+    if isinstance(node, list):
+        return [_minify_schema(n) for n in node]
+    if not isinstance(node, dict):
+        return node
+    out = {}
+    for key, value in node.items():
+        if key in _DROP_KEYS or (key == "default" and value is None):
+            continue
+        if key == "properties" and isinstance(value, dict):
+            out[key] = {prop: _minify_schema(schema, prop) for prop, schema in value.items()}
+        elif key == "description" and isinstance(value, str):
+            value = _shorten(value, config.TOOL_ARG_DESCRIPTION_MAX)
+            # "query": "The query" says nothing the name doesn't
+            if value and (name is None or not set(_terms(value)) <= set(_terms(name))):
+                out[key] = value
+        else:
+            out[key] = _minify_schema(value)
+    return out
+
+
+def minify(tool):
+    """A smaller copy of an OpenAI-style tool schema."""
+    function = tool["function"]
+    description = _DOC_SECTION.split(function.get("description") or "")[0].split("\n\n")[0]
+    return {
+        "type": "function",
+        "function": {
+            "name": function["name"],
+            "description": _shorten(description, config.TOOL_DESCRIPTION_MAX),
+            "parameters": _minify_schema(function.get("parameters") or {"type": "object", "properties": {}})
+        }
+    }
+
+
+class ToolSelector:
+    """
+    Ranks one set of tools against requests; build a new one when the set
+    changes. `always` names tools that are offered every turn.
+    """
+    def __init__(self, tools, always=()):
+        self.tools = [minify(t) for t in tools]
+        self.names = [t["function"]["name"] for t in self.tools]
+        self.always = set(always)
+        docs = []
+        for t in self.tools:
+            function = t["function"]
+            params = function["parameters"].get("properties") or {}
+            # The name counts twice: it is the most specific text a tool has
+            docs.append(_terms(function["name"]) * 2 + _terms(function["description"]) + _terms(" ".join(params)))
+        # A few hundred short documents: pure Python scores them faster than numpy imports
+        self.index = BM25(docs, vectorize=False)
+
+    @property
+    def selective(self):
+        return len(self.tools) > config.TOOL_SELECT_MIN_TOOLS
+
+    def rank(self, query):
+        """Indexes of the tools matching query, best first."""
+        scores = self.index.scores(_terms(query))
+        return [i for i in sorted(range(len(scores)), key=lambda i: scores[i], reverse=True) if scores[i] > 0]
+
+    def select(self, query, pinned=()):
+        """The (minified) tools to offer for query, plus list_more_tools when some are left out."""
+        if not self.selective:
+            return list(self.tools)
+        chosen = {i for i, name in enumerate(self.names) if name in self.always or name in pinned}
+        chosen.update(self.rank(query)[:config.TOOL_SELECT_TOP_K])
+        # Original order, so the prompt prefix stays the same when a tool is added
+        return [self.tools[i] for i in sorted(chosen)] + [LIST_MORE_TOOLS_SCHEMA]
+
+    def more(self, query, offered):
+        """
+        list_more_tools: (names, text) of the best matches for query among the
+        tools not in offered; all of their names when nothing matches.
+        """
+        hidden = [i for i, name in enumerate(self.names) if name not in offered]
+        if not hidden:
+            return [], "All tools are already listed."
+        matches = [i for i in self.rank(query) if self.names[i] not in offered][:config.TOOL_SELECT_TOP_K]
+        if not matches:
+            names = ", ".join(self.names[i] for i in hidden)
+            return [], f"No tool matches '{query}'. Other tools (call {LIST_MORE_TOOLS} with one of these names to use it): {names}"
+        lines = [f"- {self.names[i]}: {self.tools[i]['function']['description']}" for i in matches]
+        return [self.names[i] for i in matches], "These tools can now be called:\n" + "\n".join(lines)
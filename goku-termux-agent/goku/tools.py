@@ -100,29 +100,16 @@ def search_code(directory, query):
 def search_web(query):
     """Searches the web using the active search provider (Brave, Google, Bing, or DuckDuckGo)."""
     try:
-        from . import config
-        active_provider = config.get_active_search_provider()
-        
-        if active_provider == "duckduckgo":
-            import warnings
-            with warnings.catch_warnings():
-                warnings.filterwarnings("ignore", category=RuntimeWarning)
-                from duckduckgo_search import DDGS
-                with DDGS() as ddgs:
-                    results = list(ddgs.text(query, max_results=5))
-                    if not results:
-                        return "No results found."
-                    formatted = []
-                    for r in results:
-                        formatted.append(f"Title: {r['title']}\nLink: {r['href']}\nSnippet: {r['body']}\n---")
-                    return "\n".join(formatted)
-        
-        # For other providers, we'll use the logic already in internet.py or similar
-        # To avoid circular imports, we'll just check if it's Brave/Google/Bing and return a message
-        # or mejor: implement a unified search function in a new module. 
-        # For now, let's keep it simple: if it's not DDG, guide the model to use the MCP tool.
-        return f"Please use the 'internet__search_web' tool for {active_provider} search. I am the legacy DuckDuckGo tool."
+        from . import web_search
+        return web_search.search_sync(query)
+    except Exception as e:
+        return f"Error searching web: {e}"
 
+async def search_web_async(query):
+    """search_web for callers already running an event loop (shares its HTTP client and caches)."""
+    try:
+        from . import web_search
+        return await web_search.search_text(query)
     except Exception as e:
         return f"Error searching web: {e}"
 
@@ -262,3 +249,10 @@ def execute_tool(name, args, permission_callback=None):
     elif name == "search_web":
         return search_web(args.get("query"))
     return f"Tool {name} not found."
+
+async def execute_tool_async(name, args):
+    """Async dispatcher: search runs on the event loop, blocking tools in a worker thread."""
+    if name == "search_web":
+        return await search_web_async((args or {}).get("query"))
+    import asyncio
+    return await asyncio.to_thread(execute_tool, name, args)
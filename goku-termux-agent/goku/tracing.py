@@ -0,0 +1,209 @@
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from . import config
+
+# Spans of the current turn: turn > step > provider / parse / tool > mcp.
+# Durations are kept in memory for /stats; finished traces can also be appended
+# to a file, either one span per JSON line or in the OTLP/JSON file format.
+
+_current = contextvars.ContextVar("goku_span", default=None)
+
+# Which attribute names the /stats row for each span name
+STATS_KEYS = {
+    "turn": None,
+    "route": "route",
+    "step": None,
+    "parse": None,
+    "provider": "provider",
+    "tool": "tool",
+    "mcp": "server"
+}
+
+
+class Span:
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "attributes",
+                 "start_ns", "end_ns", "error", "_token")
+
+    def __init__(self, tracer, name, parent, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self._token = _current.set(self)
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def set(self, **attributes):
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def set_usage(self, usage):
+        """Copy provider token counts (OpenAI or Anthropic naming) onto the span."""
+        for key in ("prompt_tokens", "completion_tokens", "total_tokens", "input_tokens", "output_tokens"):
+            if isinstance((usage or {}).get(key), (int, float)):
+                self.attributes[key] = usage[key]
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error:
+            self.error = str(error)
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Ended from another context (e.g. a worker thread); the parent stays current there
+            pass
+        self.tracer._finish(self)
+
+
+class Tracer:
+    def __init__(self, history=1000):
+        self.history = history
+        self._lock = threading.Lock()
+        self._durations = defaultdict(lambda: deque(maxlen=self.history))
+        self._tokens = defaultdict(int)
+        self._pending = defaultdict(list)
+
+    def start_span(self, name, **attributes):
+        """Start a span as a child of the current one; call .end() when done."""
+        return Span(self, name, _current.get(), attributes)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = self.start_span(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(error=repr(e))
+            raise
+        span.end()
+
+    def _finish(self, span):
+        key_attr = STATS_KEYS.get(span.name)
+        key = span.attributes.get(key_attr, "?") if key_attr else ""
+        with self._lock:
+            self._durations[(span.name, key)].append(span.duration_ms)
+            if span.name == "provider":
+                if "ttft_ms" in span.attributes:
+                    self._durations[("ttft", key)].append(span.attributes["ttft_ms"])
+                self._tokens[key] += span.attributes.get("total_tokens") or (
+                    span.attributes.get("input_tokens", 0) + span.attributes.get("output_tokens", 0))
+            self._pending[span.trace_id].append(span)
+            finished = self._pending.pop(span.trace_id) if span.parent_id is None else None
+        if finished:
+            self._export(finished)
+
+    def _export(self, spans):
+        mode = config.get_trace_export()
+        if mode not in config.TRACE_EXPORT_MODES or mode == "off":
+            return
+        try:
+            config.GOKU_DIR.mkdir(parents=True, exist_ok=True)
+            if mode == "otlp":
+                lines = [json.dumps(_otlp_request(spans))]
+                path = config.TRACE_OTLP_FILE
+            else:
+                lines = [json.dumps(_span_record(s)) for s in spans]
+                path = config.TRACE_FILE
+            with open(path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError:
+            pass
+
+    def summary(self):
+        """Rows of (span name, key, count, p50 ms, p95 ms, tokens) for the session so far."""
+        with self._lock:
+            items = [(name, key, list(values)) for (name, key), values in self._durations.items()]
+            tokens = dict(self._tokens)
+        order = ["turn", "route", "step", "provider", "ttft", "parse", "tool", "mcp"]
+        items.sort(key=lambda item: (order.index(item[0]) if item[0] in order else len(order), item[1]))
+        return [
+            (name, key, len(values), percentile(values, 50), percentile(values, 95),
+             tokens.get(key, 0) if name == "provider" else None)
+            for name, key, values in items if values
+        ]
+
+    def totals(self):
+        """{(span name, key): (count, summed ms)} for the session so far."""
+        with self._lock:
+            return {k: (len(v), sum(v)) for k, v in self._durations.items() if v}
+
+    def clear(self):
+        with self._lock:
+            self._durations.clear()
+            self._tokens.clear()
+
+
+def percentile(values, p):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def _span_record(span):
+    return {
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "name": span.name,
+        "start": span.start_ns / 1e9,
+        "duration_ms": round(span.duration_ms, 3),
+        "attributes": span.attributes,
+        "error": span.error
+    }
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_request(spans):
+    """One ExportTraceServiceRequest in OTLP/JSON, as written by the OpenTelemetry file exporter."""
+    otlp_spans = []
+    for span in spans:
+        item = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+        }
+        if span.parent_id:
+            item["parentSpanId"] = span.parent_id
+        otlp_spans.append(item)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "goku"}}]},
+            "scopeSpans": [{"scope": {"name": "goku"}, "spans": otlp_spans}]
+        }]
+    }
+
+
+# Session-wide tracer used by the engine and the MCP layer
+tracer = Tracer()
+start_span = tracer.start_span
+span = tracer.span
@@ -1,6 +1,5 @@
 from rich.console import Console
 from rich.panel import Panel
-from rich.markdown import Markdown
 from rich.text import Text
 from rich.live import Live
 from rich.status import Status
@@ -18,13 +17,17 @@ def print_help():
     - [cyan]/mode [online|offline][/cyan] : Switch between API and Local modes
     - [cyan]/online[/cyan] / [cyan]/offline[/cyan]      : Shortcuts to switch online/offline
     - [cyan]/provider [name][/cyan]        : List or switch AI providers
+    - [cyan]/probe [refresh][/cyan]         : What the active model supports (native tools, streaming, ...)
     - [cyan]/url <url>[/cyan]           : Set custom API URL for current provider
     - [cyan]/search [provider][/cyan]        : List or switch search providers
     - [cyan]/token [provider] <key>[/cyan] : Save an API token (defaults to current provider)
     - [cyan]/model <name>[/cyan]           : Change the active model for current provider
-    - [cyan]/models[/cyan]                  : List available models for the active provider
+    - [cyan]/models [refresh][/cyan]        : List available models for the active provider (cached)
     - [cyan]/setup[/cyan]                  : Install offline support (llama.cpp)
     - [cyan]/update[/cyan]                 : Update Goku to the latest version
+    - [cyan]/stats[/cyan]                  : Timing percentiles per provider, tool and step
+    - [cyan]/hud [on|off][/cyan]            : Live step/TTFT/tokens-per-second line while thinking
+    - [cyan]/route [on|off][/cyan]          : Send simple turns to the local model (hybrid routing)
     - [cyan]/clear[/cyan]                  : Clear session history
     - [cyan]/retry[/cyan]                  : Retry the last generation
     - [cyan]/exit[/cyan]                   : Quit goku
@@ -41,6 +44,7 @@ def show_error(message):
     console.print(f"[bold red]Error:[/bold red] {message}")
 
 def show_assistant_response(text):
+    from rich.markdown import Markdown  # pulls in markdown_it; not needed until the first answer
     md = Markdown(text)
     console.print(Panel(md, title="Goku", border_style="green"))
 
@@ -112,15 +116,89 @@ from . import config
 from rich.console import Group
 from rich.spinner import Spinner
 from collections import deque
+import time
+
+class Hud:
+    """
+    One-line performance readout under the spinner: step, elapsed time,
+    time-to-first-token, streaming speed and running tools. Fed by engine
+    events; the line is rebuilt at most refresh_per_second times a second.
+    """
+    def __init__(self, refresh_per_second=4):
+        self.min_interval = 1 / refresh_per_second
+        self.started = time.monotonic()
+        self.step = 0
+        self.max_steps = None
+        self.step_started = None
+        self.ttft = None
+        self.latency = None
+        self.tokens = 0
+        self.first_token = None
+        self.last_token = None
+        self.tools = {}
+        self.route = None
+        self._line = None
+        self._rendered_at = 0.0
+
+    def handle(self, event):
+        """Engine on_event callback (token events arrive from a worker thread)."""
+        kind = event["event"]
+        now = time.monotonic()
+        if kind == "step":
+            self.step = event["step"]
+            self.max_steps = event.get("max_steps")
+            self.step_started = now
+            self.tokens = 0
+            self.first_token = None
+        elif kind == "token":
+            if self.first_token is None:
+                self.first_token = now
+                if self.step_started is not None:
+                    self.ttft = now - self.step_started
+            self.tokens += 1
+            self.last_token = now
+        elif kind == "response":
+            self.latency = event["latency_ms"] / 1000
+        elif kind == "tool_call":
+            self.tools[event["id"]] = (event["name"], now)
+        elif kind == "tool_result":
+            self.tools.pop(event["id"], None)
+        elif kind == "route":
+            self.route = event["route"]
+
+    def render_line(self, now):
+        parts = [self.route] if self.route else []
+        if self.step:
+            parts.append(f"step {self.step}/{self.max_steps}" if self.max_steps else f"step {self.step}")
+        parts.append(f"{now - self.started:.1f}s")
+        if self.ttft is not None:
+            parts.append(f"TTFT {self.ttft:.2f}s")
+        elif self.latency is not None:
+            parts.append(f"last call {self.latency:.1f}s")
+        if self.tokens and self.first_token is not None:
+            streamed_for = self.last_token - self.first_token
+            if streamed_for > 0.2:
+                parts.append(f"{(self.tokens - 1) / streamed_for:.0f} tok/s")
+        for name, started in list(self.tools.values()):
+            parts.append(f"🔧 {name} {now - started:.1f}s")
+        return " · ".join(parts)
+
+    def __rich__(self):
+        now = time.monotonic()
+        if self._line is None or now - self._rendered_at >= self.min_interval:
+            self._line = Text(self.render_line(now), style="dim")
+            self._rendered_at = now
+        return self._line
 
 class ThoughtStream:
     """
     Manages a live stream of thought lines that fades/scrolls (rolling window).
-    Uses a Live display to show transient thoughts + spinner.
+    Uses a Live display to show transient thoughts + spinner (+ the optional HUD).
     """
-    def __init__(self, max_height=5):
+    def __init__(self, max_height=5, hud=None):
         self.max_height = max_height
         self.lines = deque(maxlen=max_height)
+        self.hud = hud
         self.live = None
         self.spinner = Spinner("dots", text="[bold green]Thinking...[/bold green]")
     
@@ -167,6 +245,8 @@ class ThoughtStream:
             style = "italic blue" if i == len(self.lines) - 1 else "dim blue"
             text_group.append(f"🧠 {line}\n", style=style)
             
+        if self.hud:
+            return Group(text_group, self.spinner, self.hud)
         return Group(
             text_group,
             self.spinner
@@ -177,7 +257,8 @@ _current_stream = None
 
 def show_loading():
     """Returns a ThoughtStream context manager."""
-    return ThoughtStream(max_height=6)
+    hud = Hud(config.HUD_REFRESH_PER_SECOND) if config.use_hud() else None
+    return ThoughtStream(max_height=6, hud=hud)
 
 def show_thought(status_obj, thought):
     """Update the active ThoughtStream if available."""
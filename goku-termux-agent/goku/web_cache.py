@@ -0,0 +1,207 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# This module is shared by the goku package and the MCP servers (which import it
+# as a top-level module), so it must not import anything from goku itself.
+
+
+class SearchCache:
+    """
+    Persistent cache of web search results keyed by (provider, normalized query, count).
+
+    Entries younger than `ttl` are fresh; entries up to `stale_ttl` past that are
+    still served (so the caller can refresh them in the background); anything
+    older counts as a miss. The table is kept to `max_entries` rows by evicting
+    the least recently used ones.
+    """
+    def __init__(self, path, ttl=6 * 3600, stale_ttl=3 * 86400, max_entries=1000):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            " key TEXT PRIMARY KEY, provider TEXT, query TEXT, count INTEGER,"
+            " results TEXT, created REAL, accessed REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS search_cache_accessed ON search_cache(accessed)")
+
+    @staticmethod
+    def normalize(query):
+        return " ".join(query.lower().split())
+
+    def _key(self, provider, query, count):
+        return f"{provider}\x1f{self.normalize(query)}\x1f{count}"
+
+    def get(self, provider, query, count, allow_expired=False):
+        """
+        Returns (results, is_fresh) or None. With allow_expired, entries past the
+        stale window are returned too (used when the provider is unreachable).
+        """
+        key = self._key(provider, query, count)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT results, created FROM search_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            age = now - row[1]
+            if age > self.ttl + self.stale_ttl and not allow_expired:
+                self.misses += 1
+                return None
+
+            fresh = age <= self.ttl
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+            self._conn.execute("UPDATE search_cache SET accessed = ? WHERE key = ?", (now, key))
+            return json.loads(row[0]), fresh
+
+    def put(self, provider, query, count, results):
+        key = self._key(provider, query, count)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, provider, query, count, results, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, self.normalize(query), count, json.dumps(results), now, now)
+            )
+            # LRU eviction: keep only the most recently used max_entries rows
+            self._conn.execute(
+                "DELETE FROM search_cache WHERE key IN ("
+                " SELECT key FROM search_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM search_cache")
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+            "ttl_seconds": self.ttl,
+            "stale_ttl_seconds": self.stale_ttl,
+            "path": str(self.path)
+        }
+
+
+class PageCache:
+    """
+    Persistent cache of extracted webpage text plus the HTTP validators needed to
+    revalidate it (ETag / Last-Modified). Entries are fresh for the server's
+    max-age (or `default_ttl`); stale ones are returned with their validators so
+    the caller can send a conditional request and keep the text on a 304.
+    """
+    def __init__(self, path, default_ttl=3600, max_entries=300):
+        self.path = Path(path)
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS page_cache ("
+            " url TEXT PRIMARY KEY, text TEXT, etag TEXT, last_modified TEXT,"
+            " fetched REAL, max_age REAL, accessed REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS page_cache_accessed ON page_cache(accessed)")
+
+    def max_age_for(self, cache_control):
+        """Seconds an entry stays fresh given a Cache-Control header; None means don't store."""
+        directives = [d.strip().lower() for d in (cache_control or "").split(",")]
+        if "no-store" in directives:
+            return None
+        if "no-cache" in directives:
+            return 0
+        for d in directives:
+            if d.startswith("max-age="):
+                try:
+                    return max(0, int(d.split("=", 1)[1]))
+                except ValueError:
+                    pass
+        return self.default_ttl
+
+    def get(self, url):
+        """Returns a dict with text, etag, last_modified and fresh, or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, etag, last_modified, fetched, max_age FROM page_cache WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE page_cache SET accessed = ? WHERE url = ?", (now, url))
+        return {
+            "text": row[0],
+            "etag": row[1],
+            "last_modified": row[2],
+            "fresh": now - row[3] < row[4]
+        }
+
+    def put(self, url, text, etag=None, last_modified=None, max_age=None):
+        if max_age is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO page_cache (url, text, etag, last_modified, fetched, max_age, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, text, etag, last_modified, now, max_age, now)
+            )
+            self._conn.execute(
+                "DELETE FROM page_cache WHERE url IN ("
+                " SELECT url FROM page_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def touch(self, url, max_age):
+        """Mark an entry fresh again after a 304 Not Modified."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE page_cache SET fetched = ?, max_age = ? WHERE url = ?",
+                (time.time(), max_age or 0, url)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM page_cache")
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM page_cache").fetchone()[0]
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses
+        }
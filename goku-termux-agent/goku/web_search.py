@@ -0,0 +1,432 @@
+import asyncio
+import importlib.util
+import threading
+import urllib.parse
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+# Importable both as goku.web_search and, from the MCP servers, as a top-level module
+try:
+    from . import config, ratelimit, web_cache
+except ImportError:
+    import config
+    import ratelimit
+    import web_cache
+
+# HTTP/2 is only available when the optional `h2` package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Hosts hit by each search provider, used to prewarm the connection at startup
+SEARCH_HOSTS = {
+    "brave": "https://api.search.brave.com",
+    "google": "https://customsearch.googleapis.com",
+    "bing": "https://api.bing.microsoft.com"
+}
+
+# One keep-alive client for the whole process so DNS/TCP/TLS is paid once per host
+_http_client = None
+
+def get_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            follow_redirects=True,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120.0)
+        )
+    return _http_client
+
+async def prewarm():
+    """Open a connection to the active search provider before the first query."""
+    host = SEARCH_HOSTS.get(config.get_active_search_provider())
+    if not host:
+        return
+    try:
+        await get_client().head(host, timeout=5.0)
+    except Exception:
+        pass
+
+async def _close_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+class SearchError(Exception):
+    """A provider can't serve the query (e.g. missing API key); not worth retrying."""
+
+class RateLimited(Exception):
+    """A provider's quota is exhausted for now; another provider should be tried."""
+    def __init__(self, provider, detail=""):
+        super().__init__(f"{provider} is rate limited" + (f" ({detail})" if detail else ""))
+        self.provider = provider
+
+_buckets = {}
+
+def _get_bucket(provider):
+    if provider not in _buckets:
+        limit = config.get_search_rate_limit(provider)
+        _buckets[provider] = ratelimit.TokenBucket(limit["rate"], limit["burst"])
+    return _buckets[provider]
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+async def _provider_get(provider, url, **kwargs):
+    """
+    GET for a search API: waits for the provider's token bucket, retries 429/5xx
+    and network errors with jittered exponential backoff (honouring Retry-After),
+    and raises RateLimited once the quota can't be met within the retry budget.
+    """
+    bucket = _get_bucket(provider)
+    for attempt in range(config.SEARCH_MAX_RETRIES + 1):
+        if not await bucket.acquire(max_wait=config.SEARCH_MAX_QUEUE_WAIT):
+            raise RateLimited(provider, "local rate limit")
+
+        retry_after = None
+        try:
+            resp = await get_client().get(url, **kwargs)
+        except httpx.TransportError:
+            if attempt == config.SEARCH_MAX_RETRIES:
+                raise
+        else:
+            if resp.status_code not in RETRY_STATUS:
+                resp.raise_for_status()
+                return resp
+            retry_after = ratelimit.parse_retry_after(resp.headers.get("retry-after"))
+            if resp.status_code == 429:
+                bucket.penalize(retry_after or 1.0)
+            if attempt == config.SEARCH_MAX_RETRIES or (retry_after or 0) > config.SEARCH_MAX_RETRY_WAIT:
+                if resp.status_code == 429:
+                    raise RateLimited(provider, f"HTTP 429, retry after {retry_after or '?'}s")
+                resp.raise_for_status()
+
+        await asyncio.sleep(ratelimit.backoff_delay(attempt, cap=config.SEARCH_MAX_RETRY_WAIT, retry_after=retry_after))
+
+async def _search_with_fallback(provider, query, count=5):
+    """
+    Search with the given provider, moving on to the next configured one (ending
+    with duckduckgo) if it is rate limited. Returns (results, note).
+    """
+    order = [provider] + [p for p in config.SEARCH_FALLBACK_ORDER if p != provider]
+    skipped = []
+    for candidate in order:
+        if candidate != provider and candidate not in _configured_providers():
+            continue
+        try:
+            results = await _cached_search(candidate, query, count)
+        except RateLimited as e:
+            skipped.append(str(e))
+            continue
+        note = f"(Served by {candidate}: " + "; ".join(skipped) + ")" if skipped else ""
+        return results, note
+    raise SearchError("All search providers are rate limited right now (" + "; ".join(skipped) + "). Try again later.")
+
+def _format_results(results):
+    if not results:
+        return "No results found."
+    formatted = []
+    for r in results:
+        formatted.append(f"Title: {r['title']}\nLink: {r['url']}\nSnippet: {r['snippet']}\n---")
+    return "\n".join(formatted)
+
+_search_cache = None
+_revalidating = set()
+
+def get_search_cache():
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = web_cache.SearchCache(
+            config.SEARCH_CACHE_PATH,
+            ttl=config.SEARCH_CACHE_TTL,
+            stale_ttl=config.SEARCH_CACHE_STALE_TTL,
+            max_entries=config.SEARCH_CACHE_MAX_ENTRIES
+        )
+    return _search_cache
+
+async def _cached_search(provider, query, count=5):
+    """Serve from the cache when possible; stale hits are refreshed in the background."""
+    cache = get_search_cache()
+    cached = cache.get(provider, query, count)
+    if cached:
+        results, fresh = cached
+        if not fresh:
+            _schedule_revalidate(provider, query, count)
+        return results
+
+    try:
+        results = await SEARCH_FUNCS[provider](query, count)
+    except SearchError:
+        raise
+    except Exception:
+        # Offline or provider down: an expired answer beats none
+        cached = cache.get(provider, query, count, allow_expired=True)
+        if cached:
+            return cached[0]
+        raise
+
+    if results:
+        cache.put(provider, query, count, results)
+    return results
+
+def _schedule_revalidate(provider, query, count):
+    key = (provider, web_cache.SearchCache.normalize(query), count)
+    if key in _revalidating:
+        return
+
+    async def refresh():
+        try:
+            results = await SEARCH_FUNCS[provider](query, count)
+            if results:
+                get_search_cache().put(provider, query, count, results)
+        except Exception:
+            pass
+        finally:
+            _revalidating.discard(key)
+
+    _revalidating.add(key)
+    asyncio.create_task(refresh())
+
+def _configured_providers():
+    return [p for p in SEARCH_FUNCS if p == "duckduckgo" or config.get_search_token(p)]
+
+async def _search_fanout(query, count=5):
+    """
+    Query every configured provider at once and merge their rankings. Returns as
+    soon as SEARCH_FANOUT_MIN_PROVIDERS have answered (or the deadline passes)
+    and cancels the rest, so one slow or rate-limited provider can't stall the step.
+    """
+    loop = asyncio.get_running_loop()
+    providers = _configured_providers()
+    tasks = {asyncio.create_task(_cached_search(p, query, count)): p for p in providers}
+    needed = min(config.SEARCH_FANOUT_MIN_PROVIDERS, len(providers))
+    deadline = loop.time() + config.SEARCH_FANOUT_DEADLINE
+
+    rankings = {}
+    errors = []
+    pending = set(tasks)
+    try:
+        while pending and len(rankings) < needed:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(f"{tasks[task]}: {task.exception()}")
+                elif task.result():
+                    rankings[tasks[task]] = task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if not rankings and errors:
+        raise SearchError("All search providers failed (" + "; ".join(errors) + ")")
+    return _fuse_rankings(rankings, count)
+
+# Dropped by exact name; utm_* by prefix
+_TRACKING_PARAMS = {"gclid", "fbclid", "ref", "ref_src", "mc_cid", "mc_eid"}
+
+def _canonical_url(url):
+    """Normalize a URL so the same page from different providers dedups."""
+    parts = urllib.parse.urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = [
+        (k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in _TRACKING_PARAMS and not k.lower().startswith("utm_")
+    ]
+    path = parts.path.rstrip("/") or "/"
+    return urllib.parse.urlunsplit(("", host, path, urllib.parse.urlencode(sorted(query)), ""))
+
+def _fuse_rankings(rankings, count, k=60):
+    """Reciprocal rank fusion over each provider's ranked list, deduplicated by canonical URL."""
+    scores = {}
+    merged = {}
+    for results in rankings.values():
+        for rank, item in enumerate(results, 1):
+            key = _canonical_url(item["url"])
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            best = merged.get(key)
+            # Keep the entry with the most informative snippet
+            if best is None or len(item.get("snippet", "")) > len(best.get("snippet", "")):
+                merged[key] = item
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [merged[key] for key in ordered[:count]]
+
+async def _search_brave(query, count=5):
+    api_key = config.get_search_token("brave")
+    if not api_key:
+        raise SearchError("Brave Search API key not configured. Use `/token brave <key>`.")
+
+    url = "https://api.search.brave.com/res/v1/web/search"
+    headers = {"X-Subscription-Token": api_key, "Accept": "application/json"}
+    params = {"q": query, "count": count}
+
+    resp = await _provider_get("brave", url, headers=headers, params=params)
+    data = resp.json()
+
+    results = []
+    for item in data.get("web", {}).get("results", []):
+        results.append({
+            "title": item.get("title", "No Title"),
+            "url": item.get("url", ""),
+            "snippet": item.get("description", "")
+        })
+    return results
+
+async def _search_google(query, count=5):
+    api_key = config.get_search_token("google")
+    if not api_key:
+        raise SearchError("Google API key not configured. Use `/token google <KEY>`.")
+    
+    cx = None
+    if ":" in api_key:
+        parts = api_key.split(":")
+        api_key = parts[0]
+        cx = parts[1]
+    
+    if not cx:
+        raise SearchError("Google Search requires a Context ID (CX). Please set token as `API_KEY:CX_ID`.")
+
+    url = "https://customsearch.googleapis.com/customsearch/v1"
+    params = {"key": api_key, "cx": cx, "q": query, "num": count}
+
+    resp = await _provider_get("google", url, params=params)
+    data = resp.json()
+
+    results = []
+    for item in data.get("items", []):
+        results.append({
+            "title": item.get("title", "No Title"),
+            "url": item.get("link", ""),
+            "snippet": item.get("snippet", "")
+        })
+    return results
+
+async def _search_bing(query, count=5):
+    api_key = config.get_search_token("bing")
+    if not api_key:
+        raise SearchError("Bing API key not configured. Use `/token bing <key>`.")
+        
+    url = "https://api.bing.microsoft.com/v7.0/search"
+    headers = {"Ocp-Apim-Subscription-Key": api_key}
+    params = {"q": query, "count": count}
+
+    resp = await _provider_get("bing", url, headers=headers, params=params)
+    data = resp.json()
+
+    results = []
+    for item in data.get("webPages", {}).get("value", []):
+        results.append({
+            "title": item.get("name", "No Title"),
+            "url": item.get("url", ""),
+            "snippet": item.get("snippet", "")
+        })
+    return results
+
+class DDGWorker:
+    """
+    Long-lived DuckDuckGo client. Queries run on a small dedicated thread pool
+    and each thread keeps its own DDGS session (and HTTP connection), instead of
+    building a new one per query; callers beyond the pool size wait their turn.
+    """
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="goku-ddg")
+        self._local = threading.local()
+        self._slots = None
+
+    def _session(self):
+        ddgs = getattr(self._local, "ddgs", None)
+        if ddgs is None:
+            from duckduckgo_search import DDGS
+            ddgs = self._local.ddgs = DDGS()
+        return ddgs
+
+    def _run(self, query, count):
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=RuntimeWarning)
+            try:
+                items = list(self._session().text(query, max_results=count))
+            except Exception:
+                # Start over with a fresh session next time
+                self._local.ddgs = None
+                raise
+        return [{"title": r["title"], "url": r["href"], "snippet": r["body"]} for r in items]
+
+    async def search(self, query, count=5):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._run, query, count)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+_ddg_worker = None
+
+async def _search_ddg(query, count=5):
+    global _ddg_worker
+    if _ddg_worker is None:
+        _ddg_worker = DDGWorker(config.DDG_WORKERS)
+
+    if not await _get_bucket("duckduckgo").acquire(max_wait=config.SEARCH_MAX_QUEUE_WAIT):
+        raise RateLimited("duckduckgo", "local rate limit")
+    try:
+        return await _ddg_worker.search(query, count)
+    except Exception as e:
+        if "ratelimit" in type(e).__name__.lower():
+            _get_bucket("duckduckgo").penalize(config.SEARCH_MAX_RETRY_WAIT)
+            raise RateLimited("duckduckgo", str(e))
+        raise
+
+SEARCH_FUNCS = {
+    "brave": _search_brave,
+    "google": _search_google,
+    "bing": _search_bing,
+    "duckduckgo": _search_ddg
+}
+
+async def search_text(query, count=5):
+    """
+    Search with the configured provider (or every provider in fanout mode) and
+    return the formatted results. Used by both the native search_web tool and
+    the internet MCP server.
+    """
+    try:
+        if config.get_search_mode() == "fanout":
+            return _format_results(await _search_fanout(query, count))
+
+        # Use active provider
+        active_provider = config.get_active_search_provider()
+        if active_provider not in SEARCH_FUNCS:
+            return f"Error: Unknown search provider '{active_provider}'"
+
+        results, note = await _search_with_fallback(active_provider, query, count)
+        text = _format_results(results)
+        return f"{note}\n{text}" if note else text
+    except SearchError as e:
+        return f"Error: {e}"
+    except Exception as e:
+        return f"Search error: {e}"
+
+def search_sync(query, count=5):
+    """Blocking search_text for callers without an event loop."""
+    async def run():
+        try:
+            return await search_text(query, count)
+        finally:
+            await close()
+    return asyncio.run(run())
+
+async def close():
+    """Release the HTTP client and the DuckDuckGo worker."""
+    global _ddg_worker
+    await _close_client()
+    if _ddg_worker is not None:
+        _ddg_worker.close()
+        _ddg_worker = None
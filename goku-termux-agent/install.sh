@@ -36,14 +36,14 @@ if [ -n "$PREFIX" ]; then
     pkg install -y python-requests python-rich rust binutils clang make 2>/dev/null
     
     # Install core dependencies first
-    python3 -m pip install requests rich duckduckgo-search prompt_toolkit langchain langchain-community --break-system-packages
+    python3 -m pip install requests httpx rich duckduckgo-search prompt_toolkit langchain langchain-community --break-system-packages
     
     # Try mcp separately as it often fails to build on Termux
     echo "Attempting to install MCP (optional)..."
     python3 -m pip install mcp --break-system-packages 2>/dev/null || echo "⚠️  MCP installation skipped (build issue). Goku will use native tools."
 else
     # Standard Linux
-    python3 -m pip install requests rich duckduckgo-search prompt_toolkit langchain langchain-community --break-system-packages 2>/dev/null || python3 -m pip install requests rich duckduckgo-search prompt_toolkit langchain langchain-community
+    python3 -m pip install requests httpx rich duckduckgo-search prompt_toolkit langchain langchain-community --break-system-packages 2>/dev/null || python3 -m pip install requests httpx rich duckduckgo-search prompt_toolkit langchain langchain-community
     python3 -m pip install mcp --break-system-packages 2>/dev/null || python3 -m pip install mcp 2>/dev/null
 fi
 